@@ -0,0 +1,114 @@
+import re
+import sqlite3
+import threading
+import time
+
+# Measured values in alert messages (usage percentages, free MB, round-trip ms, days
+# remaining...) change between runs without the alert itself changing, so they are
+# masked in the alert key. Other numbers, such as IP addresses, mount points and
+# status codes, tell alerts apart and are kept.
+_MEASUREMENT = re.compile(r'(?<![\w.])\d+(?:\.\d+)?(?=\s?(?:%|ms\b|MB\b|GB\b|days?\b))')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    key TEXT PRIMARY KEY,
+    section TEXT NOT NULL,
+    message TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    resolved_at REAL,
+    pending TEXT,
+    pending_since REAL
+);
+CREATE INDEX IF NOT EXISTS alerts_section ON alerts (section);
+"""
+
+def alert_key(section, message):
+    """Returns the identity of an alert: its section and its message with measured values masked."""
+    return f"{section}|{_MEASUREMENT.sub('#', message)}"
+
+class AlertStore:
+    """Persistent alert state backed by SQLite.
+
+    Tracks when every alert was first seen, last seen and resolved. Only state
+    transitions (an alert starting or resolving) are queued as pending
+    notifications; an alert that is still firing on later runs is not.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def record(self, results, now=None):
+        """Updates state from a dict of section -> alerts for the sections that just ran."""
+        now = now or time.time()
+        with self._lock, self._db:
+            for section, alerts in results.items():
+                current = {alert_key(section, message): message for message in alerts}
+                rows = self._db.execute(
+                    "SELECT key, pending, resolved_at FROM alerts WHERE section = ? AND (resolved_at IS NULL OR pending = 'resolved')",
+                    (section,)
+                ).fetchall()
+                active = {row['key']: row for row in rows if row['resolved_at'] is None}
+                unsent_resolved = {row['key'] for row in rows if row['resolved_at'] is not None}
+                for key, message in current.items():
+                    if key in active:
+                        self._db.execute("UPDATE alerts SET last_seen = ?, message = ? WHERE key = ?", (now, message, key))
+                    elif key in unsent_resolved:
+                        # Came back before its resolution was sent: it never really went away
+                        self._db.execute(
+                            "UPDATE alerts SET last_seen = ?, message = ?, resolved_at = NULL, pending = NULL, pending_since = NULL WHERE key = ?",
+                            (now, message, key)
+                        )
+                    else:
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO alerts (key, section, message, first_seen, last_seen, resolved_at, pending, pending_since) "
+                            "VALUES (?, ?, ?, ?, ?, NULL, 'new', ?)",
+                            (key, section, message, now, now, now)
+                        )
+                for key, row in active.items():
+                    if key not in current:
+                        self._resolve(key, row['pending'], now)
+
+    def retire(self, sections, now=None):
+        """Resolves the active alerts of sections not in `sections`, e.g. ones removed from the config."""
+        now = now or time.time()
+        sections = set(sections)
+        with self._lock, self._db:
+            rows = self._db.execute("SELECT key, section, pending FROM alerts WHERE resolved_at IS NULL").fetchall()
+            for row in rows:
+                if row['section'] not in sections:
+                    self._resolve(row['key'], row['pending'], now)
+
+    def _resolve(self, key, pending, now):
+        if pending == 'new':
+            # Started and stopped before anyone was told: nothing to report
+            self._db.execute("UPDATE alerts SET resolved_at = ?, pending = NULL, pending_since = NULL WHERE key = ?", (now, key))
+        else:
+            self._db.execute("UPDATE alerts SET resolved_at = ?, pending = 'resolved', pending_since = ? WHERE key = ?", (now, now, key))
+
+    def oldest_pending(self):
+        """Returns when the oldest unsent notification was queued, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT MIN(pending_since) FROM alerts WHERE pending IS NOT NULL").fetchone()
+        return row[0]
+
+    def pending(self):
+        """Returns (new_alerts, resolved_alerts, active_count) for the next notification."""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM alerts WHERE pending IS NOT NULL ORDER BY section, first_seen").fetchall()
+            active_count = self._db.execute("SELECT COUNT(*) FROM alerts WHERE resolved_at IS NULL").fetchone()[0]
+        new = [dict(row) for row in rows if row['pending'] == 'new']
+        resolved = [dict(row) for row in rows if row['pending'] == 'resolved']
+        return new, resolved, active_count
+
+    def mark_notified(self, keys):
+        """Clears the pending flag of alerts that were included in a sent notification."""
+        with self._lock, self._db:
+            self._db.executemany("UPDATE alerts SET pending = NULL, pending_since = NULL WHERE key = ?", [(key,) for key in keys])
+
+    def close(self):
+        with self._lock:
+            self._db.close()
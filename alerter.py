@@ -1,18 +1,91 @@
 import logging
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 
+class SmtpSender:
+    """Keeps one SMTP connection open and reuses it for every email.
+
+    The connection is checked with NOOP before each send and re-established
+    (including STARTTLS and login) only if the server has dropped it.
+    """
+    def __init__(self, server, port, use_tls, user, password):
+        self.server = server
+        self.port = port
+        self.use_tls = use_tls
+        self.user = user
+        self.password = password
+        self._smtp = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.server, self.port)
+        if self.use_tls:
+            smtp.starttls()
+        if self.user:
+            smtp.login(self.user, self.password)
+        return smtp
+
+    def _is_alive(self):
+        try:
+            return self._smtp.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def send(self, from_address, to_addresses, message):
+        with self._lock:
+            if self._smtp is None or not self._is_alive():
+                self.close()
+                self._smtp = self._connect()
+            try:
+                self._smtp.sendmail(from_address, to_addresses, message)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # Dropped between NOOP and send: reconnect once
+                self._smtp = self._connect()
+                self._smtp.sendmail(from_address, to_addresses, message)
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+_senders = {}
+_senders_lock = threading.Lock()
+
+def _get_sender(config):
+    """Returns the pooled SMTP sender for the [Email] settings in `config`."""
+    settings = (
+        config.get('Email', 'server'),
+        config.getint('Email', 'port'),
+        config.getboolean('Email', 'use_tls'),
+        config.get('Email', 'user'),
+        config.get('Email', 'password'),
+    )
+    with _senders_lock:
+        if settings not in _senders:
+            _senders[settings] = SmtpSender(*settings)
+        return _senders[settings]
+
+def close_senders():
+    """Closes all pooled SMTP connections."""
+    with _senders_lock:
+        for sender in _senders.values():
+            sender.close()
+        _senders.clear()
+
 def send_alert_email(subject, body, config):
     """Sends an email alert using SMTP settings from the config."""
     if not config.getboolean('Email', 'enabled'):
         logging.info("Email alerting is disabled in config.ini. Skipping.")
-        return
+        return False
     logging.info("Sending email alert...")
     try:
-        smtp_server = config.get('Email', 'server')
-        smtp_port = config.getint('Email', 'port')
-        smtp_user = config.get('Email', 'user')
-        smtp_password = config.get('Email', 'password')
         smtp_from = config.get('Email', 'from_address')
         smtp_to = [addr.strip() for addr in config.get('Email', 'to_addresses').split(',')]
 
@@ -21,12 +94,59 @@ def send_alert_email(subject, body, config):
         msg["From"] = smtp_from
         msg["To"] = ", ".join(smtp_to)
 
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            if config.getboolean('Email', 'use_tls'):
-                server.starttls()
-            if smtp_user:
-                server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_from, smtp_to, msg.as_string())
+        _get_sender(config).send(smtp_from, smtp_to, msg.as_string())
         logging.info("Email sent successfully.")
+        return True
     except Exception as e:
         logging.error(f"Failed to send email: {e}")
+        return False
+
+def _format_duration(seconds):
+    minutes = int(seconds // 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"
+
+def format_digest(new, resolved, active_count):
+    """Builds the subject and body of a digest of alert state changes."""
+    subject = f"ArgusSight Monitoring Alert: {len(new)} new, {len(resolved)} resolved"
+    lines = []
+    if new:
+        lines.append(f"New alerts ({len(new)}):")
+        lines.extend(f"  - {alert['message']}" for alert in new)
+        lines.append("")
+    if resolved:
+        lines.append(f"Resolved ({len(resolved)}):")
+        lines.extend(
+            f"  - {alert['message']} (lasted {_format_duration(alert['resolved_at'] - alert['first_seen'])})"
+            for alert in resolved
+        )
+        lines.append("")
+    lines.append(f"Alerts still active: {active_count}")
+    return subject, "\n".join(lines)
+
+def send_digest(store, config, digest_seconds=0, verbose=False, now=None):
+    """Sends one email for all pending alert state changes once the digest window has passed.
+
+    Returns True if a digest was sent. Pending changes stay queued if the
+    window hasn't elapsed yet or sending fails.
+    """
+    oldest = store.oldest_pending()
+    if oldest is None or (now or time.time()) - oldest < digest_seconds:
+        return False
+    new, resolved, active_count = store.pending()
+    subject, body = format_digest(new, resolved, active_count)
+    if verbose:
+        logging.info(f"\n--- Preparing Alert ---\nSubject: {subject}\nBody:\n{body}")
+    if not config.getboolean('Email', 'enabled'):
+        logging.info("Email alerting is disabled in config.ini. Skipping.")
+        store.mark_notified([alert['key'] for alert in new + resolved])
+        return False
+    if send_alert_email(subject, body, config):
+        store.mark_notified([alert['key'] for alert in new + resolved])
+        return True
+    return False
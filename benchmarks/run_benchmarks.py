@@ -0,0 +1,220 @@
+"""Scaling benchmark for a full Argus run against local stand-in services.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks --sizes 10,100,1000,10000
+
+Each size runs in a fresh process so peak RSS is measured per size. The
+results are written as JSON (by default to benchmarks/results/<version>.json)
+so that runs from different versions can be compared.
+"""
+import argparse
+import configparser
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_MIX = 'url=0.5,ssl=0.3,sql=0.1,vm=0.1'
+SOCKET_SAMPLE_SECONDS = 0.05
+
+def parse_mix(value):
+    """Parses 'url=0.5,ssl=0.3,sql=0.1,vm=0.1' into a dict of type -> share."""
+    mix = {}
+    for part in value.split(','):
+        monitor_type, share = part.split('=')
+        mix[monitor_type.strip().upper()] = float(share)
+    total = sum(mix.values())
+    return {monitor_type: share / total for monitor_type, share in mix.items()}
+
+def split_counts(size, mix):
+    """Splits `size` monitors across types according to `mix`, preserving the total."""
+    counts = {monitor_type: int(size * share) for monitor_type, share in mix.items()}
+    largest = max(mix, key=mix.get)
+    counts[largest] += size - sum(counts.values())
+    return counts
+
+def build_config(size, mix, ports, max_concurrency):
+    """Builds an in-memory config with `size` monitor sections pointing at the stand-ins."""
+    config = configparser.ConfigParser()
+    config.read_dict({
+        'General': {'verbose': 'false'},
+        'Engine': {'max_concurrency': str(max_concurrency)},
+        # Every URL stand-in shares one host, so let the pool hold a connection per worker
+        'HTTP': {'pool_connections': '10', 'pool_maxsize': str(max_concurrency)},
+        'Azure': {'subscription_id': '00000000-0000-0000-0000-000000000000', 'location': 'benchregion',
+                  'workspace_id': '11111111-1111-1111-1111-111111111111'},
+        'Email': {
+            'enabled': 'true', 'server': '127.0.0.1', 'port': str(ports['smtp']), 'use_tls': 'false',
+            'user': '', 'password': '', 'from_address': 'argus@localhost', 'to_addresses': 'ops@localhost',
+        },
+        'SSL': {'cache_enabled': 'false'},
+    })
+    counts = split_counts(size, mix)
+    for i in range(counts.get('URL', 0)):
+        config[f'Monitors.URL.Bench{i}'] = {'url': f"http://127.0.0.1:{ports['http']}/", 'check_string': 'OK', 'timeout': '10'}
+    for i in range(counts.get('SSL', 0)):
+        # The stand-in only listens on IPv4, and localhost may also resolve to ::1
+        config[f'Monitors.SSL.Bench{i}'] = {'host': '127.0.0.1', 'port': str(ports['tls']), 'sni': 'localhost'}
+    for i in range(counts.get('SQL', 0)):
+        config[f'Monitors.SQL.benchmi{i}'] = {'resource_group': 'bench-rg'}
+    for i in range(counts.get('VM', 0)):
+        config[f'Monitors.VM.Bench{i}'] = {'resource_group': 'bench-rg', 'vm_name': f'benchvm{i}', 'disk_threshold_mb': '5120'}
+    return config
+
+def count_open_sockets():
+    """Returns the number of sockets this process holds, or None if it can't be determined."""
+    fd_dir = '/proc/self/fd'
+    if not os.path.isdir(fd_dir):
+        return None
+    count = 0
+    for fd in os.listdir(fd_dir):
+        try:
+            if os.readlink(os.path.join(fd_dir, fd)).startswith('socket:'):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def use_standin_azure(azure_url, cert_path):
+    """Points every Azure SDK client Argus creates at the stand-in endpoint."""
+    import clients
+    from azure.monitor.query import LogsQueryClient, MetricsClient, MetricsQueryClient
+    from azure.mgmt.compute import ComputeManagementClient
+    clients.override_factory('metrics_query', lambda credential: MetricsQueryClient(credential, endpoint=azure_url, connection_verify=cert_path))
+    clients.override_factory('metrics', lambda credential, location: MetricsClient(azure_url, credential, connection_verify=cert_path))
+    clients.override_factory('logs_query', lambda credential: LogsQueryClient(credential, endpoint=f"{azure_url}/v1", connection_verify=cert_path))
+    clients.override_factory('compute', lambda credential, subscription_id: ComputeManagementClient(credential, subscription_id, base_url=azure_url, connection_verify=cert_path))
+
+class StandInCredential:
+    """Token credential that never talks to Entra ID."""
+    def get_token(self, *scopes, **kwargs):
+        from azure.core.credentials import AccessToken
+        return AccessToken("benchmark-token", int(time.time()) + 3600)
+
+def measure_run(size, mix, ports, cert_path, max_concurrency, results):
+    """Runs one full check cycle with `size` monitors and reports its measurements."""
+    os.environ['SSL_CERT_FILE'] = cert_path
+    os.environ['REQUESTS_CA_BUNDLE'] = cert_path
+    import alerter
+    import config_manager
+    import config_model
+    import main
+    import resilience
+    from credentials import CredentialProvider
+    from engine import CheckEngine
+    from monitors.base import MonitorContext
+
+    use_standin_azure(f"https://127.0.0.1:{ports['azure']}", cert_path)
+    # Per-check alert logging and pool-overflow warnings would drown the report
+    logging.getLogger().setLevel(logging.CRITICAL)
+    peak_sockets = [count_open_sockets()]
+    done = threading.Event()
+
+    def sample_sockets():
+        while not done.wait(SOCKET_SAMPLE_SECONDS):
+            peak_sockets[0] = max(peak_sockets[0] or 0, count_open_sockets() or 0)
+
+    sampler = threading.Thread(target=sample_sockets, daemon=True)
+    sampler.start()
+
+    start = time.perf_counter()
+    config = build_config(size, mix, ports, max_concurrency)
+    # Every stand-in target is 127.0.0.1, so a per-host rate limit would only measure itself
+    resilience.configure(**dict(config_manager.get_resilience_settings(config), host_rate=0))
+    credentials = CredentialProvider(StandInCredential())
+    specs, _ = config_model.compile_monitors(config)
+    types = main.monitor_types(config, specs)
+    main.configure_types(config, types, set())
+    context = MonitorContext(credentials)
+    monitors = main.build_monitors(specs, context)
+    engine = CheckEngine(max_concurrency=max_concurrency, prefetchers=main.create_prefetchers(types, context))
+    check_results = engine.run(monitors)
+    all_alerts = [alert for alerts in check_results.values() for alert in alerts]
+    if all_alerts:
+        alerter.send_alert_email("ArgusSight Benchmark Alert", "\n".join(all_alerts), config)
+    wall_seconds = time.perf_counter() - start
+
+    done.set()
+    sampler.join()
+    results.put({
+        'monitors': size,
+        'wall_seconds': round(wall_seconds, 3),
+        'checks_per_second': round(len(check_results) / wall_seconds, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+        'peak_open_sockets': peak_sockets[0],
+        'alerts': len(all_alerts),
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a full Argus run against local stand-in services.")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="Comma-separated monitor counts.")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Share of each monitor type.")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Latency added by the HTTP and Azure stand-ins.")
+    parser.add_argument('--error-rate', type=float, default=0.05, help="Share of HTTP requests answered with 503.")
+    parser.add_argument('--max-concurrency', type=int, default=64, help="Engine concurrency limit.")
+    parser.add_argument('--output', help="Where to write the JSON results.")
+    args = parser.parse_args()
+
+    from version import __version__
+    sizes = [int(size) for size in args.sizes.split(',')]
+    mix = parse_mix(args.mix)
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', f'{__version__}.json')
+
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        from benchmarks.standins import start_standins
+        standins = start_standins(tmp_dir, latency=args.latency_ms / 1000, error_rate=args.error_rate)
+        try:
+            print(f"{'monitors':>9} {'wall s':>8} {'checks/s':>9} {'rss MB':>8} {'sockets':>8} {'alerts':>7}")
+            for size in sizes:
+                results = context.Queue()
+                process = context.Process(target=measure_run, args=(size, mix, standins.ports, standins.cert_path, args.max_concurrency, results))
+                process.start()
+                row = results.get()
+                process.join()
+                rows.append(row)
+                print(f"{row['monitors']:>9} {row['wall_seconds']:>8} {row['checks_per_second']:>9} "
+                      f"{row['peak_rss_mb']!s:>8} {row['peak_open_sockets']!s:>8} {row['alerts']:>7}")
+            emails_received = standins.messages.value
+        finally:
+            standins.stop()
+
+    report = {
+        'version': __version__,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'mix': mix,
+            'latency_ms': args.latency_ms,
+            'error_rate': args.error_rate,
+            'max_concurrency': args.max_concurrency,
+        },
+        'emails_received': emails_received,
+        'results': rows,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Local stand-ins for the services Argus talks to, used by the benchmarks.
+
+- HTTP server with configurable latency and error rate (UrlMonitor)
+- TLS listener with a self-signed certificate (SSLMonitor)
+- SMTP sink that accepts and counts messages (alerter.send_alert_email)
+- HTTPS server answering the Azure Monitor metrics, batch metrics, Log
+  Analytics query and Compute instance view APIs (SqlMonitor, VmMonitor,
+  guest_metrics)
+
+All of them run in one background process started by `start_standins`.
+"""
+import asyncio
+import datetime
+import ipaddress
+import json
+import multiprocessing
+import os
+import random
+import re
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+HTTP_BODY = b"<html><body>ArgusSight benchmark page: OK</body></html>"
+
+def generate_self_signed_cert(directory):
+    """Writes a self-signed certificate for localhost/127.0.0.1 and returns (cert_path, key_path)."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"),
+            x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "standin-cert.pem")
+    key_path = os.path.join(directory, "standin-key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return cert_path, key_path
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self._send(503, b"Service Unavailable")
+        else:
+            self._send(200, HTTP_BODY)
+
+def _metric(resource_id, name, value):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        "id": f"{resource_id}/providers/Microsoft.Insights/metrics/{name}",
+        "type": "Microsoft.Insights/metrics",
+        "name": {"value": name, "localizedValue": name},
+        "unit": "Count",
+        "timeseries": [{
+            "metadatavalues": [],
+            "data": [
+                {"timeStamp": (now - datetime.timedelta(minutes=5 * i)).strftime("%Y-%m-%dT%H:%M:%SZ"), "average": value}
+                for i in range(2, -1, -1)
+            ],
+        }],
+    }
+
+# Values chosen so that no threshold is crossed
+METRIC_VALUES = {
+    "Percentage CPU": 12.5,
+    "Available Memory Bytes": 8 * 1024 ** 3,
+    "avg_cpu_percent": 20.0,
+    "storage_space_used_mb": 1024.0,
+    "reserved_storage_mb": 32768.0,
+}
+
+def _metrics_body(resource_id, metric_names):
+    return [_metric(resource_id, name, METRIC_VALUES.get(name, 1.0)) for name in metric_names]
+
+# Guest counters per VM as (namespace, name, mount, value), also below every threshold
+GUEST_COUNTERS = [
+    ("LogicalDisk", "FreeSpaceMB", "/", 20480.0),
+    ("LogicalDisk", "FreeSpaceMB", "/mnt", 51200.0),
+    ("Memory", "AvailableMB", "", 8192.0),
+]
+
+def _logs_body(query):
+    """Answers the guest metrics query with one row per counter of every VM in its `_ResourceId in~` filter."""
+    match = re.search(r"_ResourceId in~ \(([^)]*)\)", query)
+    resource_ids = re.findall(r"'([^']*)'", match.group(1)) if match else []
+    columns = [{"name": name, "type": kind} for name, kind in
+               [("ResourceId", "string"), ("Namespace", "string"), ("Name", "string"), ("Mount", "string"), ("Val", "real")]]
+    rows = [[resource_id, *counter] for resource_id in resource_ids for counter in GUEST_COUNTERS]
+    return {"tables": [{"name": "PrimaryResult", "columns": columns, "rows": rows}]}
+
+class _AzureHandler(_HttpHandler):
+    """Answers the subset of ARM and Azure Monitor APIs that Argus calls."""
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path.endswith("/providers/Microsoft.Insights/metrics"):
+            resource_id = parts.path[: -len("/providers/Microsoft.Insights/metrics")]
+            names = query.get("metricnames", [""])[0].split(",")
+            body = {"timespan": query.get("timespan", [""])[0], "interval": "PT5M", "value": _metrics_body(resource_id, names)}
+        elif parts.path.endswith("/instanceView"):
+            body = {"statuses": [
+                {"code": "ProvisioningState/succeeded", "displayStatus": "Provisioning succeeded"},
+                {"code": "PowerState/running", "displayStatus": "VM running"},
+            ]}
+        else:
+            self._send(404, b"{}", "application/json")
+            return
+        self._send(200, json.dumps(body).encode(), "application/json")
+
+    def do_POST(self):
+        if self.latency:
+            time.sleep(self.latency)
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if re.search(r"/workspaces/[^/]+/query$", urlsplit(self.path).path):
+            self._send(200, json.dumps(_logs_body(request.get("query", ""))).encode(), "application/json")
+            return
+        names = parse_qs(urlsplit(self.path).query).get("metricnames", [""])[0].split(",")
+        values = [
+            {"starttime": "", "endtime": "", "interval": "PT5M", "resourceid": rid, "value": _metrics_body(rid, names)}
+            for rid in request.get("resourceids", [])
+        ]
+        self._send(200, json.dumps({"values": values}).encode(), "application/json")
+
+class _SmtpSink(asyncio.Protocol):
+    """Minimal SMTP server that accepts every message and counts it."""
+    messages = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.buffer = b""
+        self.in_data = False
+        transport.write(b"220 localhost ArgusSight SMTP sink\r\n")
+
+    def data_received(self, data):
+        self.buffer += data
+        while True:
+            if self.in_data:
+                end = self.buffer.find(b"\r\n.\r\n")
+                if end < 0:
+                    return
+                self.buffer = self.buffer[end + 5:]
+                self.in_data = False
+                self.messages.value += 1
+                self.transport.write(b"250 OK: queued\r\n")
+                continue
+            line_end = self.buffer.find(b"\r\n")
+            if line_end < 0:
+                return
+            line, self.buffer = self.buffer[:line_end], self.buffer[line_end + 2:]
+            command = line[:4].upper()
+            if command == b"EHLO":
+                self.transport.write(b"250-localhost\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif command == b"DATA":
+                self.in_data = True
+                self.transport.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command == b"AUTH":
+                self.transport.write(b"235 Authentication successful\r\n")
+            elif command == b"QUIT":
+                self.transport.write(b"221 Bye\r\n")
+                self.transport.close()
+                return
+            else:
+                self.transport.write(b"250 OK\r\n")
+
+async def _close_after_handshake(reader, writer):
+    writer.close()
+
+def _run_standins(settings, ports, messages):
+    _HttpHandler.latency = _AzureHandler.latency = settings["latency"]
+    _HttpHandler.error_rate = settings["error_rate"]
+    _SmtpSink.messages = messages
+
+    http_server = _QuietServer(("127.0.0.1", 0), _HttpHandler)
+    azure_server = _QuietServer(("127.0.0.1", 0), _AzureHandler)
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(settings["cert_path"], settings["key_path"])
+    # Handshakes happen on first read, in the handler thread, instead of in accept()
+    azure_server.socket = server_context.wrap_socket(azure_server.socket, server_side=True, do_handshake_on_connect=False)
+    for server in (http_server, azure_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    async def serve():
+        tls_server = await asyncio.start_server(_close_after_handshake, "127.0.0.1", 0, ssl=server_context, backlog=1024)
+        smtp_server = await asyncio.get_running_loop().create_server(_SmtpSink, "127.0.0.1", 0)
+        ports.put({
+            "http": http_server.server_address[1],
+            "azure": azure_server.server_address[1],
+            "tls": tls_server.sockets[0].getsockname()[1],
+            "smtp": smtp_server.sockets[0].getsockname()[1],
+        })
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+class StandIns:
+    """Handle to the stand-in process: ports, sent-mail counter and shutdown."""
+    def __init__(self, process, ports, messages, cert_path):
+        self.process = process
+        self.ports = ports
+        self.messages = messages
+        self.cert_path = cert_path
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+def start_standins(directory, latency=0.0, error_rate=0.0):
+    """Starts all stand-ins in a background process and returns a `StandIns` handle."""
+    cert_path, key_path = generate_self_signed_cert(directory)
+    ports = multiprocessing.Queue()
+    messages = multiprocessing.Value('i', 0)
+    settings = {"latency": latency, "error_rate": error_rate, "cert_path": cert_path, "key_path": key_path}
+    process = multiprocessing.Process(target=_run_standins, args=(settings, ports, messages), daemon=True)
+    process.start()
+    try:
+        return StandIns(process, ports.get(timeout=30), messages, cert_path)
+    except Exception:
+        process.terminate()
+        raise RuntimeError("Stand-in services did not start.")
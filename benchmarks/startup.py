@@ -0,0 +1,115 @@
+"""Cold-start benchmark for the source entry point and the frozen ArgusSight binary.
+
+Usage (from the repository root):
+
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --binary dist/ArgusSight
+
+Every run starts a fresh process with its own config directory holding the
+scenario's config.ini and a fresh update check cache, so GitHub is never
+contacted. The URL scenario checks a local stand-in, so the time measured is
+startup plus one fast check. Results are written as JSON (by default to
+benchmarks/results/startup-<version>.json) so that versions can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BINARY = os.path.join(REPO_DIR, 'dist', 'ArgusSight.exe' if os.name == 'nt' else 'ArgusSight')
+
+def scenario_configs(ports):
+    """Returns the config.ini contents of each startup scenario."""
+    base = "[General]\nverbose = false\n\n[Email]\nenabled = false\n"
+    return {
+        'empty': base,
+        'url': base + f"\n[Monitors.URL.Startup]\nurl = http://127.0.0.1:{ports['http']}/\ncheck_string = OK\n",
+    }
+
+def prepare_home(directory, config_text):
+    """Creates a config directory under `directory` and returns the environment pointing at it."""
+    env = dict(os.environ)
+    if os.name == 'nt':
+        env['APPDATA'] = directory
+        config_dir = os.path.join(directory, 'ArgusSight')
+    else:
+        env['HOME'] = directory
+        config_dir = os.path.join(directory, '.config', 'ArgusSight')
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, 'config.ini'), "w") as f:
+        f.write(config_text)
+    from version import __version__
+    with open(os.path.join(config_dir, 'update_check.json'), "w") as f:
+        json.dump({'checked_at': time.time(), 'latest': __version__}, f)
+    return env
+
+def time_command(command, env, runs):
+    """Runs `command` `runs` times and returns the wall times in seconds."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold-start time of ArgusSight.")
+    parser.add_argument('--runs', type=int, default=10, help="Runs per target and scenario.")
+    parser.add_argument('--binary', default=DEFAULT_BINARY, help="Frozen executable built with build.spec; skipped if missing.")
+    parser.add_argument('--output', help="Where to write the JSON results.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_DIR)
+    from version import __version__
+    output = args.output or os.path.join(REPO_DIR, 'benchmarks', 'results', f'startup-{__version__}.json')
+
+    targets = {'source': [sys.executable, os.path.join(REPO_DIR, 'main.py')]}
+    if os.path.exists(args.binary):
+        targets['binary'] = [args.binary]
+    else:
+        print(f"No binary at {args.binary}, measuring the source entry point only.")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        from benchmarks.standins import start_standins
+        standins = start_standins(tmp_dir)
+        try:
+            print(f"{'target':>8} {'scenario':>9} {'min s':>7} {'median s':>9} {'max s':>7}")
+            for scenario, config_text in scenario_configs(standins.ports).items():
+                env = prepare_home(os.path.join(tmp_dir, scenario), config_text)
+                for target, command in targets.items():
+                    timings = time_command(command, env, args.runs)
+                    row = {
+                        'target': target,
+                        'scenario': scenario,
+                        'min_seconds': round(min(timings), 3),
+                        'median_seconds': round(statistics.median(timings), 3),
+                        'max_seconds': round(max(timings), 3),
+                    }
+                    rows.append(row)
+                    print(f"{target:>8} {scenario:>9} {row['min_seconds']:>7} {row['median_seconds']:>9} {row['max_seconds']:>7}")
+        finally:
+            standins.stop()
+
+    report = {
+        'version': __version__,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': args.runs,
+        'results': rows,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,27 @@ a = Analysis(
         'azure.identity',
         'azure.monitor.query',
         'azure.mgmt.compute',
+        'azure.mgmt.resourcegraph',
         'azure.core',
         'requests',
-        'version'
+        'version',
+        # Imported lazily by monitors.registry, only when a matching config section exists
+        'monitors.url_monitor',
+        'monitors.ssl_monitor',
+        'monitors.sql_monitor',
+        'monitors.vm_monitor',
+        'monitors.azure_monitor',
+        'monitors.tcp_monitor',
+        'monitors.dns_monitor',
+        'monitors.icmp_monitor',
+        'metrics_batcher',
+        'discovery',
+        'clients',
+        'offload',
+        'content_checks',
+        'credentials',
+        'guest_metrics',
+        'msal_extensions'
     ],
     hookspath=[],
     runtime_hooks=[],
@@ -0,0 +1,196 @@
+import socket
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+from urllib3.util.timeout import _DEFAULT_TIMEOUT
+import resilience
+import telemetry
+
+# Number of per-host connection pools kept alive, and connections per host
+DEFAULT_POOL_CONNECTIONS = 100
+DEFAULT_POOL_MAXSIZE = 10
+
+_lock = threading.Lock()
+_http_settings = {'pool_connections': DEFAULT_POOL_CONNECTIONS, 'pool_maxsize': DEFAULT_POOL_MAXSIZE}
+_http_session = None
+_azure_clients = {}
+_factory_overrides = {}
+
+def _timed_create_connection(address, timeout, source_address, socket_options, host):
+    """`urllib3.util.connection.create_connection`, recording DNS and connect time.
+
+    Every address the name resolves to is tried in turn, within the address
+    families `allowed_gai_family()` allows, exactly as urllib3 does.
+    """
+    dns_host, port = address
+    if dns_host.startswith('['):
+        dns_host = dns_host.strip('[]')
+    start = time.perf_counter()
+    try:
+        addresses = socket.getaddrinfo(dns_host, port, allowed_gai_family(), socket.SOCK_STREAM)
+    finally:
+        resolved = time.perf_counter()
+        telemetry.URL_DNS.observe(resolved - start, host=host)
+    error = None
+    for family, socktype, proto, _, sockaddr in addresses:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            for option in socket_options or ():
+                sock.setsockopt(*option)
+            if timeout is not _DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            telemetry.URL_CONNECT.observe(time.perf_counter() - resolved, host=host)
+            return sock
+        except OSError as e:
+            error = e
+            if sock is not None:
+                sock.close()
+    if error is not None:
+        raise error
+    raise OSError("getaddrinfo returns an empty list")
+
+class TimedConnectionMixin:
+    """Records DNS and TCP connect time separately for each new connection."""
+    _tcp_connected_at = None
+
+    def _new_conn(self):
+        # Same as urllib3's HTTPConnection._new_conn, with a timed create_connection
+        try:
+            sock = _timed_create_connection((self._dns_host, self.port), self.timeout,
+                                            self.source_address, self.socket_options, self.host)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        except socket.timeout as e:
+            raise ConnectTimeoutError(self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})") from e
+        except OSError as e:
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+        self._tcp_connected_at = time.perf_counter()
+        return sock
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        self._tcp_connected_at = None
+        super().connect()
+        if self._tcp_connected_at is not None:
+            telemetry.URL_TLS.observe(time.perf_counter() - self._tcp_connected_at, host=self.host)
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report DNS, connect and TLS timings."""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+def configure_http(pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    """Sets the pool sizes used when the shared HTTP session is created."""
+    global _http_session
+    with _lock:
+        _http_settings.update(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        _http_session = None
+
+def get_http_session():
+    """Returns the process-wide `requests.Session` shared by all URL monitors.
+
+    Connections are kept alive between checks, so repeated checks against the
+    same host skip DNS, TCP and TLS setup.
+    """
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = TimedHTTPAdapter(
+                pool_connections=_http_settings['pool_connections'],
+                pool_maxsize=_http_settings['pool_maxsize']
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_session = session
+        return _http_session
+
+def override_factory(kind, factory):
+    """Replaces how Azure clients of `kind` ('metrics_query', 'metrics', 'logs_query',
+    'compute', 'resource_graph') are built. `factory` receives the same arguments as the
+    matching get_* function. Used to point Argus at local stand-in endpoints.
+    """
+    with _lock:
+        _factory_overrides[kind] = factory
+        for key in [key for key in _azure_clients if key[0] == kind]:
+            del _azure_clients[key]
+
+def _get_azure_client(key, factory):
+    with _lock:
+        client = _azure_clients.get(key)
+        if client is None:
+            override = _factory_overrides.get(key[0])
+            client = override(*key[1:]) if override else factory()
+            _azure_clients[key] = client
+        return client
+
+# Monitor calls are retried by `resilience`, which bounds Retry-After waits by the
+# run deadline, so the SDK's own retry policy (up to 10 retries) is turned off
+SDK_RETRY_TOTAL = 0
+
+def is_transient_azure_error(error):
+    """Returns True for Azure failures worth retrying: connection errors, throttling and server errors."""
+    from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+    if isinstance(error, (ServiceRequestError, ServiceResponseError)):
+        return True
+    return isinstance(error, HttpResponseError) and error.status_code in resilience.TRANSIENT_STATUSES
+
+def get_metrics_query_client(credential):
+    """Returns the `MetricsQueryClient` shared by all monitors using `credential`."""
+    from azure.monitor.query import MetricsQueryClient
+    return _get_azure_client(('metrics_query', credential), lambda: MetricsQueryClient(credential, retry_total=SDK_RETRY_TOTAL))
+
+def get_metrics_client(credential, location):
+    """Returns the regional batch `MetricsClient` shared by all monitors using `credential`."""
+    from azure.monitor.query import MetricsClient
+    endpoint = f"https://{location}.metrics.monitor.azure.com"
+    return _get_azure_client(('metrics', credential, location), lambda: MetricsClient(endpoint, credential, retry_total=SDK_RETRY_TOTAL))
+
+def get_compute_client(credential, subscription_id):
+    """Returns the `ComputeManagementClient` shared by all monitors in a subscription."""
+    from azure.mgmt.compute import ComputeManagementClient
+    key = ('compute', credential, subscription_id.lower())
+    return _get_azure_client(key, lambda: ComputeManagementClient(credential, subscription_id, retry_total=SDK_RETRY_TOTAL))
+
+def get_logs_query_client(credential):
+    """Returns the `LogsQueryClient` shared by all guest metrics queries using `credential`."""
+    from azure.monitor.query import LogsQueryClient
+    return _get_azure_client(('logs_query', credential), lambda: LogsQueryClient(credential, retry_total=SDK_RETRY_TOTAL))
+
+def get_resource_graph_client(credential):
+    """Returns the `ResourceGraphClient` shared by all discovery queries using `credential`."""
+    from azure.mgmt.resourcegraph import ResourceGraphClient
+    return _get_azure_client(('resource_graph', credential), lambda: ResourceGraphClient(credential))
+
+def close_all():
+    """Closes the shared HTTP session and all Azure clients."""
+    global _http_session
+    with _lock:
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+        for client in _azure_clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _azure_clients.clear()
@@ -0,0 +1,348 @@
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import AuthenticationError, Client, Listener
+import telemetry
+
+# Points per worker on the hash ring; more points spread sections more evenly
+VIRTUAL_NODES = 64
+RECONNECT_SECONDS = 1
+WORKER_WAIT_SECONDS = 30
+# Extra time a shard gets beyond the run deadline, for the round trip to its worker
+SHARD_GRACE_SECONDS = 10
+
+CLUSTER_WORKERS = telemetry.gauge("argus_cluster_workers", "Number of workers connected to the coordinator.")
+
+class WorkerLost(Exception):
+    """Raised for a shard whose worker disconnected before returning results."""
+
+class HashRing:
+    """Consistent hash ring mapping section names to worker IDs.
+
+    Adding or removing a worker only moves the sections that hash next to its
+    points on the ring; every other section stays on the same worker.
+    """
+    def __init__(self, nodes=(), virtual_nodes=VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self._hashes = []
+        self._owners = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    def add(self, node):
+        for i in range(self.virtual_nodes):
+            point = self._hash(f"{node}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._hashes, point)
+                self._owners[point] = node
+
+    def remove(self, node):
+        for i in range(self.virtual_nodes):
+            point = self._hash(f"{node}#{i}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                del self._hashes[bisect.bisect_left(self._hashes, point)]
+
+    def __len__(self):
+        return len(set(self._owners.values()))
+
+    def node_for(self, key):
+        """Returns the node owning `key`, or None if the ring is empty."""
+        if not self._hashes:
+            return None
+        i = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[self._hashes[i]]
+
+    def assign(self, keys, placement=None):
+        """Returns a dict of node -> keys it owns, placing each key by `placement(key)` if given."""
+        shards = defaultdict(list)
+        for key in keys:
+            shards[self.node_for(placement(key) if placement else key)].append(key)
+        return dict(shards)
+
+def _dependency_root(depends_on, section):
+    """Follows the first of each section's `depends_on` up to one that depends on nothing."""
+    seen = {section}
+    while True:
+        parents = depends_on.get(section, ())
+        if not parents or parents[0] in seen:
+            return section
+        section = parents[0]
+        seen.add(section)
+
+class _RemoteWorker:
+    def __init__(self, worker_id, conn):
+        self.worker_id = worker_id
+        self.conn = conn
+        self.pending = {}
+        self._send_lock = threading.Lock()
+
+    def send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+class RemoteEngine:
+    """Runs checks on connected worker processes instead of in this one.
+
+    A drop-in for `CheckEngine` in `main` and the `Scheduler`: `run_async`
+    takes a dict of section -> monitor and returns section -> alerts, so
+    alerting stays in the coordinator. Sections are sharded across workers by
+    consistent hashing on the section name, or on the name of the section at
+    the root of its `depends_on` chain, so a worker runs (and remembers the
+    state of) the sections a check depends on. When a worker disconnects it is
+    taken off the ring and its unfinished sections are re-sent to the workers
+    that now own them. With a `run_deadline`, a worker that neither answers
+    nor disconnects fails its shard after the deadline (plus a short grace)
+    instead of holding up the run.
+    """
+    def __init__(self, address, authkey, min_workers=1, wait_seconds=WORKER_WAIT_SECONDS, virtual_nodes=VIRTUAL_NODES,
+                 run_deadline=None):
+        self.address = address
+        self.authkey = authkey
+        self.min_workers = max(1, int(min_workers))
+        self.wait_seconds = wait_seconds
+        self.run_deadline = run_deadline or None
+        self._ring = HashRing(virtual_nodes=virtual_nodes)
+        self._workers = {}
+        self._request_ids = itertools.count()
+        self._listener = None
+        self._loop = None
+        self._has_run = False
+        # Dependencies of every section seen so far, since a run may include a section but not its parents
+        self._depends_on = {}
+
+    def _start(self):
+        self._loop = asyncio.get_running_loop()
+        if self._listener is None:
+            self._listener = Listener(self.address, authkey=self.authkey)
+            threading.Thread(target=self._accept_loop, name="argus-cluster-accept", daemon=True).start()
+            logging.info(f"Coordinator listening for workers on {self.address[0]}:{self.address[1]}")
+
+    def _call_soon(self, callback, *args):
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass # The event loop has already finished
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                logging.warning("Rejected a worker connection with the wrong authkey.")
+                continue
+            except OSError:
+                return # Listener closed
+            try:
+                hello = conn.recv()
+                worker = _RemoteWorker(str(hello['worker']), conn)
+            except (EOFError, OSError, KeyError, TypeError):
+                conn.close()
+                continue
+            threading.Thread(target=self._read_loop, args=(worker,), name=f"argus-cluster-{worker.worker_id}", daemon=True).start()
+            self._call_soon(self._register, worker)
+
+    def _read_loop(self, worker):
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                self._call_soon(self._drop, worker)
+                return
+            self._call_soon(self._resolve, worker, message)
+
+    def _register(self, worker):
+        previous = self._workers.get(worker.worker_id)
+        if previous:
+            self._drop(previous)
+        self._workers[worker.worker_id] = worker
+        self._ring.add(worker.worker_id)
+        CLUSTER_WORKERS.set(len(self._workers))
+        logging.info(f"Worker {worker.worker_id} joined ({len(self._workers)} connected).")
+
+    def _drop(self, worker):
+        if self._workers.get(worker.worker_id) is not worker:
+            return
+        del self._workers[worker.worker_id]
+        self._ring.remove(worker.worker_id)
+        CLUSTER_WORKERS.set(len(self._workers))
+        worker.conn.close()
+        logging.warning(f"Worker {worker.worker_id} left ({len(self._workers)} connected).")
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(WorkerLost(worker.worker_id))
+        worker.pending.clear()
+
+    def _resolve(self, worker, message):
+        future = worker.pending.pop(message.get('id'), None)
+        if future and not future.done():
+            future.set_result(message.get('results', {}))
+
+    async def _wait_for_workers(self):
+        # The first run waits for the expected cluster size, later runs just for anyone
+        wanted = 1 if self._has_run else self.min_workers
+        deadline = time.monotonic() + self.wait_seconds
+        while len(self._workers) < wanted and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if len(self._workers) < wanted:
+            logging.warning(f"Only {len(self._workers)} of {wanted} workers connected after {self.wait_seconds}s.")
+        self._has_run = True
+
+    async def _run_shard(self, worker_id, sections):
+        worker = self._workers.get(worker_id)
+        if worker is None:
+            # Left between the assignment and now; its sections are rebalanced like any lost worker's
+            raise WorkerLost(worker_id)
+        request_id = next(self._request_ids)
+        future = self._loop.create_future()
+        worker.pending[request_id] = future
+        try:
+            await asyncio.to_thread(worker.send, {'type': 'run', 'id': request_id, 'sections': sections})
+        except (OSError, EOFError):
+            self._drop(worker)
+        timeout = self.run_deadline + SHARD_GRACE_SECONDS if self.run_deadline else None
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            worker.pending.pop(request_id, None)
+            raise TimeoutError(f"no results within {timeout:.0f}s")
+
+    async def run_async(self, monitors):
+        """Runs every section in `monitors` on the workers and returns a dict of section -> alerts."""
+        self._start()
+        start = time.perf_counter()
+        await self._wait_for_workers()
+        self._depends_on.update({section: getattr(monitor, 'depends_on', ()) for section, monitor in monitors.items()})
+        results = {}
+        pending = list(monitors)
+        while pending:
+            if not self._ring:
+                for section in pending:
+                    results[section] = [f"No cluster workers available to run {section}."]
+                break
+            shards = self._ring.assign(pending, lambda section: _dependency_root(self._depends_on, section))
+            outcomes = await asyncio.gather(*(self._run_shard(w, s) for w, s in shards.items()), return_exceptions=True)
+            pending = []
+            for (worker_id, sections), outcome in zip(shards.items(), outcomes):
+                if isinstance(outcome, WorkerLost):
+                    logging.warning(f"Rebalancing {len(sections)} sections from lost worker {worker_id}.")
+                    pending.extend(sections)
+                elif isinstance(outcome, Exception):
+                    for section in sections:
+                        results[section] = [f"Error running {section} on worker {worker_id}: {outcome}"]
+                else:
+                    results.update(outcome)
+        telemetry.RUN_DURATION.observe(time.perf_counter() - start)
+        # Sections a worker skipped because a section they depend on is down have no results
+        return {section: results[section] for section in monitors if section in results}
+
+    def run(self, monitors):
+        """Sync entry point: runs all monitors once on the workers, then disconnects them."""
+        try:
+            return asyncio.run(self.run_async(monitors))
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stops accepting workers and closes every worker connection."""
+        if self._listener:
+            self._listener.close()
+            self._listener = None
+        for worker in list(self._workers.values()):
+            worker.conn.close()
+        self._workers.clear()
+
+def run_worker(address, authkey, engine, monitors, worker_id=None, resolve=None, after_run=None):
+    """Connects to the coordinator and runs the sections it assigns with `engine`, until interrupted.
+
+    `monitors` holds every section this worker can run. Before each request
+    the async `resolve` (if given) is awaited with the requested sections and
+    returns updated monitors (None for removed sections), e.g. after a config
+    edit or for newly discovered resources. The async `after_run` is called
+    with each set of results, e.g. to save caches. The worker reconnects whenever the
+    coordinator goes away, so it can serve a coordinator started from cron.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    # Blocking connection I/O gets its own threads so it never takes a check's slot
+    io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="argus-cluster")
+
+    async def serve(conn):
+        loop = asyncio.get_running_loop()
+        send_lock = threading.Lock()
+        tasks = set()
+
+        def send(message):
+            with send_lock:
+                conn.send(message)
+
+        async def handle(request):
+            sections = request['sections']
+            try:
+                if resolve:
+                    for section, monitor in (await resolve(sections)).items():
+                        if monitor is None:
+                            monitors.pop(section, None)
+                        else:
+                            monitors[section] = monitor
+                results = await engine.run_async({s: monitors[s] for s in sections if s in monitors})
+            except Exception as e:
+                results = {section: [f"Error running {section} on worker {worker_id}: {e}"] for section in sections if section in monitors}
+            for section in sections:
+                if section not in monitors:
+                    results[section] = [f"Section {section} is not configured on worker {worker_id}."]
+            if after_run:
+                await after_run(results)
+            await loop.run_in_executor(io_executor, send, {'type': 'results', 'id': request['id'], 'results': results})
+
+        send({'type': 'hello', 'worker': worker_id})
+        while True:
+            try:
+                request = await loop.run_in_executor(io_executor, conn.recv)
+            except (EOFError, OSError):
+                break
+            if request.get('type') == 'run':
+                task = asyncio.create_task(handle(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        for task in tasks:
+            task.cancel()
+
+    async def main_loop():
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                conn = await loop.run_in_executor(io_executor, lambda: Client(address, authkey=authkey))
+            except AuthenticationError:
+                logging.error(f"Coordinator at {address[0]}:{address[1]} rejected this worker's authkey.")
+                await asyncio.sleep(RECONNECT_SECONDS)
+                continue
+            except OSError:
+                logging.debug(f"Coordinator at {address[0]}:{address[1]} is not reachable, retrying.")
+                await asyncio.sleep(RECONNECT_SECONDS)
+                continue
+            logging.info(f"Worker {worker_id} connected to coordinator at {address[0]}:{address[1]}.")
+            try:
+                await serve(conn)
+            finally:
+                conn.close()
+            logging.info(f"Coordinator disconnected; worker {worker_id} waiting for the next one.")
+
+    logging.info(f"Running as cluster worker {worker_id} with {len(monitors)} monitors. Press Ctrl+C to stop.")
+    try:
+        asyncio.run(main_loop())
+    except KeyboardInterrupt:
+        logging.info("Worker stopped.")
+    finally:
+        io_executor.shutdown(wait=False)
@@ -1,12 +1,154 @@
 
 import os
+import re
 import configparser
 
 DEFAULT_CONFIG_CONTENT = """[General]
 verbose = false
 
+[Discovery]
+# Discover every VM and SQL managed instance with one Azure Resource Graph query
+# instead of listing each one under Monitors.VM.* / Monitors.SQL.*
+enabled = false
+refresh_minutes = 5
+# Optional: comma-separated subscriptions to search, defaults to [Azure] subscription_id
+# and the subscriptions of every [Azure.Tenant.*] section
+# subscriptions = SUBSCRIPTION_ID_1, SUBSCRIPTION_ID_2
+# Optional thresholds applied to discovered VMs
+# cpu_threshold = 90.0
+# memory_threshold_mb = 1024
+# disk_threshold_mb = 5120
+# Optional: Log Analytics workspace of discovered VMs, defaults to [Azure] workspace_id
+# workspace_id = YOUR_WORKSPACE_ID
+
+[Engine]
+# Maximum number of checks running at the same time
+max_concurrency = 64
+# Optional: per-type limits (<type>_concurrency), applied on top of max_concurrency
+# url_concurrency = 32
+# ssl_concurrency = 32
+# sql_concurrency = 8
+# vm_concurrency = 8
+# CPU-heavy content checks (regex and json_path on URL bodies) of at least
+# offload_threshold_kb run in this many worker processes, off the I/O threads (0 disables)
+offload_workers = 2
+offload_threshold_kb = 256
+# Give up on checks still running this many seconds after a run started and
+# report them as alerts, so hanging targets can't stall a run (0 disables)
+run_deadline_seconds = 120
+
+[Resilience]
+# Transient failures (connection errors, timeouts, HTTP 408/429/5xx) are retried
+# up to this many times with jittered exponential backoff. A Retry-After longer
+# than max_backoff_seconds or past the run deadline is not waited out.
+retries = 2
+backoff_seconds = 0.5
+max_backoff_seconds = 30
+# Requests per second (and burst) per URL/SSL host and per Azure subscription (0 disables)
+host_rate = 10
+host_burst = 20
+subscription_rate = 25
+subscription_burst = 250
+# After this many consecutive failures a host or subscription is skipped for
+# breaker_reset_seconds, then a single check tries it again
+breaker_failures = 5
+breaker_reset_seconds = 60
+
+[Daemon]
+# Used with --daemon. Each monitor section may also set its own 'interval',
+# e.g. interval = 30s, 5m, 6h or 1d (plain numbers are seconds).
+# Defaults per type: URL 1m, SSL 6h, SQL 5m, VM 5m
+jitter = true
+# Check config.ini for edits this often (in seconds, 0 disables). Only monitor
+# sections that changed are rebuilt; other sections apply after a restart, except [Email].
+reload_seconds = 30
+
+[HTTP]
+# Connection pooling for URL checks: number of hosts kept alive and connections per host
+pool_connections = 100
+pool_maxsize = 10
+
+[SSL]
+# Cache certificate expiry dates between runs instead of handshaking every time.
+# Cached results are trusted for up to cache_ttl_hours, and re-probed more often
+# (down to every min_probe_minutes) as a certificate nears the 15-day alert window.
+cache_enabled = true
+cache_ttl_hours = 168
+min_probe_minutes = 60
+# Every A/AAAA record of a host is handshaked. At most max_handshakes run at
+# once across all SSL monitors, each with its own connect and handshake
+# timeouts (a section's 'timeout' overrides both). DNS answers are shared for dns_ttl_seconds.
+max_handshakes = 256
+connect_timeout = 5
+handshake_timeout = 10
+dns_ttl_seconds = 300
+
+[Metrics]
+# Per-check timing histograms in the Prometheus text format.
+# Serve them on http://<host>:<http_port>/metrics (0 disables the endpoint; most useful with --daemon)
+http_port = 0
+# and/or write them after every run for node_exporter's textfile collector
+# textfile_path = /var/lib/node_exporter/textfile_collector/argus.prom
+
+[History]
+# Keep every SQL and VM metric datapoint locally, so each run only fetches the
+# time grains since the previous one and trend checks can look further back.
+# Points older than raw_hours are averaged into downsample_minutes buckets.
+enabled = true
+retention_days = 14
+raw_hours = 24
+downsample_minutes = 60
+
+[Cluster]
+# Used with --coordinator / --worker to spread monitors over several processes
+# or hosts. Every process reads the same monitor sections; sections are assigned
+# to workers by consistent hashing on their name.
+address = 127.0.0.1:7700
+# Shared secret; workers with a different authkey are rejected. Required.
+authkey =
+# The first run waits up to wait_seconds for this many workers to connect
+min_workers = 1
+wait_seconds = 30
+
 [Azure]
 subscription_id = YOUR_SUBSCRIPTION_ID
+# Optional: default region of your resources (e.g. westeurope). When known,
+# SQL and VM metrics are fetched with batch queries of up to 50 resources.
+# Sections may override it with their own 'location'.
+# location = westeurope
+# Optional: Log Analytics workspace (its workspace ID, a GUID) that Azure Monitor
+# Agent / VM insights sends guest counters to. Needed for VM disk_threshold_mb;
+# all VMs of a workspace are fetched with one query. Sections may set their own.
+# workspace_id = YOUR_WORKSPACE_ID
+# Optional: tenant of subscription_id and of sections without a tenant below;
+# defaults to the home tenant of the signed-in identity
+# tenant_id = YOUR_TENANT_ID
+# Keep access tokens between runs, so cron runs don't acquire a new one through
+# the Azure CLI or managed identity every time. Tokens are stored encrypted with the
+# OS keyring (DPAPI, Keychain, libsecret), or with the Fernet key in the
+# ARGUS_TOKEN_CACHE_KEY environment variable where there is none.
+token_cache = true
+# Store tokens in a file readable only by this user when neither is available
+allow_unencrypted_token_cache = false
+
+# Subscriptions in other tenants: one [Azure.Tenant.<name>] section per tenant.
+# Monitor sections pick their subscription with 'subscription_id'. Without a
+# service principal, the signed-in identity requests tokens for the tenant.
+# [Azure.Tenant.contoso]
+# tenant_id = CONTOSO_TENANT_ID
+# subscriptions = SUBSCRIPTION_ID_3, SUBSCRIPTION_ID_4
+# Optional service principal, with a secret or a certificate (PEM) path
+# client_id = APP_ID
+# client_secret = APP_SECRET
+# certificate_path = /path/to/cert.pem
+
+[Alerts]
+# Remember alerts between runs and only email when an alert starts or resolves,
+# instead of re-sending every active alert on every run
+dedup = true
+# Collect state changes for this many minutes and send them as one digest email
+# (0 sends at the end of every run)
+digest_minutes = 0
 
 [Email]
 enabled = false
@@ -20,6 +162,10 @@ to_addresses = recipient1@example.com, recipient2@example.com
 
 [Monitors.SQL.YourInstanceName] # Create a section for each instance
 resource_group = YOUR_RESOURCE_GROUP
+# Optional: alert when the storage trend over the last forecast_window_hours
+# reaches 90% within this many days (0 disables the forecast)
+# storage_forecast_days = 7
+# forecast_window_hours = 24
 
 [Monitors.URL.GoogleExample]
 url = https://www.google.com
@@ -31,14 +177,33 @@ check_string = Google
 # username = your_username
 # password = your_password
 timeout = 10 # Optional: defaults to 10 seconds
+# Optional: stop reading the response after this many bytes (defaults to 5 MB)
+# max_body_bytes = 5242880
+# Optional: send the last ETag/Last-Modified back; on 304 Not Modified the
+# previous check_string/json_check verdict is reused without downloading the body
+# conditional = true
+# Optional: a regular expression that must match somewhere in the body
+# regex = "version":\s*"2\.\d+"
+# Optional: JSONPath -> expected value, for values nested anywhere in a JSON response.
+# Supports .key, ['key'], [0], [*] and ..key; every match must equal the expected value.
+# json_path = {"$.checks[*].status": "ok", "$..database.healthy": true}
+# Optional: send HEAD requests and only check the status code
+# (can't be combined with check_string, json_check, regex or json_path)
+# head_only = true
 
 [Monitors.URL.AnotherSite]
 url = https://www.github.com
 check_string = GitHub
+# Optional: sections that must be up for this check to be meaningful, e.g. the VM
+# serving the site. They are checked first; while one is down (stopped VM, refused
+# port, unreachable URL...) this check is skipped and its alerts are left as they are.
+# depends_on = VM.YourLinuxVM, TCP.YourDatabasePort
 
 [Monitors.SSL.YourSSLDomain]
 host = example.com # Just the domain, no https://
 port = 443 # Optional: defaults to 443
+# timeout = 10 # Optional: connect and handshake timeout in seconds
+# sni = www.example.com # Optional: server name(s) to send, comma-separated, defaults to host
 
 [Monitors.VM.YourLinuxVM]
 resource_group = YOUR_RESOURCE_GROUP
@@ -46,7 +211,31 @@ vm_name = YourLinuxVMName
 # Optional thresholds
 cpu_threshold = 90.0 # percent
 memory_threshold_mb = 1024 # MB
-disk_threshold_mb = 5120 # MB
+disk_threshold_mb = 5120 # MB, free space per disk (needs a workspace_id, see [Azure])
+# Optional: only alert when this many consecutive 5-minute CPU samples are over the threshold
+# cpu_consecutive_samples = 3
+
+# Check that a TCP port accepts connections
+# [Monitors.TCP.YourDatabasePort]
+# host = db.example.com
+# port = 5432
+# timeout = 5 # Optional: defaults to 5 seconds
+# max_connect_ms = 200 # Optional: alert when connecting takes longer
+
+# Check that a name resolves, using this machine's resolver
+# [Monitors.DNS.YourDomain]
+# hostname = www.example.com
+# expected = 93.184.215.14 # Optional: comma-separated addresses the name must resolve to
+# max_resolve_ms = 500 # Optional: alert when resolving takes longer
+
+# Ping a host. Uses unprivileged ICMP sockets where the OS allows them, raw
+# sockets when running as root, and otherwise the system ping command.
+# [Monitors.ICMP.YourGateway]
+# host = 10.0.0.1
+# count = 3 # Optional: pings per check, defaults to 3
+# timeout = 2 # Optional: seconds to wait for replies after the last ping
+# max_loss_percent = 0 # Optional: alert when more pings are lost
+# max_rtt_ms = 100 # Optional: alert when the average round-trip time is higher
 """
 
 def get_config_dir():
@@ -60,8 +249,44 @@ def get_config_path():
     """Returns the full path to the config.ini file."""
     return os.path.join(get_config_dir(), 'config.ini')
 
-def initialize_config():
-    """Ensures the config directory and file exist, and returns the parsed config."""
+def get_ssl_cache_path():
+    """Returns the full path to the SSL certificate cache file."""
+    return os.path.join(get_config_dir(), 'ssl_cache.json')
+
+def get_url_cache_path():
+    """Returns the full path to the URL validator and verdict cache file."""
+    return os.path.join(get_config_dir(), 'url_cache.json')
+
+def get_inventory_cache_path():
+    """Returns the full path to the discovered resource inventory cache file."""
+    return os.path.join(get_config_dir(), 'inventory_cache.json')
+
+def get_alert_state_path():
+    """Returns the full path to the alert state database."""
+    return os.path.join(get_config_dir(), 'alert_state.db')
+
+def get_history_path():
+    """Returns the full path to the local metric history store."""
+    return os.path.join(get_config_dir(), 'metrics_history.bin')
+
+def get_token_cache_path():
+    """Returns the full path to the Azure access token cache."""
+    return os.path.join(get_config_dir(), 'token_cache.bin')
+
+def get_config_cache_path():
+    """Returns the full path to the compiled config cache."""
+    return os.path.join(get_config_dir(), 'config_cache.pickle')
+
+def get_update_check_path():
+    """Returns the full path to the cached result of the daily update check."""
+    return os.path.join(get_config_dir(), 'update_check.json')
+
+def create_parser():
+    """Returns a ConfigParser that strips ' # ...' comments after values, as used in the default config."""
+    return configparser.ConfigParser(inline_comment_prefixes=('#',))
+
+def ensure_config_file():
+    """Ensures the config directory and file exist. Returns False if a default config was just created."""
     config_dir = get_config_dir()
     config_path = get_config_path()
 
@@ -73,10 +298,15 @@ def initialize_config():
         with open(config_path, "w") as f:
             f.write(DEFAULT_CONFIG_CONTENT)
         print("Default config.ini created. Please edit it with your details and rerun the application.")
-        return None
+        return False
+    return True
 
-    config = configparser.ConfigParser()
-    config.read(config_path)
+def initialize_config():
+    """Ensures the config directory and file exist, and returns the parsed config."""
+    if not ensure_config_file():
+        return None
+    config = create_parser()
+    config.read(get_config_path())
     return config
 
 def get_verbose_setting(config):
@@ -84,3 +314,178 @@ def get_verbose_setting(config):
     if config.has_option('General', 'verbose'):
         return config.getboolean('General', 'verbose')
     return False # Default to non-verbose if not specified
+
+def get_engine_settings(config):
+    """Returns the global concurrency limit and a dict of per-type limits from the config."""
+    max_concurrency = 64
+    type_limits = {}
+    if config.has_section('Engine'):
+        engine_config = config['Engine']
+        max_concurrency = engine_config.getint('max_concurrency', max_concurrency)
+        for key in engine_config:
+            # '<type>_concurrency' for any monitor type, including plugins
+            if key.endswith('_concurrency') and key != 'max_concurrency':
+                limit = engine_config.getint(key, None)
+                if limit:
+                    type_limits[key[:-len('_concurrency')].upper()] = limit
+    return max_concurrency, type_limits
+
+def get_run_deadline(config):
+    """Returns the run deadline in seconds from the config (0 disables it)."""
+    if config.has_option('Engine', 'run_deadline_seconds'):
+        return config.getfloat('Engine', 'run_deadline_seconds')
+    return 120.0
+
+def get_resilience_settings(config):
+    """Returns the retry, rate limit and circuit breaker settings as keyword arguments for `resilience.configure`."""
+    settings = {
+        'retries': 2, 'backoff_seconds': 0.5, 'max_backoff_seconds': 30.0,
+        'host_rate': 10.0, 'host_burst': 20.0, 'subscription_rate': 25.0, 'subscription_burst': 250.0,
+        'breaker_failures': 5, 'breaker_reset_seconds': 60.0,
+    }
+    if config.has_section('Resilience'):
+        resilience_config = config['Resilience']
+        for key, default in settings.items():
+            if isinstance(default, int):
+                settings[key] = resilience_config.getint(key, default)
+            else:
+                settings[key] = resilience_config.getfloat(key, default)
+    return settings
+
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_interval(value):
+    """Parses an interval such as '30s', '5m', '6h', '1d' or '90' (seconds) into seconds."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*', str(value).lower())
+    if not match:
+        raise ValueError(f"Invalid interval: '{value}'")
+    return float(match.group(1)) * INTERVAL_UNITS.get(match.group(2) or 's')
+
+def get_daemon_jitter(config):
+    """Returns whether daemon start times should be jittered."""
+    if config.has_option('Daemon', 'jitter'):
+        return config.getboolean('Daemon', 'jitter')
+    return True
+
+def get_daemon_reload_seconds(config):
+    """Returns how often the daemon checks config.ini for edits, in seconds (0 disables)."""
+    if config.has_option('Daemon', 'reload_seconds'):
+        return config.getfloat('Daemon', 'reload_seconds')
+    return 30.0
+
+def get_http_settings(config):
+    """Returns the HTTP connection pool sizes (pool_connections, pool_maxsize) from the config."""
+    pool_connections, pool_maxsize = 100, 10
+    if config.has_section('HTTP'):
+        pool_connections = config['HTTP'].getint('pool_connections', pool_connections)
+        pool_maxsize = config['HTTP'].getint('pool_maxsize', pool_maxsize)
+    return pool_connections, pool_maxsize
+
+def get_ssl_cache_settings(config):
+    """Returns (enabled, ttl_hours, min_probe_minutes) for the SSL certificate cache."""
+    enabled, ttl_hours, min_probe_minutes = True, 168.0, 60.0
+    if config.has_section('SSL'):
+        enabled = config['SSL'].getboolean('cache_enabled', enabled)
+        ttl_hours = config['SSL'].getfloat('cache_ttl_hours', ttl_hours)
+        min_probe_minutes = config['SSL'].getfloat('min_probe_minutes', min_probe_minutes)
+    return enabled, ttl_hours, min_probe_minutes
+
+def get_offload_settings(config):
+    """Returns (workers, threshold_bytes) for the process pool that evaluates large response bodies."""
+    workers, threshold_kb = 2, 256.0
+    if config.has_section('Engine'):
+        workers = config['Engine'].getint('offload_workers', workers)
+        threshold_kb = config['Engine'].getfloat('offload_threshold_kb', threshold_kb)
+    return workers, int(threshold_kb * 1024)
+
+def get_ssl_scan_settings(config):
+    """Returns (max_handshakes, connect_timeout, handshake_timeout, dns_ttl_seconds) for the SSL scanner."""
+    max_handshakes, connect_timeout, handshake_timeout, dns_ttl_seconds = 256, 5.0, 10.0, 300.0
+    if config.has_section('SSL'):
+        ssl_config = config['SSL']
+        max_handshakes = ssl_config.getint('max_handshakes', max_handshakes)
+        connect_timeout = ssl_config.getfloat('connect_timeout', connect_timeout)
+        handshake_timeout = ssl_config.getfloat('handshake_timeout', handshake_timeout)
+        dns_ttl_seconds = ssl_config.getfloat('dns_ttl_seconds', dns_ttl_seconds)
+    return max_handshakes, connect_timeout, handshake_timeout, dns_ttl_seconds
+
+def get_discovery_settings(config):
+    """Returns (enabled, refresh_minutes, subscription_ids) for Resource Graph discovery."""
+    if not config.has_section('Discovery'):
+        return False, 5.0, []
+    discovery_config = config['Discovery']
+    if discovery_config.get('subscriptions'):
+        subscription_ids = _split_list(discovery_config.get('subscriptions'))
+    else:
+        subscription_ids = _split_list(config.get('Azure', 'subscription_id', fallback=''))
+        for tenant in get_tenant_settings(config):
+            subscription_ids += [sub for sub in tenant.subscriptions if sub not in subscription_ids]
+    return discovery_config.getboolean('enabled', False), discovery_config.getfloat('refresh_minutes', 5.0), subscription_ids
+
+def _split_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+TENANT_SECTION_PREFIX = 'Azure.Tenant.'
+
+def get_token_cache_settings(config):
+    """Returns (enabled, allow_unencrypted) for the Azure access token cache."""
+    enabled, allow_unencrypted = True, False
+    if config.has_section('Azure'):
+        enabled = config['Azure'].getboolean('token_cache', enabled)
+        allow_unencrypted = config['Azure'].getboolean('allow_unencrypted_token_cache', allow_unencrypted)
+    return enabled, allow_unencrypted
+
+def get_tenant_settings(config):
+    """Returns a `credentials.TenantSettings` for each [Azure.Tenant.<name>] section."""
+    from credentials import TenantSettings
+    tenants = []
+    for section in config.sections():
+        if not section.startswith(TENANT_SECTION_PREFIX):
+            continue
+        tenant_config = config[section]
+        if not tenant_config.get('tenant_id'):
+            raise ValueError(f"[{section}] needs a tenant_id")
+        tenants.append(TenantSettings(
+            name=section[len(TENANT_SECTION_PREFIX):],
+            tenant_id=tenant_config.get('tenant_id'),
+            subscriptions=tuple(_split_list(tenant_config.get('subscriptions', ''))),
+            client_id=tenant_config.get('client_id') or None,
+            client_secret=tenant_config.get('client_secret') or None,
+            certificate_path=tenant_config.get('certificate_path') or None,
+        ))
+    return tenants
+
+def get_metrics_settings(config):
+    """Returns (http_port, textfile_path) for the metrics exporter; 0 / None disable each output."""
+    if not config.has_section('Metrics'):
+        return 0, None
+    return config['Metrics'].getint('http_port', 0), config['Metrics'].get('textfile_path') or None
+
+def get_alert_settings(config):
+    """Returns (dedup, digest_minutes) for alert notifications."""
+    if not config.has_section('Alerts'):
+        return True, 0.0
+    return config['Alerts'].getboolean('dedup', True), config['Alerts'].getfloat('digest_minutes', 0.0)
+
+def get_history_settings(config):
+    """Returns (enabled, retention_days, raw_hours, downsample_minutes) for the metric history store."""
+    enabled, retention_days, raw_hours, downsample_minutes = True, 14.0, 24.0, 60.0
+    if config.has_section('History'):
+        history_config = config['History']
+        enabled = history_config.getboolean('enabled', enabled)
+        retention_days = history_config.getfloat('retention_days', retention_days)
+        raw_hours = history_config.getfloat('raw_hours', raw_hours)
+        downsample_minutes = history_config.getfloat('downsample_minutes', downsample_minutes)
+    return enabled, retention_days, raw_hours, downsample_minutes
+
+def get_cluster_settings(config):
+    """Returns ((host, port), authkey bytes, min_workers, wait_seconds) for coordinator/worker mode."""
+    address, authkey, min_workers, wait_seconds = '127.0.0.1:7700', '', 1, 30.0
+    if config.has_section('Cluster'):
+        cluster_config = config['Cluster']
+        address = cluster_config.get('address', address)
+        authkey = cluster_config.get('authkey', authkey)
+        min_workers = cluster_config.getint('min_workers', min_workers)
+        wait_seconds = cluster_config.getfloat('wait_seconds', wait_seconds)
+    host, _, port = address.strip().rpartition(':')
+    return (host or '127.0.0.1', int(port)), authkey.strip().encode(), min_workers, wait_seconds
@@ -0,0 +1,276 @@
+import configparser
+import hashlib
+import logging
+import os
+import pickle
+from dataclasses import dataclass, field, fields
+import config_manager
+from monitors import registry
+from version import __version__
+
+class ConfigError(ValueError):
+    """Raised for a monitor section that is missing required keys or has invalid values."""
+
+class Options(dict):
+    """Options of a monitor section, with the typed getters of configparser's SectionProxy."""
+    __slots__ = ()
+
+    def getint(self, key, fallback=None):
+        value = self.get(key)
+        return fallback if value is None else int(value)
+
+    def getfloat(self, key, fallback=None):
+        value = self.get(key)
+        return fallback if value is None else float(value)
+
+    def getboolean(self, key, fallback=None):
+        value = self.get(key)
+        if value is None or isinstance(value, bool):
+            return fallback if value is None else value
+        return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+
+@dataclass(frozen=True, slots=True)
+class MonitorSpec:
+    """A compiled 'Monitors.<TYPE>.<name>' section.
+
+    `options` holds every option the type declares, converted (or its
+    default), plus any undeclared keys of the section as strings.
+    `depends_on` holds the sections whose checks must pass before this one runs.
+    """
+    type: str
+    section: str
+    name: str
+    options: Options = field(default_factory=Options)
+    interval: float = None
+    depends_on: tuple = ()
+
+def _convert(section_config, key, convert, fallback=None):
+    value = section_config.get(key)
+    if value is None or value == '':
+        return fallback
+    try:
+        return convert(value)
+    except ValueError:
+        raise ConfigError(f"'{key}' has an invalid value: {value!r}")
+
+def _inherited(config, option):
+    if option.inherit is None:
+        return None
+    section, key = option.inherit
+    return config[section].get(key) if config.has_section(section) else None
+
+def _parse_depends_on(value):
+    """Parses a comma-separated list of sections, written with or without the 'Monitors.' prefix."""
+    sections = []
+    for name in (value or '').split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if not name.startswith('Monitors.'):
+            name = f"Monitors.{name}"
+        if len(name.split('.')) < 3:
+            raise ConfigError(f"'depends_on' needs sections like VM.web-1 or Monitors.VM.web-1, got {name!r}")
+        sections.append(name)
+    return tuple(dict.fromkeys(sections))
+
+def compile_section(config, section, monitor_class):
+    """Converts one section's options as declared by `monitor_class.OPTIONS` and returns its spec."""
+    section_config = dict(config.items(section))
+    options = Options()
+    for option in monitor_class.OPTIONS:
+        if not section_config.get(option.name):
+            inherited = _inherited(config, option)
+            if inherited:
+                section_config[option.name] = inherited
+            elif option.required:
+                where = f" (here or in [{option.inherit[0]}])" if option.inherit else ""
+                raise ConfigError(f"'{option.name}' is required{where}")
+        options[option.name] = _convert(section_config, option.name, option.convert, option.default)
+    for key, value in section_config.items():
+        # Plugins and thresholds read by `Options.get*` may use keys they don't declare
+        if key not in ('interval', 'depends_on'):
+            options.setdefault(key, value)
+    try:
+        monitor_class.validate(options)
+    except ValueError as e:
+        raise ConfigError(str(e))
+    return MonitorSpec(
+        type=monitor_class.TYPE,
+        section=section,
+        name=section.split('.')[-1],
+        options=options,
+        interval=_convert(section_config, 'interval', config_manager.parse_interval),
+        depends_on=_parse_depends_on(section_config.get('depends_on')),
+    )
+
+def _find_cycles(specs):
+    """Returns the sections whose `depends_on` leads back to themselves, mapped to the cycle's path."""
+    cycles = {}
+    state = {}
+    for start in specs:
+        if start in state:
+            continue
+        # Iterative depth-first search; `path` is the chain of sections being visited
+        path, stack = [], [(start, iter(specs[start].depends_on))]
+        state[start] = 'visiting'
+        path.append(start)
+        while stack:
+            section, parents = stack[-1]
+            parent = next(parents, None)
+            if parent is None:
+                state[section] = 'done'
+                stack.pop()
+                path.pop()
+            elif parent == section or state.get(parent) == 'visiting':
+                cycle = path[path.index(parent):] + [parent]
+                for member in cycle:
+                    cycles.setdefault(member, cycle)
+            elif parent in specs and parent not in state:
+                state[parent] = 'visiting'
+                path.append(parent)
+                stack.append((parent, iter(specs[parent].depends_on)))
+    return cycles
+
+def compile_monitors(config):
+    """Compiles every 'Monitors.<TYPE>.<name>' section into a spec.
+
+    The type's Monitor class comes from `monitors.registry`. Returns (specs,
+    errors): a dict of section -> spec in config order and a list of
+    messages for sections that were skipped because they are invalid,
+    including every section on a `depends_on` cycle. A `depends_on` naming
+    a section that doesn't exist is allowed, since it may be discovered.
+    """
+    specs = {}
+    errors = []
+    for section in config.sections():
+        parts = section.split('.')
+        if parts[0] != 'Monitors' or len(parts) < 3:
+            continue
+        try:
+            monitor_class = registry.get(parts[1])
+        except KeyError:
+            errors.append(f"[{section}]: unknown monitor type '{parts[1]}'")
+            continue
+        except Exception as e:
+            errors.append(f"[{section}]: could not load monitor type '{parts[1]}': {e}")
+            continue
+        try:
+            specs[section] = compile_section(config, section, monitor_class)
+        except (ConfigError, configparser.Error) as e:
+            errors.append(f"[{section}]: {e}")
+    for section, cycle in _find_cycles(specs).items():
+        del specs[section]
+        errors.append(f"[{section}]: 'depends_on' forms a cycle: {' -> '.join(cycle)}")
+    return specs, errors
+
+@dataclass(slots=True)
+class CompiledConfig:
+    """A parsed config.ini: the settings sections as a ConfigParser and the monitor sections as specs."""
+    settings: configparser.ConfigParser
+    monitors: dict
+    errors: list
+    # Every 'Monitors.*' section in the file, including the invalid ones left out of `monitors`
+    sections: list
+    source_hash: str
+    mtime_ns: int
+    size: int
+
+def _settings_parser(settings):
+    parser = config_manager.create_parser()
+    parser.read_dict(settings)
+    return parser
+
+def _type_fingerprint(monitor_class):
+    options = [
+        (option.name, getattr(option.convert, '__qualname__', repr(option.convert)), repr(option.default), option.required, option.inherit)
+        for option in monitor_class.OPTIONS
+    ]
+    return hashlib.sha256(repr((monitor_class.TYPE, options)).encode()).hexdigest()
+
+def _cache_key(monitors):
+    """Returns what a cache must have been written with to be reused.
+
+    That is the app version, the MonitorSpec and CompiledConfig fields, the known monitor types
+    (a newly installed plugin turns 'unknown type' errors stale) and the
+    (TYPE, OPTIONS) of every type the cache holds sections of. Only those
+    types are imported, and they are needed to build the monitors anyway.
+    """
+    types = sorted({spec.type for spec in monitors.values()})
+    return (
+        __version__,
+        tuple(spec_field.name for spec_field in fields(MonitorSpec)),
+        tuple(config_field.name for config_field in fields(CompiledConfig)),
+        tuple(registry.types()),
+        {monitor_type: _type_fingerprint(registry.get(monitor_type)) for monitor_type in types},
+    )
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get('key') == _cache_key(cached['monitors']):
+            return cached
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.debug(f"Ignoring unreadable config cache {cache_path}: {e}")
+    return None
+
+def _write_cache(cache_path, cached):
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        # The cache holds the config's passwords and secrets, so only this user may read it
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.debug(f"Could not write config cache {cache_path}: {e}")
+
+def load(path, cache_path=None, previous=None):
+    """Returns the CompiledConfig for `path`, parsing config.ini only when it changed.
+
+    `previous` (the last loaded CompiledConfig) is returned as is if the file's
+    mtime and size are unchanged. Otherwise the on-disk cache is used if it
+    matches the file's mtime and size, or failing that its SHA-256. Only on a
+    real content change is the file parsed and compiled again.
+    """
+    stat = os.stat(path)
+    if previous and (previous.mtime_ns, previous.size) == (stat.st_mtime_ns, stat.st_size):
+        return previous
+
+    cached = _read_cache(cache_path) if cache_path else None
+    source_hash = None
+    if not cached or (cached['mtime_ns'], cached['size']) != (stat.st_mtime_ns, stat.st_size):
+        with open(path, "rb") as f:
+            data = f.read()
+        source_hash = hashlib.sha256(data).hexdigest()
+        if cached and cached['source_hash'] != source_hash:
+            cached = None
+        if previous and previous.source_hash == source_hash:
+            # Touched but not edited
+            previous.mtime_ns, previous.size = stat.st_mtime_ns, stat.st_size
+            return previous
+
+    if cached is None:
+        config = config_manager.create_parser()
+        config.read_string(data.decode(), source=path)
+        monitors, errors = compile_monitors(config)
+        settings = {
+            section: dict(config.items(section, raw=True))
+            for section in config.sections() if not section.startswith('Monitors.')
+        }
+        sections = [section for section in config.sections() if section.startswith('Monitors.')]
+        cached = {'key': _cache_key(monitors), 'source_hash': source_hash, 'settings': settings,
+                  'monitors': monitors, 'errors': errors, 'sections': sections, 'mtime_ns': None, 'size': None}
+    if cache_path and (cached['mtime_ns'], cached['size']) != (stat.st_mtime_ns, stat.st_size):
+        cached['mtime_ns'], cached['size'] = stat.st_mtime_ns, stat.st_size
+        _write_cache(cache_path, cached)
+    return CompiledConfig(_settings_parser(cached['settings']), cached['monitors'], cached['errors'],
+                          cached['sections'], cached['source_hash'], stat.st_mtime_ns, stat.st_size)
+
+def diff(old_monitors, new_monitors):
+    """Returns the sections that were added, removed or changed between two dicts of section -> spec."""
+    changed = [section for section, spec in new_monitors.items() if old_monitors.get(section) != spec]
+    removed = [section for section in old_monitors if section not in new_monitors]
+    return changed + removed
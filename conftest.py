@@ -0,0 +1 @@
+# The modules live at the repository root; this file puts it on sys.path for the tests
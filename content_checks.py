@@ -0,0 +1,115 @@
+import json
+import re
+
+# Only the standard library is imported here, since offload worker processes import this module
+
+_PATH_STEP = re.compile(r"""
+    \.\.(?P<descend>\*|[A-Za-z_][\w-]*)        # ..name or ..*
+  | \.(?P<name>\*|[A-Za-z_][\w-]*)             # .name or .*
+  | \[(?P<bracket>\*|-?\d+|'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")\]
+""", re.VERBOSE)
+
+def parse_json_path(path):
+    """Parses a JSONPath into a tuple of (kind, value) steps. Raises ValueError for unsupported syntax.
+
+    Supported: `$`, `.key`, `['key']`, `[0]` / `[-1]`, `.*` / `[*]` and
+    recursive descent `..key` / `..*`.
+    """
+    path = path.strip()
+    if not path.startswith('$'):
+        raise ValueError(f"JSONPath must start with '$': {path}")
+    steps = []
+    pos = 1
+    while pos < len(path):
+        match = _PATH_STEP.match(path, pos)
+        if match is None:
+            raise ValueError(f"Unsupported JSONPath syntax at position {pos}: {path}")
+        descend, name, bracket = match.group('descend', 'name', 'bracket')
+        if descend is not None:
+            steps.append(('descend', None if descend == '*' else descend))
+        elif name == '*' or bracket == '*':
+            steps.append(('wildcard', None))
+        elif name is not None:
+            steps.append(('key', name))
+        elif bracket[0] in '\'"':
+            steps.append(('key', re.sub(r'\\(.)', r'\1', bracket[1:-1])))
+        else:
+            steps.append(('index', int(bracket)))
+        pos = match.end()
+    return tuple(steps)
+
+def _children(node):
+    if isinstance(node, dict):
+        return list(node.values())
+    if isinstance(node, list):
+        return list(node)
+    return []
+
+def _descendants(node):
+    """Yields `node` and every value nested in it, without recursion."""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(_children(current)))
+
+def find(document, steps):
+    """Returns every value of `document` that the parsed JSONPath `steps` select."""
+    nodes = [document]
+    for kind, value in steps:
+        found = []
+        for node in nodes:
+            if kind == 'key':
+                if isinstance(node, dict) and value in node:
+                    found.append(node[value])
+            elif kind == 'index':
+                if isinstance(node, list) and -len(node) <= value < len(node):
+                    found.append(node[value])
+            elif kind == 'wildcard':
+                found.extend(_children(node))
+            else:
+                for child in _descendants(node):
+                    if value is None:
+                        found.extend(_children(child))
+                    elif isinstance(child, dict) and value in child:
+                        found.append(child[value])
+        nodes = found
+    return nodes
+
+def evaluate(name, body, encoding=None, needle=None, json_check=None, regex=None, json_path=None, truncated=False, max_body_bytes=None):
+    """Runs the content assertions of a URL monitor on a buffered body and returns alert messages.
+
+    `needle` is the encoded check_string, `json_check` maps top-level keys
+    and `json_path` maps JSONPaths to expected values, and `regex` must
+    match somewhere in the decoded text. `truncated` means the body was cut
+    at `max_body_bytes`.
+    """
+    alerts = []
+    within = f" in the first {max_body_bytes} bytes" if truncated else ""
+    if needle and needle not in body:
+        alerts.append(f"URL '{name}' is up, but the expected string was not found{within}.")
+    if regex:
+        text = body.decode(encoding or 'utf-8', errors='replace')
+        if re.search(regex, text) is None:
+            alerts.append(f"URL '{name}' is up, but no match for the pattern /{regex}/ was found{within}.")
+    if json_check or json_path:
+        try:
+            document = json.loads(body)
+        except ValueError:
+            if truncated:
+                alerts.append(f"URL '{name}' response exceeded {max_body_bytes} bytes before it could be parsed as JSON.")
+            else:
+                alerts.append(f"URL '{name}' is up, but response is not valid JSON.")
+            return alerts
+        top_level = document if isinstance(document, dict) else {}
+        for key, expected_value in (json_check or {}).items():
+            if key not in top_level or top_level[key] != expected_value:
+                alerts.append(f"'{key}' does not match expected value. Expected: {expected_value}, Got: {top_level.get(key)}")
+        for path, expected_value in (json_path or {}).items():
+            matches = find(document, parse_json_path(path))
+            if not matches:
+                alerts.append(f"URL '{name}' is up, but '{path}' matched nothing in the response.")
+            elif any(match != expected_value for match in matches):
+                got = matches[0] if len(matches) == 1 else matches
+                alerts.append(f"'{path}' does not match expected value. Expected: {expected_value}, Got: {got}")
+    return alerts
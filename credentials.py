@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+# Tokens are renewed this long before they expire, so a check never starts with one about to lapse
+REFRESH_MARGIN_SECONDS = 300
+# A Fernet key (see `cryptography.fernet.Fernet.generate_key`) for encrypting the token cache
+# where the OS offers no protected storage
+CACHE_KEY_ENV = 'ARGUS_TOKEN_CACHE_KEY'
+
+@dataclass(frozen=True, slots=True)
+class TenantSettings:
+    """An [Azure.Tenant.<name>] section: the subscriptions of one tenant and, optionally, a service principal for it."""
+    name: str
+    tenant_id: str
+    subscriptions: tuple = ()
+    client_id: str = None
+    client_secret: str = None
+    certificate_path: str = None
+
+class _FernetPersistence:
+    """Token cache file encrypted with a key from the environment."""
+    def __init__(self, path, key):
+        from cryptography.fernet import Fernet
+        self.path = path
+        self._fernet = Fernet(key)
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            return self._fernet.decrypt(f.read()).decode()
+
+    def save(self, content):
+        _write_private(self.path, self._fernet.encrypt(content.encode()))
+
+class _PlainPersistence:
+    """Token cache file readable only by the current user, for hosts without any encryption option."""
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        with open(self.path) as f:
+            return f.read()
+
+    def save(self, content):
+        _write_private(self.path, content.encode())
+
+def _write_private(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _open_persistence(path, allow_unencrypted):
+    """Returns (persistence, description) for the best protected storage available, or (None, reason)."""
+    try:
+        from msal_extensions import build_encrypted_persistence
+        persistence = build_encrypted_persistence(path)
+        # libsecret only fails on first use, e.g. on a server without a keyring daemon
+        if hasattr(persistence, 'trial_run'):
+            persistence.trial_run()
+        return persistence, "OS-protected storage"
+    except Exception as e:
+        os_error = str(e).strip().splitlines()[0] if str(e).strip() else e.__class__.__name__
+    key = os.environ.get(CACHE_KEY_ENV)
+    if key:
+        try:
+            return _FernetPersistence(path, key.encode()), f"a file encrypted with the {CACHE_KEY_ENV} key"
+        except Exception as e:
+            logging.warning(f"Ignoring {CACHE_KEY_ENV}: {e}")
+    if allow_unencrypted:
+        return _PlainPersistence(path), "an unencrypted file readable only by this user"
+    return None, f"no OS-protected storage ({os_error}) and no {CACHE_KEY_ENV} set"
+
+class TokenCache:
+    """Access tokens kept between runs, so short-lived runs don't acquire a new token every time.
+
+    Tokens are stored in the OS's protected storage where there is one
+    (DPAPI on Windows, Keychain on macOS, libsecret on Linux), otherwise in
+    a file encrypted with the key in ARGUS_TOKEN_CACHE_KEY, and only with
+    `allow_unencrypted` in a plain file. Failing all of these they are kept
+    in memory for this run only.
+    """
+    def __init__(self, path, allow_unencrypted=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._persistence, where = _open_persistence(path, allow_unencrypted)
+        if self._persistence is None:
+            # The usual case on a Linux server without a keyring, so not worth a warning on every cron run
+            logging.info(f"Azure tokens are not cached between runs: {where}. Set {CACHE_KEY_ENV} to a Fernet key, "
+                         f"or allow_unencrypted_token_cache = true in [Azure], to cache them.")
+        else:
+            logging.debug(f"Caching Azure tokens in {where}.")
+        self._tokens = self._load()
+
+    def _load(self):
+        if self._persistence is None:
+            return {}
+        try:
+            tokens = json.loads(self._persistence.load())
+        except Exception:
+            # Missing, or written with a different key or by another user
+            return {}
+        now = time.time()
+        return {key: entry for key, entry in tokens.items() if entry.get('expires_on', 0) > now}
+
+    def get(self, key):
+        """Returns (token, expires_on) if a token that stays valid for the refresh margin is cached, else None."""
+        with self._lock:
+            entry = self._tokens.get(key)
+        if entry and entry['expires_on'] - REFRESH_MARGIN_SECONDS > time.time():
+            return entry['token'], entry['expires_on']
+        return None
+
+    def put(self, key, token, expires_on):
+        """Stores a freshly acquired token and writes it through, merging with other processes' tokens."""
+        with self._lock:
+            self._tokens[key] = {'token': token, 'expires_on': expires_on}
+            if self._persistence is None:
+                return
+            try:
+                from msal_extensions import CrossPlatLock
+                with CrossPlatLock(f"{self.path}.lockfile"):
+                    merged = self._load()
+                    merged.update(self._tokens)
+                    self._tokens = merged
+                    self._persistence.save(json.dumps(merged))
+            except Exception as e:
+                logging.warning(f"Could not save the Azure token cache to {self.path}: {e}")
+
+class CachingCredential:
+    """Token credential that serves tokens from a `TokenCache` and requests them for a fixed tenant.
+
+    Concurrent requests for the same token wait for one acquisition instead
+    of each starting the (often slow) CLI or managed identity chain.
+    `identity` tells apart credentials that share a tenant, e.g. two
+    service principals.
+    """
+    def __init__(self, credential, cache=None, tenant_id=None, identity='default'):
+        self.credential = credential
+        self.cache = cache
+        self.tenant_id = tenant_id
+        self.identity = identity
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key(self, scopes, tenant_id, kwargs):
+        cae = 'cae' if kwargs.get('enable_cae') else ''
+        return '|'.join([self.identity, tenant_id or '', ' '.join(sorted(scopes)), cae])
+
+    def _cached(self, key):
+        entry = self._memory.get(key)
+        if entry and entry[1] - REFRESH_MARGIN_SECONDS > time.time():
+            return entry
+        if self.cache:
+            entry = self.cache.get(key)
+            if entry:
+                self._memory[key] = entry
+            return entry
+        return None
+
+    def get_token(self, *scopes, claims=None, tenant_id=None, **kwargs):
+        from azure.core.credentials import AccessToken
+        tenant_id = tenant_id or self.tenant_id
+        if tenant_id:
+            kwargs['tenant_id'] = tenant_id
+        if claims:
+            # A claims challenge (e.g. continuous access evaluation) always needs a new token
+            return self.credential.get_token(*scopes, claims=claims, **kwargs)
+        key = self._key(scopes, tenant_id, kwargs)
+        entry = self._cached(key)
+        if entry is None:
+            with self._lock:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            with key_lock:
+                entry = self._cached(key)
+                if entry is None:
+                    token = self.credential.get_token(*scopes, **kwargs)
+                    entry = (token.token, token.expires_on)
+                    self._memory[key] = entry
+                    if self.cache:
+                        self.cache.put(key, *entry)
+        return AccessToken(*entry)
+
+    def close(self):
+        close = getattr(self.credential, 'close', None)
+        if close:
+            close()
+
+class CredentialProvider:
+    """Hands out one shared, cached credential per tenant and maps subscriptions to their tenant.
+
+    Subscriptions listed in a tenant's settings use that tenant's credential:
+    its service principal if one is configured, otherwise `default_credential`
+    asked for a token in that tenant. All other subscriptions use
+    `default_credential` in `default_tenant` (its home tenant if None).
+    Monitors of one tenant share a credential, so they also share the SDK
+    clients built on it.
+    """
+    def __init__(self, default_credential, cache=None, default_tenant=None, tenants=()):
+        self.default = CachingCredential(default_credential, cache, default_tenant)
+        self._by_subscription = {}
+        self._credentials = [self.default]
+        for tenant in tenants:
+            credential = CachingCredential(self._tenant_credential(tenant, default_credential), cache, tenant.tenant_id,
+                                           identity=tenant.client_id or 'default')
+            self._credentials.append(credential)
+            for subscription_id in tenant.subscriptions:
+                self._by_subscription[subscription_id.lower()] = credential
+
+    @staticmethod
+    def _tenant_credential(tenant, default_credential):
+        if tenant.client_id and tenant.certificate_path:
+            from azure.identity import CertificateCredential
+            return CertificateCredential(tenant.tenant_id, tenant.client_id, tenant.certificate_path)
+        if tenant.client_id and tenant.client_secret:
+            from azure.identity import ClientSecretCredential
+            return ClientSecretCredential(tenant.tenant_id, tenant.client_id, tenant.client_secret)
+        return default_credential
+
+    def for_subscription(self, subscription_id):
+        """Returns the credential for a subscription."""
+        return self._by_subscription.get((subscription_id or '').lower(), self.default)
+
+    def group_subscriptions(self, subscription_ids):
+        """Returns a dict of credential -> the given subscriptions it is used for."""
+        groups = {}
+        for subscription_id in subscription_ids:
+            groups.setdefault(self.for_subscription(subscription_id), []).append(subscription_id)
+        return groups
+
+    def close(self):
+        for credential in self._credentials:
+            try:
+                credential.close()
+            except Exception:
+                pass
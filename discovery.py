@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from azure.core.exceptions import AzureError
+import clients
+import resilience
+import telemetry
+
+VM_QUERY = """Resources
+| where type =~ 'microsoft.compute/virtualmachines'
+| project id, name, resourceGroup, location, subscriptionId,
+    powerState = tostring(properties.extended.instanceView.powerState.displayStatus)"""
+
+SQL_MI_QUERY = """Resources
+| where type =~ 'microsoft.sql/managedinstances'
+| project id, name, resourceGroup, location, subscriptionId,
+    state = tostring(properties.state)"""
+
+# Resource Graph returns at most 1000 rows per page
+PAGE_SIZE = 1000
+
+class ResourceInventory:
+    """Inventory of VMs and SQL managed instances discovered through Azure Resource Graph.
+
+    A refresh costs one paged Resource Graph query per resource type and
+    tenant, covering all of the tenant's subscriptions, instead of one
+    instance_view call per VM. The
+    result is cached on disk so short-lived runs reuse it until it is older
+    than `refresh_minutes`.
+    """
+    def __init__(self, credentials, subscription_ids, cache_path, refresh_minutes=5):
+        self.credentials = credentials
+        self.subscription_ids = list(subscription_ids)
+        self.cache_path = cache_path
+        self.refresh_seconds = refresh_minutes * 60
+        self.vms = []
+        self.managed_instances = []
+        self.fetched_at = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if sorted(data.get('subscriptions', [])) == sorted(self.subscription_ids):
+            self.vms = data.get('vms', [])
+            self.managed_instances = data.get('managed_instances', [])
+            self.fetched_at = data.get('fetched_at', 0)
+
+    def _save(self):
+        data = {
+            'subscriptions': self.subscription_ids,
+            'fetched_at': self.fetched_at,
+            'vms': self.vms,
+            'managed_instances': self.managed_instances,
+        }
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logging.warning(f"Could not save resource inventory to {self.cache_path}: {e}")
+
+    @property
+    def is_stale(self):
+        return time.time() - self.fetched_at >= self.refresh_seconds
+
+    def refresh(self, force=False):
+        """Re-queries Resource Graph if the inventory is stale. Returns True if it was refreshed."""
+        with self._lock:
+            if not force and not self.is_stale:
+                return False
+            try:
+                vms = self._query(VM_QUERY)
+                managed_instances = self._query(SQL_MI_QUERY)
+            except (AzureError, resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+                logging.warning(f"Resource discovery failed, keeping the previous inventory: {e}")
+                return False
+            self.vms, self.managed_instances = vms, managed_instances
+            self.fetched_at = time.time()
+            self._save()
+            logging.debug(f"Discovered {len(vms)} VMs and {len(managed_instances)} SQL managed instances.")
+            return True
+
+    def _query(self, query):
+        rows = []
+        for credential, subscription_ids in self.credentials.group_subscriptions(self.subscription_ids).items():
+            rows.extend(self._query_tenant(query, credential, subscription_ids))
+        return rows
+
+    def _query_tenant(self, query, credential, subscription_ids):
+        from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
+        client = clients.get_resource_graph_client(credential)
+        # Resource Graph throttles each tenant on its own, so each gets its own rate limit and breaker
+        key = resilience.host_key(f"{credential.tenant_id or 'default'}.resourcegraph")
+        rows = []
+        skip_token = None
+        while True:
+            request = QueryRequest(
+                subscriptions=subscription_ids,
+                query=query,
+                options=QueryRequestOptions(top=PAGE_SIZE, skip_token=skip_token)
+            )
+            with telemetry.timed(telemetry.AZURE_REQUEST, operation='resource_graph'):
+                response = resilience.call(key, lambda: client.resources(request), clients.is_transient_azure_error)
+            rows.extend(response.data)
+            skip_token = response.skip_token
+            if not skip_token:
+                return rows
+
+    def resources_by_id(self):
+        """Returns a dict of lower-cased resource ID -> inventory row for all resources."""
+        return {row['id'].lower(): row for row in self.vms + self.managed_instances}
+
+class InventoryPrefetcher:
+    """Engine prefetcher that hands discovered state to SQL and VM monitors.
+
+    VMs get their power state, so `_check_vm_status` skips instance_view, SQL
+    managed instances get their provisioning state, and monitors without a
+    configured region get one, which lets the metrics batcher group them.
+    """
+    def __init__(self, inventory):
+        self.inventory = inventory
+
+    async def prefetch_async(self, monitors):
+        await asyncio.to_thread(self.inventory.refresh)
+        resources = self.inventory.resources_by_id()
+        for monitor in monitors:
+            row = resources.get(getattr(monitor, 'resource_id', '').lower())
+            if row is None:
+                continue
+            if not monitor.location:
+                monitor.location = row['location']
+            if row.get('powerState') and hasattr(monitor, 'set_power_state'):
+                monitor.set_power_state(row['powerState'])
+            elif row.get('state') and hasattr(monitor, 'set_state'):
+                monitor.set_state(row['state'])
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import resilience
+import telemetry
+
+DEFAULT_MAX_CONCURRENCY = 64
+
+# Returned for a check skipped because a section it depends on is down
+SKIPPED = object()
+
+def get_monitor_type(section):
+    """Returns the monitor type (e.g. 'URL', 'VM') of a 'Monitors.<TYPE>.<name>' section."""
+    return section.split('.')[1]
+
+class _DaemonThreadPool(ThreadPoolExecutor):
+    """Thread pool for blocking checks whose threads don't keep the process alive.
+
+    `ThreadPoolExecutor` joins its threads when the interpreter exits, so a
+    check hung in a blocking SDK call would hold a one-shot run open past its
+    deadline. Checks still running when the process exits are abandoned.
+    Threads are started on demand, up to `max_workers`. It only subclasses
+    `ThreadPoolExecutor` because asyncio's default executor must be one;
+    none of its implementation is used.
+    """
+    def __init__(self, max_workers, thread_name_prefix):
+        # ThreadPoolExecutor.__init__ is deliberately not called
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._queue = queue.SimpleQueue()
+        self._threads = []
+        self._idle = threading.Semaphore(0)
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = Future()
+            self._queue.put((future, fn, args, kwargs))
+            if not self._idle.acquire(blocking=False) and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, name=f"{self.thread_name_prefix}_{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            del item, future, fn, args, kwargs
+            self._idle.release()
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        future, *_ = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    future.cancel()
+            for _ in self._threads:
+                self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+class CheckEngine:
+    """Runs monitor checks concurrently on a single asyncio event loop.
+
+    Every monitor exposes an async `check_async` (see `monitors.base.Monitor`).
+    Monitors built on blocking SDKs run their sync checks on a pool of daemon
+    threads sized to the global limit, so the number of OS threads is bounded
+    no matter how many sections exist, and a hung check never keeps the
+    process from exiting.
+    Prefetchers (such as the metrics batcher) run before each set of checks.
+    With a `run_deadline`, a run returns after that many seconds no matter
+    how many targets hang: unfinished checks are reported as alerts, and
+    retries and rate limit waits inside the checks stop at the deadline.
+    A monitor's `depends_on` sections run before it; while one of them is
+    down (in this run, or at its last check if it isn't part of this run)
+    the check is skipped and left out of the results, so its alerts neither
+    fire nor resolve. A skipped section counts as down for its own dependents.
+    """
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, type_limits=None, prefetchers=None, run_deadline=None):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.run_deadline = run_deadline or None
+        self.type_limits = {t.upper(): max(1, int(n)) for t, n in (type_limits or {}).items()}
+        self.prefetchers = list(prefetchers or [])
+        self._executor = None
+        self._loop = None
+        self._global_limit = None
+        self._type_semaphores = {}
+        self._down = {}
+
+    def _bind_loop(self):
+        """Creates the semaphores and thread pool for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._global_limit = asyncio.Semaphore(self.max_concurrency)
+            self._type_semaphores = {t: asyncio.Semaphore(n) for t, n in self.type_limits.items()}
+            if self._executor is None:
+                self._executor = _DaemonThreadPool(self.max_concurrency, "argus-check")
+            loop.set_default_executor(self._executor)
+
+    async def run_check(self, section, monitor):
+        """Runs a single monitor under the global and per-type limits and returns its alerts."""
+        self._bind_loop()
+        monitor_type = get_monitor_type(section)
+        type_limit = self._type_semaphores.get(monitor_type)
+        async with self._global_limit:
+            if type_limit:
+                async with type_limit:
+                    return await self._run_monitor(section, monitor_type, monitor)
+            return await self._run_monitor(section, monitor_type, monitor)
+
+    async def _run_monitor(self, section, monitor_type, monitor):
+        start = time.perf_counter()
+        try:
+            return await monitor.check_async() or []
+        except Exception as e:
+            return [f"Error running monitor {monitor.__class__.__name__}: {e}"]
+        finally:
+            duration = time.perf_counter() - start
+            telemetry.CHECK_DURATION.observe(duration, type=monitor_type)
+            telemetry.CHECK_LAST_DURATION.set(duration, section=section)
+
+    async def _run_after_parents(self, section, monitor, tasks, waiting):
+        """Runs a check once the checks it depends on finished, or returns SKIPPED if one of them is down."""
+        parents = [parent for parent in getattr(monitor, 'depends_on', ()) if parent != section]
+        running = [tasks[parent] for parent in parents if parent in tasks]
+        if running:
+            waiting.add(section)
+            await asyncio.wait(running)
+            waiting.discard(section)
+        down = next((parent for parent in parents if self._down.get(parent)), None)
+        if down:
+            logging.info(f"Skipping {section}: {down} is down.")
+            self._down[section] = True
+            telemetry.CHECK_SKIPPED.set(1, section=section)
+            return SKIPPED
+        if parents:
+            telemetry.CHECK_SKIPPED.set(0, section=section)
+        alerts = await self.run_check(section, monitor)
+        self._down[section] = bool(getattr(monitor, 'down', False))
+        return alerts
+
+    async def run_async(self, monitors):
+        """Runs every monitor in `monitors` (section -> monitor) and returns a dict of section -> alerts, without skipped sections."""
+        self._bind_loop()
+        start = time.perf_counter()
+        sections = list(monitors)
+        token = resilience.set_deadline(self.run_deadline)
+        try:
+            for prefetcher in self.prefetchers:
+                try:
+                    await asyncio.wait_for(prefetcher.prefetch_async(list(monitors.values())), resilience.remaining())
+                except asyncio.TimeoutError:
+                    logging.warning(f"Prefetch by {prefetcher.__class__.__name__} did not finish before the run deadline.")
+                except Exception as e:
+                    logging.warning(f"Prefetch by {prefetcher.__class__.__name__} failed: {e}")
+            # Checks wait for the tasks of their parents, which all exist by the time any of them starts
+            tasks = {}
+            waiting = set()
+            for section in sections:
+                tasks[section] = asyncio.ensure_future(self._run_after_parents(section, monitors[section], tasks, waiting))
+            if tasks:
+                await asyncio.wait(tasks.values(), timeout=resilience.remaining())
+        finally:
+            resilience.reset_deadline(token)
+        results = {}
+        for section, task in tasks.items():
+            if task.done():
+                if task.result() is not SKIPPED:
+                    results[section] = task.result()
+            elif section in waiting:
+                # Its parent ran out of time; the parent's own result says so
+                task.cancel()
+            else:
+                # A blocking check keeps its thread until its own timeout, but the run moves on
+                task.cancel()
+                results[section] = [f"Check {section} did not finish within the {self.run_deadline:.0f}s run deadline."]
+        telemetry.RUN_DURATION.observe(time.perf_counter() - start)
+        logging.debug(f"Engine finished {len(sections)} checks.")
+        return results
+
+    def run(self, monitors):
+        """Sync entry point: runs all monitors on a fresh event loop.
+
+        Unlike `asyncio.run`, this doesn't join the thread pool, so checks
+        still blocked in a hung SDK call after the run deadline don't hold
+        up the return. Their threads are daemon threads, so they don't hold
+        up the exit of the process either.
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.run_async(monitors))
+        finally:
+            try:
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                executor, self._executor = self._executor, None
+                if executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                loop.close()
+
+    def shutdown(self):
+        """Releases the worker threads used for blocking checks."""
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
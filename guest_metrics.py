@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from azure.core.exceptions import AzureError
+import clients
+import resilience
+import telemetry
+
+# Azure Monitor Agent / VM insights send guest counters every minute
+GUEST_METRICS_TIMESPAN = timedelta(minutes=15)
+# Keeps the `_ResourceId in~ (...)` filter of one query well within the Logs API's request size
+QUERY_BATCH_SIZE = 200
+
+DISK_NAMESPACE, DISK_FREE_MB = "LogicalDisk", "FreeSpaceMB"
+MEMORY_NAMESPACE, MEMORY_AVAILABLE_MB = "Memory", "AvailableMB"
+
+# Latest free space per mount and available memory of each VM, one row per VM and counter
+GUEST_METRICS_QUERY = """InsightsMetrics
+| where _ResourceId in~ ({resource_ids})
+| where (Namespace == "{disk_namespace}" and Name == "{disk_name}") or (Namespace == "{memory_namespace}" and Name == "{memory_name}")
+| extend Mount = tostring(parse_json(Tags)["vm.azm.ms/mountId"])
+| summarize arg_max(TimeGenerated, Val) by _ResourceId, Namespace, Name, Mount
+| project ResourceId = tolower(_ResourceId), Namespace, Name, Mount, Val"""
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def build_query(resource_ids):
+    """Returns the KQL query for the latest guest counters of the given VMs."""
+    quoted = ", ".join(f"'{resource_id.lower()}'" for resource_id in resource_ids)
+    return GUEST_METRICS_QUERY.format(
+        resource_ids=quoted,
+        disk_namespace=DISK_NAMESPACE, disk_name=DISK_FREE_MB,
+        memory_namespace=MEMORY_NAMESPACE, memory_name=MEMORY_AVAILABLE_MB,
+    )
+
+class GuestMetrics:
+    """Latest guest counters of many VMs, stored column-wise.
+
+    `columns` maps each column of the query result (ResourceId, Namespace,
+    Name, Mount, Val) to its list of values. The rows of each VM are found
+    through an index on the lower-cased resource ID, built once per result.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self._rows = defaultdict(list)
+        for row, resource_id in enumerate(columns.get('ResourceId', ())):
+            self._rows[resource_id.lower()].append(row)
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Transposes the rows of `LogsTable`s into one set of columns."""
+        columns = {}
+        for table in tables:
+            names = [getattr(column, 'name', column) for column in table.columns]
+            for name in names:
+                columns.setdefault(name, [])
+            for row in table.rows:
+                for name, value in zip(names, row):
+                    columns[name].append(value)
+        return cls(columns)
+
+    def __len__(self):
+        return len(self.columns.get('ResourceId', ()))
+
+    def values(self, resource_id, namespace, name):
+        """Returns a dict of mount (empty for VM-wide counters) -> latest value of one counter of a VM."""
+        namespaces, names = self.columns['Namespace'], self.columns['Name']
+        mounts, values = self.columns['Mount'], self.columns['Val']
+        return {
+            mounts[row]: values[row]
+            for row in self._rows.get(resource_id.lower(), ())
+            if namespaces[row] == namespace and names[row] == name and values[row] is not None
+        }
+
+    def covers(self, resource_id):
+        """Returns True if the result has any counter of the VM."""
+        return resource_id.lower() in self._rows
+
+class GuestMetricsCollector:
+    """Prefetches guest disk and memory counters of VM monitors from Log Analytics.
+
+    Guest counters aren't platform metrics, so they come from the
+    InsightsMetrics table that Azure Monitor Agent (VM insights) writes to a
+    workspace. Monitors are grouped by their `workspace_id`, and each group
+    is fetched with one KQL query per cycle (per 200 VMs), instead of one
+    call per VM. Each monitor is handed the result; monitors whose query
+    failed query their workspace individually when they run.
+    """
+    def __init__(self, batch_size=QUERY_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def group_monitors(self, monitors):
+        """Returns a dict of (workspace ID, credential) -> monitors for all monitors with a workspace."""
+        groups = defaultdict(list)
+        for monitor in monitors:
+            workspace_id = getattr(monitor, 'workspace_id', None)
+            if workspace_id:
+                groups[(workspace_id.lower(), monitor.credential)].append(monitor)
+        return groups
+
+    async def prefetch_async(self, monitors):
+        """Runs one query per workspace chunk concurrently and fans the results out."""
+        groups = self.group_monitors(monitors)
+        jobs = []
+        for (workspace_id, credential), members in groups.items():
+            for chunk in _chunks(members, self.batch_size):
+                jobs.append(asyncio.to_thread(self._query_workspace, workspace_id, credential, chunk))
+        if jobs:
+            logging.debug(f"Prefetching guest metrics for {sum(map(len, groups.values()))} VMs in {len(jobs)} Log Analytics queries.")
+            await asyncio.gather(*jobs)
+
+    def _query_workspace(self, workspace_id, credential, monitors):
+        metrics = query_workspace(workspace_id, credential, [monitor.resource_id for monitor in monitors])
+        if metrics is None:
+            return
+        for monitor in monitors:
+            monitor.set_guest_metrics(metrics)
+
+def query_workspace(workspace_id, credential, resource_ids):
+    """Returns the latest guest counters of the given VMs from one workspace, or None if the query failed."""
+    from azure.monitor.query import LogsQueryStatus
+    query = build_query(resource_ids)
+    try:
+        with telemetry.timed(telemetry.AZURE_REQUEST, operation='guest_metrics'):
+            # Each workspace is throttled on its own, so it gets its own rate limit and breaker
+            response = resilience.call(resilience.host_key(f"{workspace_id}.loganalytics"), lambda: clients.get_logs_query_client(credential).query_workspace(
+                workspace_id, query, timespan=GUEST_METRICS_TIMESPAN
+            ), clients.is_transient_azure_error)
+    except (AzureError, resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+        logging.warning(f"  -> Guest metrics query of workspace {workspace_id} for {len(resource_ids)} VMs failed: {e}")
+        return None
+    if response.status == LogsQueryStatus.PARTIAL:
+        logging.warning(f"  -> Guest metrics query of workspace {workspace_id} returned partial results: {response.partial_error}")
+        tables = response.partial_data
+    else:
+        tables = response.tables
+    metrics = GuestMetrics.from_tables(tables)
+    logging.debug(f"  -> {len(metrics)} guest counters from workspace {workspace_id}")
+    return metrics
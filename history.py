@@ -0,0 +1,226 @@
+import bisect
+import itertools
+import json
+import logging
+import math
+import os
+import statistics
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+
+DEFAULT_RETENTION_DAYS = 14
+DEFAULT_RAW_HOURS = 24
+DEFAULT_DOWNSAMPLE_MINUTES = 60
+FORMAT_VERSION = 1
+
+class Series:
+    """One metric of one resource as parallel arrays of timestamps and values."""
+    __slots__ = ('timestamps', 'values')
+
+    def __init__(self, timestamps=None, values=None):
+        self.timestamps = timestamps if timestamps is not None else array('d')
+        self.values = values if values is not None else array('d')
+
+    def append(self, points):
+        """Adds (timestamp, value) points in time order. Returns True if anything changed.
+
+        A point at the last stored timestamp replaces it, since Azure keeps
+        updating the newest time grain until it closes.
+        """
+        changed = False
+        for timestamp, value in points:
+            if value is None:
+                continue
+            if self.timestamps and timestamp <= self.timestamps[-1]:
+                if timestamp == self.timestamps[-1] and self.values[-1] != value:
+                    self.values[-1] = value
+                    changed = True
+                continue
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+            changed = True
+        return changed
+
+    def since(self, start):
+        """Returns (timestamps, values) of the points at or after `start`."""
+        i = bisect.bisect_left(self.timestamps, start)
+        return self.timestamps[i:], self.values[i:]
+
+    def compact(self, retain_from, downsample_before, bucket_seconds):
+        """Drops points older than `retain_from` and averages points older than `downsample_before` per bucket."""
+        start = bisect.bisect_left(self.timestamps, retain_from)
+        split = max(start, bisect.bisect_left(self.timestamps, downsample_before))
+        timestamps, values = array('d'), array('d')
+        old_timestamps, old_values = self.timestamps[start:split], self.values[start:split]
+        for bucket, indexes in itertools.groupby(range(len(old_timestamps)), key=lambda i: old_timestamps[i] // bucket_seconds):
+            indexes = list(indexes)
+            timestamps.append(bucket * bucket_seconds)
+            values.append(math.fsum(old_values[i] for i in indexes) / len(indexes))
+        timestamps.extend(self.timestamps[split:])
+        values.extend(self.values[split:])
+        self.timestamps, self.values = timestamps, values
+
+def consecutive_at_or_above(values, threshold, count):
+    """Returns True if the last `count` values are all at or above `threshold`."""
+    return count > 0 and len(values) >= count and min(values[-count:]) >= threshold
+
+def seconds_until(timestamps, values, target):
+    """Returns the seconds from the last sample until a linear fit of the series reaches `target`.
+
+    Returns None if there are too few samples or the series isn't moving
+    towards `target`, and 0 if the fit has already reached it.
+    """
+    if len(values) < 3 or timestamps[-1] <= timestamps[0]:
+        return None
+    # Offset the timestamps so the fit isn't computed on ~1.7e9 second values
+    origin = timestamps[0]
+    slope, intercept = statistics.linear_regression([t - origin for t in timestamps], values)
+    if slope <= 0:
+        return None
+    return max(0.0, (target - intercept) / slope - (timestamps[-1] - origin))
+
+def _timestamp(value):
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+class MetricHistory:
+    """Local time-series store of every Azure Monitor datapoint fetched by the SQL and VM monitors.
+
+    Keeping datapoints between runs lets the monitors ask Azure only for the
+    time grains since the last stored one and evaluate trends over a longer
+    window than a single query returns. Points older than `raw_hours` are
+    averaged into `downsample_minutes` buckets, and points older than
+    `retention_days` are dropped. The store is saved as a small JSON index
+    followed by the raw arrays.
+    """
+    def __init__(self, path, retention_days=DEFAULT_RETENTION_DAYS, raw_hours=DEFAULT_RAW_HOURS,
+                 downsample_minutes=DEFAULT_DOWNSAMPLE_MINUTES):
+        self.path = path
+        self.retention_seconds = retention_days * 86400
+        self.raw_seconds = raw_hours * 3600
+        self.bucket_seconds = downsample_minutes * 60
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._compacted_at = 0.0
+        self._series = {}
+        self._load()
+
+    @staticmethod
+    def _key(resource_id, metric_name):
+        return f"{resource_id.lower()}|{metric_name}"
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                index = json.loads(f.readline())
+                if index.get('version') != FORMAT_VERSION:
+                    return
+                swap = index.get('byteorder') != sys.byteorder
+                for key, count in index['series']:
+                    timestamps, values = array('d'), array('d')
+                    timestamps.fromfile(f, count)
+                    values.fromfile(f, count)
+                    if swap:
+                        timestamps.byteswap()
+                        values.byteswap()
+                    self._series[key] = Series(timestamps, values)
+                self._compacted_at = index.get('compacted_at', 0.0)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, EOFError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable metric history {self.path}: {e}")
+            self._series = {}
+
+    def append(self, resource_id, metric_name, points):
+        """Stores (timestamp, value) points of one metric; timestamps may be datetimes or epoch seconds."""
+        points = [(_timestamp(timestamp), value) for timestamp, value in points]
+        with self._lock:
+            series = self._series.setdefault(self._key(resource_id, metric_name), Series())
+            if series.append(points):
+                self._dirty = True
+
+    def record(self, resource_id, metrics_data):
+        """Stores every datapoint of a dict of metric name -> Azure Monitor `Metric`."""
+        for name, metric in metrics_data.items():
+            if metric.timeseries:
+                self.append(resource_id, name, ((point.timestamp, point.average) for point in metric.timeseries[0].data))
+
+    def last_timestamp(self, resource_id, metric_names):
+        """Returns the newest timestamp stored for all of `metric_names`, or None if one has no data."""
+        with self._lock:
+            last = []
+            for name in metric_names:
+                series = self._series.get(self._key(resource_id, name))
+                if not series or not series.timestamps:
+                    return None
+                last.append(series.timestamps[-1])
+        return min(last)
+
+    def query_start(self, resource_id, metric_names, max_window, min_window, now=None):
+        """Returns the UTC start of the next metrics query: the last stored time grain, bounded by the windows.
+
+        `max_window` and `min_window` are timedeltas; the newest stored grain is
+        fetched again because Azure may still have been filling it.
+        """
+        now = now or time.time()
+        start = now - max_window.total_seconds()
+        last = self.last_timestamp(resource_id, metric_names)
+        if last is not None:
+            start = min(max(start, last), now - min_window.total_seconds())
+        return datetime.fromtimestamp(start, timezone.utc)
+
+    def window(self, resource_id, metric_name, seconds, now=None):
+        """Returns (timestamps, values) of one metric over the last `seconds`."""
+        now = now or time.time()
+        with self._lock:
+            series = self._series.get(self._key(resource_id, metric_name))
+            if not series:
+                return array('d'), array('d')
+            return series.since(now - seconds)
+
+    def latest(self, resource_id, metric_name, max_age, now=None):
+        """Returns the newest value of a metric if it is at most `max_age` seconds old, else None."""
+        timestamps, values = self.window(resource_id, metric_name, max_age, now)
+        return values[-1] if values else None
+
+    def compact(self, now=None):
+        """Applies retention and downsampling to every series."""
+        now = now or time.time()
+        retain_from = now - self.retention_seconds
+        # Only whole buckets are downsampled, so compacting again doesn't change them
+        downsample_before = (now - self.raw_seconds) // self.bucket_seconds * self.bucket_seconds
+        with self._lock:
+            for key in list(self._series):
+                series = self._series[key]
+                series.compact(retain_from, downsample_before, self.bucket_seconds)
+                if not series.timestamps:
+                    del self._series[key]
+            self._compacted_at = now
+            self._dirty = True
+
+    def save(self):
+        """Writes the history to disk if it changed, compacting it at most once per bucket."""
+        if time.time() - self._compacted_at >= self.bucket_seconds:
+            self.compact()
+        with self._lock:
+            if not self._dirty:
+                return
+            index = {
+                'version': FORMAT_VERSION,
+                'byteorder': sys.byteorder,
+                'compacted_at': self._compacted_at,
+                'series': [[key, len(series.timestamps)] for key, series in self._series.items()],
+            }
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(json.dumps(index).encode() + b"\n")
+                    for series in self._series.values():
+                        series.timestamps.tofile(f)
+                        series.values.tofile(f)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                logging.warning(f"Could not save metric history to {self.path}: {e}")
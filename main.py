@@ -1,33 +1,279 @@
 import config_manager
 import updater
-from monitors.sql_monitor import SqlMonitor
-from monitors.url_monitor import UrlMonitor
-from monitors.ssl_monitor import SSLMonitor
-from monitors.vm_monitor import VmMonitor
 import alerter
-import json
-from azure.identity import DefaultAzureCredential
-from azure.core.exceptions import ClientAuthenticationError
-import threading
-import queue
+import telemetry
+import resilience
+import config_model
+import offload
+from engine import CheckEngine
+from scheduler import Scheduler
+from ssl_cache import SSLCache
+from url_cache import UrlCache
+from history import MetricHistory
+from alert_state import AlertStore
+from monitors import registry
+from monitors.base import MonitorContext
+import argparse
+import asyncio
 import logging
+import multiprocessing
 
-def run_monitor_in_thread(monitor_instance, alerts_queue):
-    """Wrapper function to run a monitor's check method in a thread and put results into a queue."""
+# The registry imports monitor modules, and with them the Azure SDKs and requests, only
+# when a config section needs them, so that e.g. a URL-only config doesn't pay for loading Azure.
+
+# Types whose monitors resource discovery creates
+DISCOVERED_TYPES = ('VM', 'SQL')
+
+def monitor_types(config, specs):
+    """Returns the monitor types in use: those of the compiled sections, plus the discovered ones."""
+    discovery_enabled, _, _ = config_manager.get_discovery_settings(config)
+    types = [spec.type for spec in specs.values()]
+    if discovery_enabled:
+        types.extend(DISCOVERED_TYPES)
+    return list(dict.fromkeys(types))
+
+def needs_azure(config, specs):
+    """Returns True if any configured monitor or discovery needs Azure credentials."""
+    return any(registry.get(monitor_type).REQUIRES_CREDENTIAL for monitor_type in monitor_types(config, specs))
+
+def configure_types(config, types, configured):
+    """Applies the global settings of each type not in `configured` yet, and adds it there."""
+    for monitor_type in types:
+        if monitor_type not in configured:
+            registry.get(monitor_type).configure(config)
+            configured.add(monitor_type)
+
+def create_prefetchers(types, context):
+    """Returns one prefetcher of each kind the given monitor types batch their work with."""
+    prefetchers = {}
+    for monitor_type in types:
+        monitor_class = registry.get(monitor_type)
+        if monitor_class.REQUIRES_CREDENTIAL and not context.credentials:
+            continue
+        for prefetcher in monitor_class.create_prefetchers(context):
+            # e.g. SQL and VM monitors share one metrics batcher
+            prefetchers.setdefault(type(prefetcher), prefetcher)
+    return list(prefetchers.values())
+
+def get_azure_credentials(config):
+    """Returns a `credentials.CredentialProvider` for the configured tenants, or None if authentication failed."""
+    from azure.identity import DefaultAzureCredential
+    from azure.core.exceptions import ClientAuthenticationError
+    from credentials import CredentialProvider, TokenCache
+    try:
+        tenants = config_manager.get_tenant_settings(config)
+    except ValueError as e:
+        logging.error(f"Invalid tenant settings: {e}")
+        return None
+    token_cache = None
+    cache_enabled, allow_unencrypted = config_manager.get_token_cache_settings(config)
+    if cache_enabled:
+        token_cache = TokenCache(config_manager.get_token_cache_path(), allow_unencrypted)
+    try:
+        # Tokens for other tenants are requested with the signed-in identity unless a tenant has its own principal
+        credential = DefaultAzureCredential(additionally_allowed_tenants=['*'])
+        logging.debug("Authentication successful.")
+    except ClientAuthenticationError as e:
+        logging.warning(f"Authentication failed: {e}")
+        # For URL checks, we don't need to exit if Azure auth fails
+        return None
+    default_tenant = config.get('Azure', 'tenant_id', fallback=None) or None
+    return CredentialProvider(credential, token_cache, default_tenant, tenants)
+
+def build_monitor(spec, context):
+    """Creates the monitor for one compiled section spec, or returns None if it can't run."""
+    monitor_class = registry.get(spec.type)
+    if monitor_class.REQUIRES_CREDENTIAL and not context.credentials:
+        logging.warning(f"Skipping {spec.type} monitors due to authentication failure.")
+        return None
+    monitor = monitor_class.from_spec(spec, context)
+    monitor.depends_on = spec.depends_on
+    return monitor
+
+def build_monitors(specs, context):
+    """Creates a monitor instance for every compiled 'Monitors.*' spec and returns a dict of section -> monitor."""
+    monitors = {}
+    for section, spec in specs.items():
+        monitor = build_monitor(spec, context)
+        if monitor:
+            monitors[section] = monitor
+    return monitors
+
+def save_caches(context):
+    """Writes the shared caches of the monitors to disk."""
+    for cache in context.caches.values():
+        if cache:
+            cache.save()
+
+def build_discovered_monitors(config, credentials, inventory, configured_monitors, history=None):
+    """Creates monitors for discovered VMs and SQL managed instances that have no config section."""
+    from monitors.sql_monitor import SqlMonitor
+    from monitors.vm_monitor import VmMonitor
+    configured_ids = {getattr(m, 'resource_id', '').lower() for m in configured_monitors.values()}
+    discovery_config = config['Discovery']
+    workspace_id = discovery_config.get('workspace_id') or config.get('Azure', 'workspace_id', fallback=None)
+    monitors = {}
+    rows = [(row, True) for row in inventory.vms] + [(row, False) for row in inventory.managed_instances]
+    for row, is_vm in rows:
+        if row['id'].lower() in configured_ids:
+            continue
+        prefix = 'Monitors.VM.' if is_vm else 'Monitors.SQL.'
+        section = f"{prefix}{row['name']}"
+        if section in configured_monitors or section in monitors:
+            section = f"{prefix}{row['resourceGroup']}-{row['name']}"
+        if is_vm:
+            monitors[section] = VmMonitor(
+                credential=credentials.for_subscription(row['subscriptionId']),
+                subscription_id=row['subscriptionId'],
+                resource_group=row['resourceGroup'],
+                vm_name=row['name'],
+                config=discovery_config,
+                location=row['location'],
+                history=history,
+                workspace_id=workspace_id
+            )
+        else:
+            monitors[section] = SqlMonitor(
+                credential=credentials.for_subscription(row['subscriptionId']),
+                subscription_id=row['subscriptionId'],
+                resource_group=row['resourceGroup'],
+                instance_name=row['name'],
+                location=row['location'],
+                config=discovery_config,
+                history=history
+            )
+    return monitors
+
+def send_alerts(all_alerts, config, verbose):
+    """Formats the collected alerts into a single email and sends it."""
+    subject = "ArgusSight Monitoring Alert"
+    body = "The following alerts were triggered:\n\n" + "\n".join(all_alerts)
+    if verbose:
+        logging.info(f"\n--- Preparing Alert ---\nSubject: {subject}\nBody:\n{body}")
+    alerter.send_alert_email(subject, body, config)
+
+def run_daemon(config, monitors, engine, verbose, context=None, discover=None, metrics_textfile=None, alert_store=None,
+               specs=None, reload=None, sections=None):
+    """Keeps all monitors alive and runs each one on its own interval until interrupted.
+
+    `context` holds the caches and history saved after each batch, `specs` the compiled config sections (for their intervals), and
+    `reload` returns (compiled config, rebuilt monitors) after config.ini changed. `sections` names every monitor section
+    in config.ini, including those that could not be built; only alerts of other sections are resolved as removed.
+    """
+    specs = specs or {}
+    configured = list(specs if sections is None else sections)
+    discovered = {section: monitor for section, monitor in monitors.items() if section not in specs}
+    context = context or MonitorContext()
+    _, digest_minutes = config_manager.get_alert_settings(config)
+    digest_seconds = digest_minutes * 60
+    reload_seconds = config_manager.get_daemon_reload_seconds(config)
+
+    async def on_results(results):
+        save_caches(context)
+        if context.history:
+            await asyncio.to_thread(context.history.save)
+        if metrics_textfile:
+            telemetry.write_textfile(metrics_textfile)
+        if alert_store:
+            await asyncio.to_thread(alert_store.record, results)
+            # Sections removed from config.ini or gone from discovery no longer report; resolve their alerts
+            await asyncio.to_thread(alert_store.retire, [*configured, *discovered])
+            await asyncio.to_thread(alerter.send_digest, alert_store, config, digest_seconds, verbose)
+            return
+        all_alerts = [alert for alerts in results.values() for alert in alerts]
+        if all_alerts:
+            await asyncio.to_thread(send_alerts, all_alerts, config, verbose)
+
+    scheduler = Scheduler(engine, on_results, jitter=config_manager.get_daemon_jitter(config))
+    for section, monitor in monitors.items():
+        spec = specs.get(section)
+        scheduler.add(section, monitor, spec.interval if spec else None)
+
+    async def sync_discovered():
+        """Periodically schedules newly discovered resources and drops vanished ones."""
+        _, refresh_minutes, _ = config_manager.get_discovery_settings(config)
+        while True:
+            await asyncio.sleep(refresh_minutes * 60)
+            found = await discover()
+            for section, monitor in found.items():
+                if section not in discovered and section not in specs:
+                    logging.info(f"Discovered new resource: {section}")
+                    scheduler.add(section, monitor)
+                    discovered[section] = monitor
+            for section in [s for s in discovered if s not in found]:
+                logging.info(f"Resource no longer exists or now has a config section: {section}")
+                scheduler.remove(section)
+                del discovered[section]
+
+    async def watch_config():
+        """Applies edits to config.ini; only monitors whose section changed are rebuilt."""
+        nonlocal config, specs, configured
+        while True:
+            await asyncio.sleep(reload_seconds)
+            try:
+                reloaded = await asyncio.to_thread(reload)
+            except Exception as e:
+                logging.error(f"Could not reload config: {e}")
+                continue
+            if not reloaded:
+                continue
+            compiled, changes = reloaded
+            for section, monitor in changes.items():
+                scheduler.remove(section)
+                if monitor:
+                    scheduler.add(section, monitor, compiled.monitors[section].interval)
+            # A section added for a discovered resource replaces its discovered twin
+            configured_ids = {getattr(monitor, 'resource_id', '').lower() for monitor in changes.values() if monitor}
+            for section in [s for s, m in discovered.items() if s in changes or m.resource_id.lower() in configured_ids]:
+                if section not in changes:
+                    logging.info(f"Discovered resource now has a config section: {section}")
+                    scheduler.remove(section)
+                del discovered[section]
+            config, specs, configured = compiled.settings, compiled.monitors, compiled.sections
+            logging.info(f"Reloaded config: {len(changes)} monitor sections changed.")
+
+    async def flush_digests():
+        """Sends a pending digest once its window has passed, even if no check finishes then."""
+        while True:
+            await asyncio.sleep(min(60, digest_seconds))
+            await asyncio.to_thread(alerter.send_digest, alert_store, config, digest_seconds, verbose)
+
+    async def run():
+        tasks = [scheduler.run_forever()]
+        if discover:
+            tasks.append(sync_discovered())
+        if alert_store and digest_seconds:
+            tasks.append(flush_digests())
+        if reload and reload_seconds:
+            tasks.append(watch_config())
+        await asyncio.gather(*tasks)
+
+    logging.info(f"Running in daemon mode with {len(monitors)} monitors. Press Ctrl+C to stop.")
     try:
-        alerts = monitor_instance.check()
-        if alerts:
-            alerts_queue.put(alerts)
-    except Exception as e:
-        alerts_queue.put([f"Error running monitor {monitor_instance.__class__.__name__}: {e}"])
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logging.info("Daemon stopped.")
+    finally:
+        alerter.close_senders()
+        offload.shutdown()
 
 def main():
     """Main function to run all monitoring checks and send alerts."""
-    updater.check_for_updates()
+    parser = argparse.ArgumentParser(description="ArgusSight monitoring tool.")
+    parser.add_argument('--daemon', action='store_true', help="Keep running and check each monitor on its own interval.")
+    cluster_mode = parser.add_mutually_exclusive_group()
+    cluster_mode.add_argument('--coordinator', action='store_true', help="Run checks on connected workers (see [Cluster]) and send the alerts.")
+    cluster_mode.add_argument('--worker', action='store_true', help="Run the checks a coordinator assigns to this process until interrupted.")
+    parser.add_argument('--worker-id', help="Name of this worker on the hash ring (defaults to host-pid).")
+    args = parser.parse_args()
 
-    config = config_manager.initialize_config()
-    if not config:
+    if not config_manager.ensure_config_file():
         return # Exit if config was just created
+    # The update check runs in the background and hits GitHub at most once a day
+    update_check = updater.start_update_check(config_manager.get_update_check_path())
+    config_path, cache_path = config_manager.get_config_path(), config_manager.get_config_cache_path()
+    compiled = config_model.load(config_path, cache_path)
+    config, specs = compiled.settings, compiled.monitors
 
     # Configure logging based on verbose setting
     verbose = config_manager.get_verbose_setting(config)
@@ -40,98 +286,148 @@ def main():
     logging.getLogger("azure.identity").setLevel(logging.ERROR)
 
     logging.info("Starting ArgusSight tool...")
+    for error in compiled.errors:
+        logging.error(f"Skipping invalid section {error}")
 
-    try:
-        credential = DefaultAzureCredential()
-        logging.debug("Authentication successful.")
-    except ClientAuthenticationError as e:
-        logging.warning(f"Authentication failed: {e}")
-        # For URL checks, we don't need to exit if Azure auth fails
-        credential = None 
+    credentials = get_azure_credentials(config) if needs_azure(config, specs) else None
 
-    threads = []
-    alerts_queue = queue.Queue()
+    resilience.configure(**config_manager.get_resilience_settings(config))
+    run_deadline = config_manager.get_run_deadline(config)
 
-    # Dynamically run all monitors defined in config in separate threads
-    for section in config.sections():
-        if section.startswith('Monitors.SQL.'):
-            if not credential:
-                logging.warning("Skipping SQL monitors due to authentication failure.")
-                continue
-            instance_name = section.split('.')[-1]
-            instance_config = config[section]
-            sql_monitor = SqlMonitor(
-                credential=credential,
-                subscription_id=config['Azure']['subscription_id'],
-                resource_group=instance_config["resource_group"],
-                instance_name=instance_name
-            )
-            thread = threading.Thread(target=run_monitor_in_thread, args=(sql_monitor, alerts_queue))
-            threads.append(thread)
-            thread.start()
-        
-        elif section.startswith('Monitors.URL.'):
-            monitor_name = section.split('.')[-1]
-            url_config = config[section]
-            url_monitor = UrlMonitor(
-                monitor_name=monitor_name,
-                url=url_config['url'],
-                check_string=url_config.get('check_string'),
-                json_check=json.loads(url_config['json_check']) if url_config.get('json_check') else None,
-                username=url_config.get('username'),
-                password=url_config.get('password'),
-                timeout=url_config.getint('timeout', 10) # Use getint for integer conversion
-            )
-            thread = threading.Thread(target=run_monitor_in_thread, args=(url_monitor, alerts_queue))
-            threads.append(thread)
-            thread.start()
-        
-        elif section.startswith('Monitors.SSL.'):
-            monitor_name = section.split('.')[-1]
-            ssl_config = config[section]
-            ssl_monitor = SSLMonitor(
-                host=ssl_config['host'],
-                port=ssl_config.getint('port', 443)
-            )
-            thread = threading.Thread(target=run_monitor_in_thread, args=(ssl_monitor, alerts_queue))
-            threads.append(thread)
-            thread.start()
+    configured_types = set()
+    configure_types(config, monitor_types(config, specs), configured_types)
+    metrics_port, metrics_textfile = config_manager.get_metrics_settings(config)
+    if metrics_port:
+        try:
+            telemetry.start_http_server(metrics_port)
+        except OSError as e:
+            # e.g. several workers on one machine sharing a config
+            logging.warning(f"Could not serve metrics on port {metrics_port}: {e}")
+    ssl_cache = None
+    cache_enabled, ttl_hours, min_probe_minutes = config_manager.get_ssl_cache_settings(config)
+    if cache_enabled:
+        ssl_cache = SSLCache(config_manager.get_ssl_cache_path(), ttl_hours, min_probe_minutes)
 
-        elif section.startswith('Monitors.VM.'):
-            if not credential:
-                logging.warning("Skipping VM monitors due to authentication failure.")
-                continue
-            vm_name = section.split('.')[-1]
-            vm_config = config[section]
-            vm_monitor = VmMonitor(
-                credential=credential,
-                subscription_id=config['Azure']['subscription_id'],
-                resource_group=vm_config["resource_group"],
-                vm_name=vm_config["vm_name"],
-                config=vm_config
-            )
-            thread = threading.Thread(target=run_monitor_in_thread, args=(vm_monitor, alerts_queue))
-            threads.append(thread)
-            thread.start()
+    history = None
+    history_enabled, retention_days, raw_hours, downsample_minutes = config_manager.get_history_settings(config)
+    if history_enabled and credentials:
+        history = MetricHistory(config_manager.get_history_path(), retention_days, raw_hours, downsample_minutes)
+
+    # Created even if no section is conditional yet, so a reload can turn it on
+    url_cache = UrlCache(config_manager.get_url_cache_path())
+
+    context = MonitorContext(credentials, history, {'ssl': ssl_cache, 'url': url_cache})
+    monitors = build_monitors(specs, context)
+    # Kept current by reload(), so discovery never duplicates a resource that has a config section
+    configured_monitors = dict(monitors)
+
+    def reload():
+        """Returns (compiled config, {section: rebuilt monitor or None if removed}), or None if unchanged."""
+        nonlocal compiled
+        reloaded = config_model.load(config_path, cache_path, previous=compiled)
+        if reloaded is compiled:
+            return None
+        for error in reloaded.errors:
+            logging.error(f"Skipping invalid section {error}")
+        configure_types(reloaded.settings, monitor_types(reloaded.settings, reloaded.monitors), configured_types)
+        changes = {}
+        for section in config_model.diff(compiled.monitors, reloaded.monitors):
+            spec = reloaded.monitors.get(section)
+            changes[section] = build_monitor(spec, context) if spec else None
+            if changes[section]:
+                configured_monitors[section] = changes[section]
+            else:
+                configured_monitors.pop(section, None)
+        compiled = reloaded
+        return reloaded, changes
+    max_concurrency, type_limits = config_manager.get_engine_settings(config)
+    prefetchers = create_prefetchers(monitor_types(config, specs), context)
+
+    discover = None
+    discovery_enabled, refresh_minutes, subscription_ids = config_manager.get_discovery_settings(config)
+    if discovery_enabled and credentials:
+        from discovery import ResourceInventory, InventoryPrefetcher
+        inventory = ResourceInventory(credentials, subscription_ids, config_manager.get_inventory_cache_path(), refresh_minutes)
+        inventory.refresh()
+        monitors.update(build_discovered_monitors(config, credentials, inventory, configured_monitors, history))
+        # Inventory state must be handed out before the batcher groups monitors by region
+        prefetchers.insert(0, InventoryPrefetcher(inventory))
+
+        async def discover_resources():
+            await asyncio.to_thread(inventory.refresh)
+            return build_discovered_monitors(config, credentials, inventory, configured_monitors, history)
+        discover = discover_resources
+    engine = CheckEngine(max_concurrency=max_concurrency, type_limits=type_limits, prefetchers=prefetchers, run_deadline=run_deadline)
+
+    if args.coordinator or args.worker:
+        import cluster
+        address, authkey, min_workers, wait_seconds = config_manager.get_cluster_settings(config)
+        if not authkey:
+            logging.error("Set an authkey in the [Cluster] section to use --coordinator or --worker.")
+            return
+        if args.worker:
+            async def resolve(sections):
+                """Picks up config edits, and discovered resources the coordinator knows about but we don't."""
+                updates = {}
+                reloaded = await asyncio.to_thread(reload)
+                if reloaded:
+                    updates.update(reloaded[1])
+                if discover and any(s not in monitors and s not in updates for s in sections):
+                    updates.update(await discover())
+                return updates
 
-    # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
+            async def after_run(results):
+                save_caches(context)
+                if history:
+                    await asyncio.to_thread(history.save)
+                if metrics_textfile:
+                    telemetry.write_textfile(metrics_textfile)
 
-    # Collect all alerts from the queue
+            cluster.run_worker(address, authkey, engine, monitors, args.worker_id, resolve, after_run)
+            offload.shutdown()
+            return
+        # Workers run the checks; this process only schedules, aggregates and alerts
+        engine = cluster.RemoteEngine(address, authkey, min_workers, wait_seconds, run_deadline=run_deadline)
+
+    alert_store = None
+    dedup, digest_minutes = config_manager.get_alert_settings(config)
+    if dedup:
+        alert_store = AlertStore(config_manager.get_alert_state_path())
+
+    if args.daemon:
+        run_daemon(config, monitors, engine, verbose, context, discover, metrics_textfile, alert_store, specs, reload,
+                   compiled.sections)
+        return
+
+    # Run all monitors concurrently on the asyncio engine
+    results = engine.run(monitors)
+    save_caches(context)
+    if history:
+        history.save()
+    if metrics_textfile:
+        telemetry.write_textfile(metrics_textfile)
+
+    # Collect all alerts in config order
     all_alerts = []
-    while not alerts_queue.empty():
-        all_alerts.extend(alerts_queue.get())
-
-    # Send Alerts
-    if all_alerts:
-        subject = "ArgusSight Monitoring Alert"
-        body = "The following alerts were triggered:\n\n" + "\n".join(all_alerts)
-        if verbose:
-            logging.info(f"\n--- Preparing Alert ---\nSubject: {subject}\nBody:\n{body}")
-        alerter.send_alert_email(subject, body, config)
-    else:
+    for alerts in results.values():
+        all_alerts.extend(alerts)
+
+    if alert_store:
+        # Only alerts that started or resolved since the last notification are sent
+        alert_store.record(results)
+        # Sections that could not be built (e.g. after a failed login) are still configured, so keep their alerts
+        alert_store.retire([*compiled.sections, *(section for section in monitors if section not in specs)])
+        alerter.send_digest(alert_store, config, digest_minutes * 60, verbose)
+        alert_store.close()
+    elif all_alerts:
+        send_alerts(all_alerts, config, verbose)
+    alerter.close_senders()
+    offload.shutdown()
+    updater.finish_update_check(update_check)
+    if not all_alerts:
         logging.info("\nNo alerts triggered. All checks passed.")
 
 if __name__ == "__main__":
+    # Offload workers are spawned by re-running the executable when frozen
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from azure.core.exceptions import AzureError
+import clients
+import resilience
+import telemetry
+
+# The Azure Monitor batch API accepts up to 50 resources per request
+BATCH_SIZE = 50
+METRICS_TIMESPAN = timedelta(minutes=15)
+METRICS_GRANULARITY = timedelta(minutes=5)
+METRICS_ID_MARKER = "/providers/microsoft.insights/metrics/"
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _result_resource_id(result):
+    """Recovers the queried resource ID from a batch result's metric IDs."""
+    for metric in result.metrics:
+        metric_id = (metric.id or "").lower()
+        if METRICS_ID_MARKER in metric_id:
+            return metric_id.split(METRICS_ID_MARKER)[0]
+    return None
+
+class MetricsBatcher:
+    """Prefetches platform metrics for SQL and VM monitors with batch queries.
+
+    Monitors are grouped by their batch key (subscription, metric namespace and
+    region), and each group is queried through `MetricsClient.query_resources`
+    in chunks of up to 50 resources. The results are handed back to each
+    monitor, whose `_query_metrics` then skips its own round-trip. Monitors
+    without a known region, or whose batch failed, query individually as before.
+    With a `history`, each batch only asks for the time grains since the
+    oldest last-stored datapoint of its resources.
+    Each batch uses the credential of its subscription's monitors.
+    """
+    def __init__(self, batch_size=BATCH_SIZE, history=None):
+        self.batch_size = batch_size
+        self.history = history
+
+    def group_monitors(self, monitors):
+        """Returns a dict of batch key -> monitors for all monitors that can be batched."""
+        groups = defaultdict(list)
+        for monitor in monitors:
+            batch_key = getattr(monitor, 'batch_key', None)
+            if batch_key:
+                groups[batch_key].append(monitor)
+        return groups
+
+    async def prefetch_async(self, monitors):
+        """Runs one batch query per group chunk concurrently and fans the results out."""
+        groups = self.group_monitors(monitors)
+        jobs = []
+        for (subscription_id, namespace, location), members in groups.items():
+            for chunk in _chunks(members, self.batch_size):
+                jobs.append(asyncio.to_thread(self._query_batch, location, namespace, chunk))
+        if jobs:
+            logging.debug(f"Prefetching metrics for {sum(map(len, groups.values()))} resources in {len(jobs)} batch queries.")
+            await asyncio.gather(*jobs)
+
+    def _timespan(self, monitors):
+        if not self.history:
+            return METRICS_TIMESPAN
+        start = min(
+            self.history.query_start(monitor.resource_id, monitor.METRIC_NAMES, METRICS_TIMESPAN, METRICS_GRANULARITY)
+            for monitor in monitors
+        )
+        return (start, datetime.now(timezone.utc))
+
+    def _query_batch(self, location, namespace, monitors):
+        metric_names = list(dict.fromkeys(name for monitor in monitors for name in monitor.METRIC_NAMES))
+        try:
+            with telemetry.timed(telemetry.AZURE_REQUEST, operation='batch_metrics'):
+                results = resilience.call(resilience.subscription_key(monitors[0].subscription_id), lambda: clients.get_metrics_client(monitors[0].credential, location).query_resources(
+                    resource_ids=[monitor.resource_id for monitor in monitors],
+                    metric_namespace=namespace,
+                    metric_names=metric_names,
+                    timespan=self._timespan(monitors),
+                    granularity=METRICS_GRANULARITY,
+                    aggregations=["Average"]
+                ), clients.is_transient_azure_error)
+        except (AzureError, resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+            logging.warning(f"  -> Batch metrics query for {len(monitors)} resources in {location} failed: {e}")
+            return
+
+        by_resource_id = {}
+        for position, result in enumerate(results):
+            resource_id = _result_resource_id(result)
+            if resource_id is None and len(results) == len(monitors):
+                # Results come back in request order; fall back to that when IDs are missing
+                resource_id = monitors[position].resource_id.lower()
+            if resource_id:
+                by_resource_id[resource_id] = result
+
+        for monitor in monitors:
+            result = by_resource_id.get(monitor.resource_id.lower())
+            if result is not None:
+                monitor.set_prefetched_metrics({metric.name: metric for metric in result.metrics})
@@ -0,0 +1,99 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from azure.core.exceptions import HttpResponseError
+import clients
+import resilience
+import telemetry
+from monitors.base import Monitor, Option
+
+METRICS_WINDOW = timedelta(minutes=15) # Wider window for data availability
+METRICS_GRANULARITY = timedelta(minutes=5)
+
+class AzureMetricsMonitor(Monitor):
+    """Base of monitors that check an Azure resource's platform metrics.
+
+    Subclasses set METRIC_NAMESPACE (the resource provider type) and
+    METRIC_NAMES. Monitors of one subscription, namespace and region share
+    a batch key, and the `metrics_batcher.MetricsBatcher` prefetches their
+    metrics in batch queries; without one they query individually.
+    """
+    METRIC_NAMESPACE = None
+    METRIC_NAMES = []
+    EXECUTION = 'thread'
+    DEFAULT_INTERVAL = 5 * 60
+    REQUIRES_CREDENTIAL = True
+    OPTIONS = (
+        Option('resource_group', required=True),
+        Option('subscription_id', required=True, inherit=('Azure', 'subscription_id')),
+        Option('location', inherit=('Azure', 'location')),
+    )
+
+    def __init__(self, credential, subscription_id, resource_group, resource_name, location=None, config=None, history=None):
+        self.credential = credential
+        self.metrics_client = clients.get_metrics_query_client(credential)
+        self.subscription_id = subscription_id
+        self.subscription_key = resilience.subscription_key(subscription_id)
+        self.resource_group = resource_group
+        self.resource_name = resource_name
+        self.location = location
+        self._prefetched_metrics = None
+        self.resource_id = (
+            f"/subscriptions/{subscription_id}/"
+            f"resourceGroups/{resource_group}/"
+            f"providers/{self.METRIC_NAMESPACE}/{resource_name}"
+        )
+        self.config = config
+        self.history = history
+
+    @classmethod
+    def create_prefetchers(cls, context):
+        from metrics_batcher import MetricsBatcher
+        return [MetricsBatcher(history=context.history)]
+
+    @property
+    def batch_key(self):
+        """Resources sharing this key can be queried in one batch metrics call."""
+        if not self.location:
+            return None
+        return (self.subscription_id.lower(), self.METRIC_NAMESPACE, self.location.lower().replace(' ', ''))
+
+    def set_prefetched_metrics(self, metrics_data):
+        """Stores metrics fetched by a batch query for the next check to use."""
+        self._prefetched_metrics = metrics_data
+
+    def _query_metrics(self):
+        """Queries all required metrics in a single call, unless a batch query already did."""
+        if self._prefetched_metrics is not None:
+            metrics_data, self._prefetched_metrics = self._prefetched_metrics, None
+            return metrics_data
+        try:
+            with telemetry.timed(telemetry.AZURE_REQUEST, operation='query_metrics'):
+                response = resilience.call(self.subscription_key, lambda: self.metrics_client.query_resource(
+                    resource_uri=self.resource_id,
+                    metric_names=self.METRIC_NAMES,
+                    timespan=self._timespan(),
+                    granularity=METRICS_GRANULARITY,
+                    aggregations=["Average"]
+                ), clients.is_transient_azure_error)
+            return {metric.name: metric for metric in response.metrics}
+        except (HttpResponseError, resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+            logging.warning(f"  -> Failed to query metrics for {self.resource_name}: {e}")
+            return None
+
+    def _timespan(self):
+        """Only the time grains since the last stored datapoint are fetched when history is kept."""
+        if not self.history:
+            return METRICS_WINDOW
+        start = self.history.query_start(self.resource_id, self.METRIC_NAMES, METRICS_WINDOW, METRICS_GRANULARITY)
+        return (start, datetime.now(timezone.utc))
+
+    def _get_latest_metric_value(self, metrics_data, metric_name):
+        if self.history:
+            value = self.history.latest(self.resource_id, metric_name, METRICS_WINDOW.total_seconds())
+            if value is not None:
+                return value
+        metric = metrics_data.get(metric_name)
+        if metric and metric.timeseries and metric.timeseries[0].data:
+            return metric.timeseries[0].data[-1].average # Get the most recent data point
+        logging.warning(f"  -> Metric '{metric_name}' not available for {self.resource_name}.")
+        return None
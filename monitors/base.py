@@ -0,0 +1,135 @@
+import asyncio
+import configparser
+import logging
+from dataclasses import dataclass, field
+
+def boolean(value):
+    """Option converter for the boolean values configparser accepts (yes/no, true/false, on/off, 1/0)."""
+    try:
+        return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+    except KeyError:
+        raise ValueError(value)
+
+@dataclass(frozen=True, slots=True)
+class Option:
+    """One setting of a monitor's config section.
+
+    `convert` turns the string from config.ini into the value handed to the
+    monitor and raises ValueError for invalid input. `inherit` names a
+    (section, key) used when the monitor section doesn't set the option,
+    e.g. ('Azure', 'subscription_id').
+    """
+    name: str
+    convert: object = str
+    default: object = None
+    required: bool = False
+    inherit: tuple = None
+
+@dataclass(slots=True)
+class MonitorContext:
+    """Shared resources handed to every monitor when it is built.
+
+    `credentials` is a `credentials.CredentialProvider`, which gives Azure
+    monitors the credential of their subscription's tenant.
+    """
+    credentials: object = None
+    history: object = None
+    caches: dict = field(default_factory=dict)
+
+class Monitor:
+    """Base class of every monitor type.
+
+    Subclasses are registered with `@registry.register('<TYPE>')` and declare:
+
+    - OPTIONS: the settings of their 'Monitors.<TYPE>.<name>' sections, which
+      are converted and validated when the config is compiled.
+    - EXECUTION: 'async' for monitors implementing `run_async` on the event
+      loop, or 'thread' for monitors implementing a blocking `run`, which
+      the engine runs on its thread pool.
+    - DEFAULT_INTERVAL: seconds between checks in daemon mode, unless the
+      section sets 'interval'.
+    - CACHE: the shared cache they use ('ssl', 'url'), looked up in
+      `MonitorContext.caches`, or None.
+    - REQUIRES_CREDENTIAL: True if they can't run without Azure credentials.
+
+    A monitor whose work can be combined with others' returns a `batch_key`,
+    and its class returns the prefetchers that do so from `create_prefetchers`.
+    The scheduler keeps monitors sharing a batch key in step, and the engine
+    runs the prefetchers before their checks.
+
+    A check that finds its target unavailable, rather than degraded (a
+    stopped VM, a refused port), sets `down`. The engine runs the sections a
+    monitor `depends_on` first, and skips it while one of them is down.
+    """
+    TYPE = None
+    OPTIONS = ()
+    EXECUTION = 'thread'
+    DEFAULT_INTERVAL = 60
+    CACHE = None
+    REQUIRES_CREDENTIAL = False
+
+    batch_key = None
+    depends_on = ()
+    down = False
+
+    @classmethod
+    def from_spec(cls, spec, context):
+        """Creates the monitor for a compiled section (see `config_model.MonitorSpec`).
+
+        By default the constructor gets the section's name, then every
+        declared option as a keyword, plus `cache` if the type uses one.
+        Options missing from the spec get their default.
+        """
+        options = {option.name: spec.options.get(option.name, option.default) for option in cls.OPTIONS}
+        if cls.CACHE:
+            options['cache'] = context.caches.get(cls.CACHE)
+        return cls(spec.name, **options)
+
+    @classmethod
+    def validate(cls, options):
+        """Checks a section's converted options as a whole; raises ValueError if they don't fit together."""
+
+    @classmethod
+    def configure(cls, config):
+        """Applies global settings from the config once before monitors of this type run."""
+
+    @classmethod
+    def create_prefetchers(cls, context):
+        """Returns the engine prefetchers that batch the work of this type's monitors."""
+        return []
+
+    def describe(self):
+        """Returns how alerts refer to this monitor, e.g. "VM 'web-1'"."""
+        return f"{self.TYPE} monitor"
+
+    def run(self):
+        """Performs the check and returns a list of alert messages (thread execution)."""
+        raise NotImplementedError
+
+    async def run_async(self):
+        """Performs the check and returns a list of alert messages (async execution)."""
+        raise NotImplementedError
+
+    def check(self):
+        """Runs the check to completion and returns its alerts; errors become an alert."""
+        if self.EXECUTION == 'async':
+            return asyncio.run(self.check_async())
+        try:
+            return self.run() or []
+        except Exception as e:
+            return [self.alert(f"Error checking {self.describe()}: {e}", logging.ERROR)]
+
+    async def check_async(self):
+        """Runs the check on the engine's loop or thread pool and returns its alerts; errors become an alert."""
+        if self.EXECUTION == 'thread':
+            return await asyncio.to_thread(self.check)
+        try:
+            return await self.run_async() or []
+        except Exception as e:
+            return [self.alert(f"Error checking {self.describe()}: {e}", logging.ERROR)]
+
+    @staticmethod
+    def alert(message, level=logging.WARNING):
+        """Logs an alert message and returns it."""
+        logging.log(level, f"  -> {message}")
+        return message
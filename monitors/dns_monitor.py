@@ -0,0 +1,87 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+import resilience
+import telemetry
+from monitors import registry
+from monitors.base import Monitor, Option
+
+DNS_RESOLVE = telemetry.histogram("argus_dns_resolve_seconds", "Resolution time for DNS checks.")
+
+def _address_list(value):
+    """Option converter for a comma-separated list of IP addresses."""
+    return tuple(sorted({ipaddress.ip_address(address.strip()).compressed for address in value.split(',') if address.strip()}))
+
+def _is_transient(error):
+    # A temporary resolver failure or a timeout; NXDOMAIN and friends are answers
+    if isinstance(error, socket.gaierror):
+        return error.errno == socket.EAI_AGAIN
+    return isinstance(error, TimeoutError)
+
+@registry.register('DNS')
+class DnsMonitor(Monitor):
+    """Checks that a name resolves, optionally to exactly the `expected` addresses.
+
+    Lookups go through the system resolver (getaddrinfo), so they see what
+    the monitored applications on this machine would see, including
+    /etc/hosts and search domains. Temporary resolver failures and timeouts
+    are retried with backoff.
+    """
+    OPTIONS = (
+        Option('hostname', required=True),
+        Option('expected', _address_list),
+        Option('timeout', float, 5.0),
+        Option('max_resolve_ms', float),
+    )
+    EXECUTION = 'async'
+
+    def __init__(self, monitor_name, hostname, expected=None, timeout=5.0, max_resolve_ms=None):
+        self.monitor_name = monitor_name
+        self.hostname = hostname
+        self.expected = tuple(expected or ())
+        self.timeout = float(timeout)
+        self.max_resolve_ms = max_resolve_ms
+        self.host_key = resilience.host_key(hostname)
+
+    def describe(self):
+        return f"DNS name '{self.monitor_name}'"
+
+    async def run_async(self):
+        """Resolves the name and returns a list of alert messages."""
+        logging.info(f"\nChecking DNS: {self.monitor_name} ({self.hostname})")
+        self.down = False
+        try:
+            addresses, elapsed = await resilience.call_async(self.host_key, self._resolve, _is_transient)
+        except (resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+            # An open breaker means the lookups kept failing
+            self.down = isinstance(e, resilience.CircuitOpenError)
+            return [self.alert(f"DNS name '{self.monitor_name}' was not checked: {e}", logging.ERROR)]
+        except TimeoutError:
+            self.down = True
+            return [self.alert(f"DNS lookup of '{self.hostname}' timed out after {self.timeout:g}s.", logging.ERROR)]
+        except socket.gaierror as e:
+            self.down = True
+            return [self.alert(f"DNS name '{self.hostname}' does not resolve: {e.strerror or e}", logging.ERROR)]
+
+        alerts = []
+        resolve_ms = elapsed * 1000
+        logging.debug(f"  -> Resolved to {', '.join(addresses)} in {resolve_ms:.1f} ms")
+        if self.expected and addresses != self.expected:
+            alerts.append(self.alert(f"DNS name '{self.hostname}' resolves to {', '.join(addresses)}, expected {', '.join(self.expected)}."))
+        if self.max_resolve_ms and resolve_ms > self.max_resolve_ms:
+            alerts.append(self.alert(f"DNS lookup of '{self.hostname}' is slow: {resolve_ms:.0f} ms (Threshold: <{self.max_resolve_ms:g} ms)"))
+        return alerts
+
+    async def _resolve(self):
+        """Returns the sorted addresses of the name and how long resolving took."""
+        start = time.perf_counter()
+        infos = await asyncio.wait_for(
+            asyncio.get_running_loop().getaddrinfo(self.hostname, None, type=socket.SOCK_STREAM),
+            resilience.bounded_timeout(self.timeout)
+        )
+        elapsed = time.perf_counter() - start
+        DNS_RESOLVE.observe(elapsed, host=self.hostname)
+        addresses = tuple(sorted({ipaddress.ip_address(info[4][0].split('%')[0]).compressed for info in infos}))
+        return addresses, elapsed
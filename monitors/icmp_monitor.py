@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import struct
+import sys
+import time
+import resilience
+import telemetry
+from monitors import registry
+from monitors.base import Monitor, Option
+
+ICMP_RTT = telemetry.histogram("argus_icmp_rtt_seconds", "Echo round-trip time for ICMP checks.")
+
+PING_SPACING_SECONDS = 0.2
+ECHO_REQUEST = {socket.AF_INET: 8, socket.AF_INET6: 128}
+ECHO_REPLY = {socket.AF_INET: 0, socket.AF_INET6: 129}
+PROTOCOL = {socket.AF_INET: socket.IPPROTO_ICMP, socket.AF_INET6: socket.IPPROTO_ICMPV6}
+
+# Socket types that turned out not to be permitted in this process, so later checks skip straight past them
+_denied = set()
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+def _echo_request(family, identifier, sequence, payload):
+    header = struct.pack('!BBHHH', ECHO_REQUEST[family], 0, 0, identifier, sequence)
+    # The kernel fills in ICMPv6 checksums, which cover a pseudo-header we don't have
+    checksum = _checksum(header + payload) if family == socket.AF_INET else 0
+    return struct.pack('!BBHHH', ECHO_REQUEST[family], 0, checksum, identifier, sequence) + payload
+
+def _open_socket(family):
+    """Returns (socket, kind) for the first ICMP socket type this process may open, or (None, None)."""
+    # Datagram ICMP sockets need no privileges where allowed (Linux ping_group_range, macOS);
+    # raw sockets need root or CAP_NET_RAW
+    for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        if (family, kind) in _denied:
+            continue
+        try:
+            sock = socket.socket(family, kind, PROTOCOL[family])
+        except OSError:
+            _denied.add((family, kind))
+            continue
+        sock.setblocking(False)
+        return sock, kind
+    return None, None
+
+@registry.register('ICMP')
+class IcmpMonitor(Monitor):
+    """Pings a host and alerts on packet loss and round-trip time.
+
+    `count` echo requests are sent on the engine's event loop, so many hosts
+    can be pinged concurrently without a thread each. An unprivileged
+    datagram ICMP socket is used where the OS allows one, a raw socket when
+    running as root, and otherwise the system `ping` command, which can only
+    tell whether the host answered.
+    """
+    OPTIONS = (
+        Option('host', required=True),
+        Option('count', int, 3),
+        Option('timeout', float, 2.0),
+        Option('max_loss_percent', float, 0.0),
+        Option('max_rtt_ms', float),
+    )
+    EXECUTION = 'async'
+
+    def __init__(self, monitor_name, host, count=3, timeout=2.0, max_loss_percent=0.0, max_rtt_ms=None):
+        self.monitor_name = monitor_name
+        self.host = host
+        self.count = max(1, int(count))
+        self.timeout = float(timeout)
+        self.max_loss_percent = max_loss_percent or 0.0
+        self.max_rtt_ms = max_rtt_ms
+
+    @classmethod
+    def validate(cls, options):
+        if options['count'] < 1:
+            raise ValueError("'count' must be at least 1")
+
+    def describe(self):
+        return f"host '{self.monitor_name}'"
+
+    async def run_async(self):
+        """Pings the host and returns a list of alert messages."""
+        logging.info(f"\nPinging host: {self.monitor_name} ({self.host})")
+        self.down = False
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(self.host, None, type=socket.SOCK_DGRAM)
+        except OSError as e:
+            self.down = True
+            return [self.alert(f"Error checking host '{self.monitor_name}': could not resolve {self.host}: {e}", logging.ERROR)]
+        family, _, _, _, sockaddr = infos[0]
+        address = sockaddr[0]
+
+        sock, kind = _open_socket(family)
+        if sock is None:
+            return await self._run_system_ping(address, family)
+        with sock:
+            rtts = await self._ping(sock, kind, family, sockaddr)
+
+        if not rtts:
+            self.down = True
+            return [self.alert(f"Host '{self.monitor_name}' ({address}) is not responding to ping.", logging.ERROR)]
+        loss_percent = (self.count - len(rtts)) * 100 / self.count
+        average_ms = sum(rtts) / len(rtts) * 1000
+        logging.debug(f"  -> {len(rtts)}/{self.count} replies, avg {average_ms:.1f} ms")
+        alerts = []
+        if loss_percent > self.max_loss_percent:
+            alerts.append(self.alert(f"Host '{self.monitor_name}' is losing packets: {loss_percent:.0f}% of {self.count} pings lost (Threshold: <={self.max_loss_percent:g}%)"))
+        if self.max_rtt_ms and average_ms > self.max_rtt_ms:
+            alerts.append(self.alert(f"Host '{self.monitor_name}' round-trip time is high: {average_ms:.1f} ms (Threshold: <{self.max_rtt_ms:g} ms)"))
+        return alerts
+
+    async def _ping(self, sock, kind, family, sockaddr):
+        """Sends `count` echo requests and returns the round-trip times of the replies that came back in time."""
+        loop = asyncio.get_running_loop()
+        # Datagram sockets get their identifier from the kernel, which also filters replies by it
+        identifier = os.getpid() & 0xffff if kind == socket.SOCK_RAW else 0
+        payload = os.urandom(16)
+        sent = {}
+        rtts = {}
+
+        async def receive():
+            while len(rtts) < self.count:
+                data = await loop.sock_recv(sock, 2048)
+                received = time.perf_counter()
+                if kind == socket.SOCK_RAW and family == socket.AF_INET:
+                    data = data[(data[0] & 0x0f) * 4:]  # Raw IPv4 sockets include the IP header
+                if len(data) < 8:
+                    continue
+                icmp_type, _, _, reply_id, sequence = struct.unpack('!BBHHH', data[:8])
+                # Raw sockets see every ICMP packet for the host, including other pings
+                if icmp_type != ECHO_REPLY[family] or data[8:] != payload or sequence not in sent or sequence in rtts:
+                    continue
+                if kind == socket.SOCK_RAW and reply_id != identifier:
+                    continue
+                rtts[sequence] = received - sent[sequence]
+                ICMP_RTT.observe(rtts[sequence], host=self.host)
+
+        receiver = asyncio.ensure_future(receive())
+        try:
+            for sequence in range(self.count):
+                sent[sequence] = time.perf_counter()
+                await loop.sock_sendto(sock, _echo_request(family, identifier, sequence, payload), sockaddr)
+                if sequence < self.count - 1:
+                    await asyncio.sleep(PING_SPACING_SECONDS)
+            await asyncio.wait_for(asyncio.shield(receiver), resilience.bounded_timeout(self.timeout))
+        except TimeoutError:
+            pass
+        except OSError as e:
+            # e.g. no route to the host; counted as lost pings
+            logging.debug(f"  -> Ping to {self.host} failed: {e}")
+        finally:
+            receiver.cancel()
+        return list(rtts.values())
+
+    async def _run_system_ping(self, address, family):
+        """Falls back to the system ping command when no ICMP socket may be opened."""
+        ping = shutil.which('ping')
+        if ping is None:
+            return [self.alert(f"Error checking host '{self.monitor_name}': ICMP sockets are not permitted and no ping command was found.", logging.ERROR)]
+        timeout = resilience.bounded_timeout(self.timeout)
+        if sys.platform == 'win32':
+            command = [ping, '-n', str(self.count), '-w', str(int(timeout * 1000)), address]
+        else:
+            command = [ping, '-c', str(self.count), '-W', str(max(1, round(timeout))), address]
+            if family == socket.AF_INET6:
+                command.insert(1, '-6')
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            returncode = await asyncio.wait_for(process.wait(), timeout * self.count + PING_SPACING_SECONDS * self.count + 5)
+        except TimeoutError:
+            process.kill()
+            await process.wait()
+            returncode = None
+        if returncode != 0:
+            self.down = True
+            return [self.alert(f"Host '{self.monitor_name}' ({address}) is not responding to ping.", logging.ERROR)]
+        logging.debug("  -> Host answered the system ping command")
+        return []
@@ -0,0 +1,58 @@
+import importlib
+import logging
+from importlib.metadata import entry_points
+
+# Installed packages can add monitor types with an entry point in this group,
+# named after the type and pointing at the Monitor subclass, e.g.
+#   [project.entry-points."argus.monitors"]
+#   REDIS = "argus_redis:RedisMonitor"
+ENTRY_POINT_GROUP = 'argus.monitors'
+
+# Built-in types are imported on first use, so that e.g. a URL-only config
+# never loads the Azure SDKs
+BUILTIN_MODULES = {
+    'URL': 'monitors.url_monitor',
+    'SSL': 'monitors.ssl_monitor',
+    'SQL': 'monitors.sql_monitor',
+    'VM': 'monitors.vm_monitor',
+    'TCP': 'monitors.tcp_monitor',
+    'DNS': 'monitors.dns_monitor',
+    'ICMP': 'monitors.icmp_monitor',
+}
+
+_registry = {}
+_plugins = None
+
+def register(monitor_type):
+    """Class decorator registering a Monitor subclass for 'Monitors.<monitor_type>.*' sections."""
+    def decorator(cls):
+        cls.TYPE = monitor_type.upper()
+        _registry[cls.TYPE] = cls
+        return cls
+    return decorator
+
+def _plugin_entry_points():
+    global _plugins
+    if _plugins is None:
+        try:
+            _plugins = {entry_point.name.upper(): entry_point for entry_point in entry_points(group=ENTRY_POINT_GROUP)}
+        except Exception as e:
+            logging.warning(f"Could not list monitor plugins: {e}")
+            _plugins = {}
+    return _plugins
+
+def get(monitor_type):
+    """Returns the Monitor subclass of a type, importing it on first use. Raises KeyError for unknown types."""
+    if monitor_type not in _registry:
+        if monitor_type in BUILTIN_MODULES:
+            importlib.import_module(BUILTIN_MODULES[monitor_type])
+        elif monitor_type in _plugin_entry_points():
+            cls = _plugin_entry_points()[monitor_type].load()
+            # Plugins don't have to use the decorator
+            cls.TYPE = cls.TYPE or monitor_type
+            _registry.setdefault(monitor_type, cls)
+    return _registry[monitor_type]
+
+def types():
+    """Returns every known monitor type: built-in, registered and installed as plugins."""
+    return sorted(set(BUILTIN_MODULES) | set(_registry) | set(_plugin_entry_points()))
@@ -1,47 +1,68 @@
 import logging
-from datetime import timedelta
-from azure.monitor.query import MetricsQueryClient
-from azure.core.exceptions import HttpResponseError
+from history import seconds_until
+from monitors import registry
+from monitors.azure_monitor import AzureMetricsMonitor
+from monitors.base import Option
 
-class SqlMonitor:
-    def __init__(self, credential, subscription_id, resource_group, instance_name):
-        self.metrics_client = MetricsQueryClient(credential)
-        self.resource_id = (
-            f"/subscriptions/{subscription_id}/"
-            f"resourceGroups/{resource_group}/"
-            f"providers/Microsoft.Sql/managedInstances/{instance_name}"
-        )
+STORAGE_THRESHOLD_PERCENT = 90
+
+@registry.register('SQL')
+class SqlMonitor(AzureMetricsMonitor):
+    METRIC_NAMESPACE = "Microsoft.Sql/managedInstances"
+    METRIC_NAMES = ["avg_cpu_percent", "storage_space_used_mb", "reserved_storage_mb"]
+    OPTIONS = AzureMetricsMonitor.OPTIONS + (
+        Option('storage_forecast_days', float),
+        Option('forecast_window_hours', float),
+    )
+
+    def __init__(self, credential, subscription_id, resource_group, instance_name, location=None, config=None, history=None):
+        super().__init__(credential, subscription_id, resource_group, instance_name, location, config, history)
+        self._prefetched_state = None
         self.instance_name = instance_name
 
-    def check(self):
+    @classmethod
+    def from_spec(cls, spec, context):
+        options = spec.options
+        return cls(
+            credential=context.credentials.for_subscription(options['subscription_id']),
+            subscription_id=options['subscription_id'],
+            resource_group=options['resource_group'],
+            instance_name=spec.name,
+            location=options.get('location'),
+            config=options,
+            history=context.history
+        )
+
+    def describe(self):
+        return f"SQL instance {self.instance_name}"
+
+    def set_state(self, state):
+        """Stores the instance state from resource discovery for the next check to use."""
+        self._prefetched_state = state
+
+    def run(self):
         """Checks SQL MI metrics and returns a list of alert messages."""
         logging.info(f"\nChecking SQL Managed Instance: {self.instance_name}")
         alerts = []
-        try:
-            metrics_data = self._query_metrics()
-            if metrics_data:
-                storage_alert = self._check_storage_usage(metrics_data)
-                if storage_alert:
-                    alerts.append(storage_alert)
-        except Exception as e:
-            error_message = f"Error checking SQL instance {self.instance_name}: {e}"
-            logging.error(error_message)
-            alerts.append(error_message)
-        return alerts
+        state, self._prefetched_state = self._prefetched_state, None
+        self.down = bool(state and state != "Ready")
+        if self.down:
+            self._prefetched_metrics = None
+            alerts.append(f"SQL instance '{self.instance_name}' is not available. Current state: {state}.")
+            return alerts
 
-    def _query_metrics(self):
-        try:
-            response = self.metrics_client.query_resource(
-                resource_uri=self.resource_id,
-                metric_names=["avg_cpu_percent", "storage_space_used_mb", "reserved_storage_mb"],
-                timespan=timedelta(minutes=15), # Wider window for data availability
-                granularity=timedelta(minutes=5),
-                aggregations=["Average"]
-            )
-            return {metric.name: metric for metric in response.metrics}
-        except HttpResponseError as e:
-            logging.warning(f"  -> Failed to query metrics for {self.instance_name}: {e}")
-            return None
+        metrics_data = self._query_metrics()
+        if metrics_data and self.history:
+            self.history.record(self.resource_id, metrics_data)
+        if metrics_data:
+            storage_alert = self._check_storage_usage(metrics_data)
+            if storage_alert:
+                alerts.append(storage_alert)
+            elif self.history:
+                forecast_alert = self._check_storage_forecast()
+                if forecast_alert:
+                    alerts.append(forecast_alert)
+        return alerts
 
     def _check_storage_usage(self, metrics_data):
         try:
@@ -54,16 +75,31 @@ class SqlMonitor:
             if reserved_mb > 0:
                 usage_percent = (used_mb / reserved_mb) * 100
                 logging.debug(f"  -> Storage Usage: {usage_percent:.2f}% ({used_mb:.2f}MB / {reserved_mb:.2f}MB)")
-                if usage_percent >= 90:
+                if usage_percent >= STORAGE_THRESHOLD_PERCENT:
                     return f"SQL instance '{self.instance_name}' storage usage is at {usage_percent:.2f}%!"
             return None
         except (IndexError, TypeError) as e:
             logging.warning(f"  -> Could not process storage data for {self.instance_name}: {e}")
             return None
 
-    def _get_latest_metric_value(self, metrics_data, metric_name):
-        metric = metrics_data.get(metric_name)
-        if metric and metric.timeseries and metric.timeseries[0].data:
-            return metric.timeseries[0].data[-1].average # Get the most recent data point
-        logging.warning(f"  -> Metric '{metric_name}' not available for {self.instance_name}.")
+    def _check_storage_forecast(self):
+        """Alerts when the storage usage trend reaches the threshold within `storage_forecast_days`."""
+        forecast_days = self.config.getfloat('storage_forecast_days', 0.0) if self.config else 0.0
+        if forecast_days <= 0:
+            return None
+        window_hours = self.config.getfloat('forecast_window_hours', 24.0)
+        used_times, used = self.history.window(self.resource_id, "storage_space_used_mb", window_hours * 3600)
+        reserved_times, reserved = self.history.window(self.resource_id, "reserved_storage_mb", window_hours * 3600)
+        reserved_at = dict(zip(reserved_times, reserved))
+        points = [(t, value / reserved_at[t] * 100) for t, value in zip(used_times, used) if reserved_at.get(t)]
+        if not points:
+            return None
+        timestamps, usage = zip(*points)
+        seconds = seconds_until(timestamps, usage, STORAGE_THRESHOLD_PERCENT)
+        if seconds is None:
+            return None
+        days = seconds / 86400
+        logging.debug(f"  -> Storage projected to reach {STORAGE_THRESHOLD_PERCENT}% in {days:.1f} days")
+        if days <= forecast_days:
+            return f"SQL instance '{self.instance_name}' storage is projected to reach {STORAGE_THRESHOLD_PERCENT}% in {days:.1f} days (currently {usage[-1]:.2f}%)."
         return None
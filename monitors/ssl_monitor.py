@@ -1,32 +1,178 @@
+import asyncio
+import errno
 import logging
 import ssl
-import socket
+from collections import defaultdict
 from datetime import datetime
+import config_manager
+import resilience
+import ssl_scanner
+from monitors import registry
+from monitors.base import Monitor, Option
 
-class SSLMonitor:
-    def __init__(self, host, port=443):
+ALERT_DAYS = 15
+# Connect errors of an address family this host has no route for
+_NO_ROUTE_ERRNOS = (errno.ENETUNREACH, errno.EADDRNOTAVAIL)
+
+def _is_transient(error):
+    # Certificate and protocol errors mean the host answered, so they are not retried
+    return isinstance(error, OSError) and not isinstance(error, ssl.SSLError)
+
+def _is_unroutable(address, error):
+    """Returns True if `error` means this machine can't reach IPv6 `address` at all, e.g. it has no IPv6 route."""
+    return ':' in address and isinstance(error, OSError) and error.errno in _NO_ROUTE_ERRNOS
+
+@registry.register('SSL')
+class SSLMonitor(Monitor):
+    """Checks the certificates a host serves on every address it resolves to.
+
+    Backends behind a load balancer can serve different certificates, so
+    each A/AAAA record is handshaked separately, once per name in `sni`
+    (comma-separated, defaults to the host). Every certificate of the
+    verified chain is checked for expiry, not just the leaf. Handshakes go
+    through the shared `ssl_scanner.SSLScanner`. AAAA records this machine
+    has no route to are skipped while another address answers. The check is
+    down when no address completes a handshake.
+    """
+    OPTIONS = (
+        Option('host', required=True),
+        Option('port', int, 443),
+        Option('sni'),
+        Option('timeout', float),
+    )
+    EXECUTION = 'async'
+    DEFAULT_INTERVAL = 6 * 60 * 60
+    CACHE = 'ssl'
+
+    def __init__(self, host, port=443, sni=None, cache=None, timeout=None, scanner=None):
         self.host = host
         self.port = port
+        self.sni_names = [name.strip() for name in (sni or host).split(',') if name.strip()]
+        self.cache = cache
+        self.timeout = timeout
+        self.scanner = scanner or ssl_scanner.get_scanner()
 
-    def check(self):
+    @classmethod
+    def from_spec(cls, spec, context):
+        options = spec.options
+        return cls(options['host'], options['port'], options['sni'], context.caches.get('ssl'), options['timeout'])
+
+    @classmethod
+    def configure(cls, config):
+        ssl_scanner.configure(*config_manager.get_ssl_scan_settings(config))
+
+    def describe(self):
+        return f"SSL for {self.host}"
+
+    async def run_async(self):
+        """Handshakes every address for every SNI name concurrently and returns a list of alert messages."""
         logging.info(f"\nChecking SSL for: {self.host}:{self.port}")
-        context = ssl.create_default_context()
+        self.down = False
+        alerts = []
+        pending = []
+        for sni in self.sni_names:
+            cached_alerts = self._check_cache(sni)
+            if cached_alerts is None:
+                pending.append(sni)
+            else:
+                alerts.extend(cached_alerts)
+        if not pending:
+            return alerts
+
         try:
-            with socket.create_connection((self.host, self.port)) as sock:
-                with context.wrap_socket(sock, server_hostname=self.host) as ssock:
-                    cert = ssock.getpeercert()
-                    
-                    # Parse the 'notAfter' field to get the expiration date
-                    not_after = datetime.strptime(cert['notAfter'], '%b %d %H:%M:%S %Y %Z')
-                    
-                    # Calculate days remaining
-                    days_remaining = (not_after - datetime.now()).days
-                    
-                    logging.debug(f"  -> Certificate for {self.host} expires in {days_remaining} days.")
-                    alerts = []
-                    if days_remaining < 15:
-                        alerts.append(f"SSL certificate for {self.host} expires in {days_remaining} days!")
-                    return alerts
-        except Exception as e:
-            logging.error(f"  -> Error checking SSL for {self.host}: {e}")
-            return [f"Error checking SSL for {self.host}: {e}"]
+            addresses = await self.scanner.resolve(self.host, self.port)
+        except OSError as e:
+            self.down = True
+            alert = f"Error checking SSL for {self.host}: could not resolve the host: {e}"
+            logging.error(f"  -> {alert}")
+            return alerts + [alert]
+
+        jobs = [(sni, address) for sni in pending for address in addresses]
+        outcomes = await asyncio.gather(*(self._handshake(address, sni) for sni, address in jobs), return_exceptions=True)
+        by_sni = defaultdict(list)
+        for (sni, address), outcome in zip(jobs, outcomes):
+            by_sni[sni].append((address, outcome))
+        for sni in pending:
+            alerts.extend(self._evaluate(sni, self._skip_unroutable(by_sni[sni])))
+        # Like the other network checks, an open breaker counts as down and a run deadline doesn't
+        failures = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        self.down = len(failures) == len(outcomes) and any(not isinstance(e, resilience.DeadlineExceeded) for e in failures)
+        return alerts
+
+    async def _handshake(self, address, sni):
+        # Rate limits and breakers are per address, since that is what each handshake hits
+        return await resilience.call_async(
+            resilience.host_key(address),
+            lambda: self.scanner.handshake(address, self.port, sni, self.timeout, self.timeout),
+            lambda error: _is_transient(error) and not _is_unroutable(address, error)
+        )
+
+    def _skip_unroutable(self, outcomes):
+        """Drops the IPv6 addresses there is no route to, unless no other address could be tried."""
+        routable = [(address, outcome) for address, outcome in outcomes if not _is_unroutable(address, outcome)]
+        if not routable:
+            return outcomes
+        for address, outcome in outcomes:
+            if _is_unroutable(address, outcome):
+                logging.debug(f"  -> Skipping {address}: {outcome}")
+        return routable
+
+    def _label(self, sni):
+        return self.host if sni == self.host else f"{self.host} (SNI {sni})"
+
+    def _check_cache(self, sni):
+        """Returns alerts from a fresh cache entry, or None if the host must be probed."""
+        if not self.cache:
+            return None
+        cached = self.cache.get(self.host, self.port, sni)
+        if cached is None:
+            return None
+        not_after, fingerprint, certs = cached
+        logging.debug(f"  -> Using cached certificate {fingerprint[:16]} for {self._label(sni)}.")
+        return self._evaluate_expiry(certs or [(not_after, f"SSL certificate for {self._label(sni)}")])
+
+    def _evaluate(self, sni, outcomes):
+        """Turns the handshakes of one SNI name into alerts and caches them if every address answered."""
+        label = self._label(sni)
+        alerts = []
+        errors = defaultdict(list)
+        leaves = defaultdict(list)
+        handshakes = []
+        for address, outcome in outcomes:
+            if isinstance(outcome, Exception):
+                errors[str(outcome) or outcome.__class__.__name__].append(address)
+            else:
+                handshakes.append(outcome)
+                leaves[outcome.fingerprint].append(address)
+        for error, addresses in errors.items():
+            where = f" on {', '.join(addresses)}" if len(outcomes) > 1 else ""
+            alert = f"Error checking SSL for {label}{where}: {error}"
+            logging.error(f"  -> {alert}")
+            alerts.append(alert)
+
+        certs = {}
+        for handshake in handshakes:
+            leaf, intermediates = handshake.chain[0], handshake.chain[1:]
+            served_by = leaves[handshake.fingerprint]
+            where = f" on {', '.join(served_by)}" if len(leaves) > 1 else ""
+            certs.setdefault(('leaf', handshake.fingerprint), (leaf.not_after, f"SSL certificate for {label}{where}"))
+            for cert in intermediates:
+                # Trust anchors come from the local store, so only the certificates the server sends count
+                if not cert.self_issued:
+                    certs.setdefault((cert.subject, cert.not_after), (cert.not_after, f"Intermediate certificate '{cert.subject}' for {label}"))
+        certs = list(certs.values())
+        if certs and self.cache and not errors:
+            earliest = min(not_after for not_after, _ in certs)
+            self.cache.put(self.host, self.port, sni, earliest, handshakes[0].fingerprint, certs)
+        return alerts + self._evaluate_expiry(certs)
+
+    def _evaluate_expiry(self, certs):
+        """Returns an alert for every (not_after, description) within the alert window."""
+        alerts = []
+        now = datetime.now()
+        for not_after, description in certs:
+            days_remaining = (not_after - now).days
+            logging.debug(f"  -> {description} expires in {days_remaining} days.")
+            if days_remaining < ALERT_DAYS:
+                alerts.append(f"{description} expires in {days_remaining} days!")
+        return alerts
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+import resilience
+import telemetry
+from monitors import registry
+from monitors.base import Monitor, Option
+
+TCP_CONNECT = telemetry.histogram("argus_tcp_connect_seconds", "TCP connect time for TCP checks.")
+
+def _is_transient(error):
+    # A refused connection is the host's answer; timeouts (an OSError too) and network errors are retried
+    return isinstance(error, OSError) and not isinstance(error, ConnectionRefusedError)
+
+@registry.register('TCP')
+class TcpMonitor(Monitor):
+    """Checks that a TCP port accepts connections, optionally within `max_connect_ms`.
+
+    Connections are opened on the engine's event loop and closed right after
+    the handshake, so thousands of ports can be checked without a thread
+    each. They go through the host's rate limit and circuit breaker, and
+    timed out connections are retried with backoff.
+    """
+    OPTIONS = (
+        Option('host', required=True),
+        Option('port', int, required=True),
+        Option('timeout', float, 5.0),
+        Option('max_connect_ms', float),
+    )
+    EXECUTION = 'async'
+
+    def __init__(self, monitor_name, host, port, timeout=5.0, max_connect_ms=None):
+        self.monitor_name = monitor_name
+        self.host = host
+        self.port = int(port)
+        self.timeout = float(timeout)
+        self.max_connect_ms = max_connect_ms
+        self.host_key = resilience.host_key(host)
+
+    def describe(self):
+        return f"TCP port '{self.monitor_name}'"
+
+    async def run_async(self):
+        """Connects to the port and returns a list of alert messages."""
+        logging.info(f"\nChecking TCP port: {self.monitor_name} ({self.host}:{self.port})")
+        self.down = False
+        try:
+            elapsed = await resilience.call_async(self.host_key, self._connect, _is_transient)
+        except (resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+            # An open breaker means the host kept failing
+            self.down = isinstance(e, resilience.CircuitOpenError)
+            return [self.alert(f"TCP port '{self.monitor_name}' was not checked: {e}", logging.ERROR)]
+        except OSError as e:
+            self.down = True
+            return [self.alert(f"TCP port '{self.monitor_name}' ({self.host}:{self.port}) is not accepting connections: {str(e) or e.__class__.__name__}", logging.ERROR)]
+
+        connect_ms = elapsed * 1000
+        logging.debug(f"  -> Connected in {connect_ms:.1f} ms")
+        if self.max_connect_ms and connect_ms > self.max_connect_ms:
+            return [self.alert(f"TCP port '{self.monitor_name}' is slow: connecting took {connect_ms:.0f} ms (Threshold: <{self.max_connect_ms:g} ms)")]
+        return []
+
+    async def _connect(self):
+        """Opens and closes one connection and returns how long connecting took."""
+        start = time.perf_counter()
+        _, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), resilience.bounded_timeout(self.timeout))
+        elapsed = time.perf_counter() - start
+        TCP_CONNECT.observe(elapsed, host=self.host)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return elapsed
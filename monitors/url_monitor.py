@@ -1,53 +1,282 @@
-
+import hashlib
+import json
 import logging
+import re
+from urllib.parse import urlsplit
 import requests
+import clients
+import config_manager
+import content_checks
+import offload
+import resilience
+import telemetry
+from monitors import registry
+from monitors.base import Monitor, Option, boolean
+from streaming import JsonKeyExtractor, StreamingSearch
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_BODY_BYTES = 5 * 1024 * 1024
+
+def _regex(value):
+    """Option converter that checks a regular expression compiles."""
+    try:
+        re.compile(value)
+    except re.error as e:
+        raise ValueError(f"{value}: {e}")
+    return value
+
+def _json_paths(value):
+    """Option converter for a JSON object of JSONPath -> expected value."""
+    paths = json.loads(value)
+    if not isinstance(paths, dict):
+        raise ValueError(value)
+    for path in paths:
+        content_checks.parse_json_path(path)
+    return paths
+
+def _is_transient(error):
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in resilience.TRANSIENT_STATUSES
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+@registry.register('URL')
+class UrlMonitor(Monitor):
+    """A generic monitor for checking website availability and content.
 
-class UrlMonitor:
-    """A generic monitor for checking website availability and content."""
-    def __init__(self, monitor_name, url, check_string=None, json_check=None, username=None, password=None, timeout=10):
+    Response bodies are streamed: `check_string` is searched chunk by chunk and
+    `json_check` keys are pulled out incrementally, and reading stops as soon
+    as both are satisfied or `max_body_bytes` have been read. Requests go
+    through the host's rate limit and circuit breaker, and connection errors,
+    timeouts and 429/5xx responses are retried with backoff.
+
+    With `conditional` and a `cache`, the response's ETag/Last-Modified are
+    sent back on the next check, and a 304 reuses the previous verdict
+    without transferring the body. `head_only` sends HEAD requests and only
+    checks the status code.
+
+    `regex` and `json_path` assertions need the whole body, so with either
+    set the body is buffered (up to `max_body_bytes`) and all content checks
+    run on it at once. Bodies of at least the offload threshold are
+    evaluated in the `offload` process pool, keeping the parsing off the
+    threads that do the I/O.
+    """
+    OPTIONS = (
+        Option('url', required=True),
+        Option('check_string'),
+        Option('json_check', json.loads),
+        Option('regex', _regex),
+        Option('json_path', _json_paths),
+        Option('username'),
+        Option('password'),
+        Option('timeout', int, 10),
+        Option('max_body_bytes', int, DEFAULT_MAX_BODY_BYTES),
+        Option('conditional', boolean, False),
+        Option('head_only', boolean, False),
+    )
+    CACHE = 'url'
+
+    def __init__(self, monitor_name, url, check_string=None, json_check=None, username=None, password=None, timeout=10,
+                 max_body_bytes=DEFAULT_MAX_BODY_BYTES, conditional=False, head_only=False, cache=None, regex=None, json_path=None):
         self.monitor_name = monitor_name
         self.url = url
         self.check_string = check_string
         self.json_check = json_check
+        self.regex = regex
+        self.json_path = json_path
         self.username = username
         self.password = password
         self.timeout = int(timeout)
+        self.max_body_bytes = int(max_body_bytes)
+        self.host_key = resilience.host_key(urlsplit(url).hostname or url)
+        self.conditional = conditional
+        self.head_only = head_only
+        self.cache = cache
+        # A stored verdict only holds for the settings it was made with
+        self.signature = hashlib.sha256(json.dumps([check_string, json_check, self.max_body_bytes, regex, json_path], sort_keys=True).encode()).hexdigest()[:16]
+
+    @classmethod
+    def validate(cls, options):
+        body_checks = ('check_string', 'json_check', 'regex', 'json_path')
+        if options['head_only'] and any(options[key] for key in body_checks):
+            raise ValueError("'head_only' can't be combined with 'check_string', 'json_check', 'regex' or 'json_path'")
+
+    @classmethod
+    def configure(cls, config):
+        clients.configure_http(*config_manager.get_http_settings(config))
+        offload.configure(*config_manager.get_offload_settings(config))
 
-    def check(self):
+    def describe(self):
+        return f"URL '{self.monitor_name}'"
+
+    def run(self):
         """Performs the URL check and returns a list of alert messages."""
         logging.info(f"\nChecking URL: {self.monitor_name} ({self.url})")
         alerts = []
+        cached = None
+        self.down = False
+        if self.conditional and self.cache and not self.head_only:
+            cached = self.cache.get(self.monitor_name, self.url, self.signature)
         try:
-            auth = (self.username, self.password) if self.username and self.password else None
-            response = requests.get(self.url, timeout=self.timeout, auth=auth)
+            with resilience.call(self.host_key, lambda: self._get(cached), _is_transient) as response:
+                telemetry.URL_TTFB.observe(response.elapsed.total_seconds(), monitor=self.monitor_name)
 
-            if response.status_code >= 400:
-                alert = f"URL '{self.monitor_name}' is down! Received status code {response.status_code}."
-                logging.warning(f"  -> {alert}")
-                alerts.append(alert)
-            elif self.check_string and self.check_string not in response.text:
-                alert = f"URL '{self.monitor_name}' is up, but the expected string was not found."
-                logging.warning(f"  -> {alert}")
-                alerts.append(alert)
-            elif self.json_check:
-                try:
-                    json_response = response.json()
-                    for key, expected_value in self.json_check.items():
-                        if key not in json_response or json_response[key] != expected_value:
-                            alert = f"'{key}' does not match expected value. Expected: {expected_value}, Got: {json_response.get(key)}"
-                            logging.warning(f"  -> {alert}")
-                            alerts.append(alert)
-                except ValueError:
-                    alert = f"URL '{self.monitor_name}' is up, but response is not valid JSON."
+                if response.status_code >= 400:
+                    self.down = True
+                    alert = f"URL '{self.monitor_name}' is down! Received status code {response.status_code}."
                     logging.warning(f"  -> {alert}")
                     alerts.append(alert)
-            else:
-                logging.debug(f"  -> Status: {response.status_code} OK")
+                elif response.status_code == 304 and cached is not None:
+                    logging.debug("  -> Status: 304 Not Modified, reusing the previous verdict")
+                    alerts.extend(cached['alerts'])
+                elif self.head_only:
+                    logging.debug(f"  -> Status: {response.status_code} OK")
+                else:
+                    digest = hashlib.sha256()
+                    alerts.extend(self._evaluate_body(response, digest))
+                    if self.conditional and self.cache:
+                        self._remember(response, digest.hexdigest(), alerts, cached)
+                    if not alerts:
+                        logging.debug(f"  -> Status: {response.status_code} OK")
 
+        except requests.exceptions.HTTPError as e:
+            # A retryable status that persisted through every attempt
+            self.down = True
+            alert = f"URL '{self.monitor_name}' is down! Received status code {e.response.status_code}."
+            logging.warning(f"  -> {alert}")
+            alerts.append(alert)
         except requests.exceptions.RequestException as e:
+            self.down = True
             alert = f"Failed to connect to URL '{self.monitor_name}': {e}"
             logging.error(f"  -> {alert}")
             alerts.append(alert)
-        
+        except (resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+            # An open breaker means the host kept failing
+            self.down = isinstance(e, resilience.CircuitOpenError)
+            alert = f"URL '{self.monitor_name}' was not checked: {e}"
+            logging.error(f"  -> {alert}")
+            alerts.append(alert)
+
+        return alerts
+
+    def _get(self, cached=None):
+        """Sends one request; retryable statuses are raised as HTTPError so `resilience.call` retries them."""
+        auth = (self.username, self.password) if self.username and self.password else None
+        timeout = resilience.bounded_timeout(self.timeout)
+        session = clients.get_http_session()
+        if self.head_only:
+            response = session.head(self.url, timeout=timeout, auth=auth, allow_redirects=True)
+        else:
+            headers = {}
+            if cached is not None:
+                if cached['etag']:
+                    headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    headers['If-Modified-Since'] = cached['last_modified']
+            response = session.get(self.url, timeout=timeout, auth=auth, headers=headers, stream=True)
+        if response.status_code in resilience.TRANSIENT_STATUSES:
+            response.close()
+            raise requests.exceptions.HTTPError(f"{response.status_code} response from {self.url}", response=response)
+        return response
+
+    def _remember(self, response, digest, alerts, cached):
+        """Stores the response's validators and the verdict for the next conditional request."""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            # Nothing to send back next time
+            self.cache.discard(self.monitor_name, self.url)
+            return
+        if cached is not None and cached['digest'] == digest:
+            logging.debug(f"  -> Body is unchanged, but the server answered the conditional request with {response.status_code}")
+        self.cache.put(self.monitor_name, self.url, self.signature, etag, last_modified, digest, alerts)
+
+    def _encode_check_string(self, encoding):
+        try:
+            return self.check_string.encode(encoding or 'utf-8')
+        except (LookupError, UnicodeEncodeError):
+            return self.check_string.encode('utf-8')
+
+    def _evaluate_body(self, response, digest=None):
+        """Streams the body through the string search and JSON extractor and returns alerts.
+
+        The bytes read are also fed to the `digest` hash object, if given.
+        """
+        if self.regex or self.json_path:
+            return self._evaluate_buffered(response, digest)
+        searcher = StreamingSearch(self._encode_check_string(response.encoding)) if self.check_string else None
+        extractor = JsonKeyExtractor(self.json_check) if self.json_check else None
+        if not searcher and not extractor:
+            return []
+
+        json_error = None
+        bytes_read = 0
+        truncated = False
+        for chunk in response.iter_content(CHUNK_SIZE):
+            bytes_read += len(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            if searcher:
+                searcher.feed(chunk)
+            if extractor and json_error is None:
+                try:
+                    extractor.feed(chunk)
+                except ValueError as e:
+                    json_error = e
+            string_done = not searcher or searcher.found
+            json_done = not extractor or extractor.done or json_error is not None
+            if string_done and json_done:
+                break
+            if bytes_read >= self.max_body_bytes:
+                truncated = True
+                break
+
+        alerts = []
+        if searcher and not searcher.found:
+            alert = f"URL '{self.monitor_name}' is up, but the expected string was not found."
+            if truncated:
+                alert = f"URL '{self.monitor_name}' is up, but the expected string was not found in the first {self.max_body_bytes} bytes."
+            logging.warning(f"  -> {alert}")
+            alerts.append(alert)
+        elif extractor:
+            if json_error is None and not truncated:
+                try:
+                    extractor.close()
+                except ValueError as e:
+                    json_error = e
+            if json_error is not None:
+                alert = f"URL '{self.monitor_name}' is up, but response is not valid JSON."
+                logging.warning(f"  -> {alert}")
+                alerts.append(alert)
+            elif truncated and not extractor.done:
+                alert = f"URL '{self.monitor_name}' response exceeded {self.max_body_bytes} bytes before all JSON keys were found."
+                logging.warning(f"  -> {alert}")
+                alerts.append(alert)
+            else:
+                json_response = extractor.values
+                for key, expected_value in self.json_check.items():
+                    if key not in json_response or json_response[key] != expected_value:
+                        alert = f"'{key}' does not match expected value. Expected: {expected_value}, Got: {json_response.get(key)}"
+                        logging.warning(f"  -> {alert}")
+                        alerts.append(alert)
         return alerts
 
+    def _evaluate_buffered(self, response, digest=None):
+        """Reads the body up to `max_body_bytes` and runs every content check on it, offloaded if it is large."""
+        body = bytearray()
+        truncated = False
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if digest is not None:
+                digest.update(chunk)
+            body += chunk
+            if len(body) >= self.max_body_bytes:
+                truncated = True
+                break
+        needle = self._encode_check_string(response.encoding) if self.check_string else None
+        alerts = offload.run(
+            content_checks.evaluate, self.monitor_name, bytes(body), response.encoding, needle,
+            self.json_check, self.regex, self.json_path, truncated, self.max_body_bytes,
+            size=len(body), task='url_content'
+        )
+        for alert in alerts:
+            logging.warning(f"  -> {alert}")
+        return alerts
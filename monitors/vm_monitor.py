@@ -1,57 +1,128 @@
 import logging
-from datetime import timedelta
-from azure.monitor.query import MetricsQueryClient
-from azure.mgmt.compute import ComputeManagementClient
 from azure.core.exceptions import HttpResponseError
+import clients
+import guest_metrics
+import resilience
+import telemetry
+from history import consecutive_at_or_above
+from monitors import registry
+from monitors.azure_monitor import AzureMetricsMonitor, METRICS_GRANULARITY
+from monitors.base import Option
 
-class VmMonitor:
-    def __init__(self, credential, subscription_id, resource_group, vm_name, config):
-        self.metrics_client = MetricsQueryClient(credential)
-        self.compute_client = ComputeManagementClient(credential, subscription_id)
-        self.resource_group = resource_group
+@registry.register('VM')
+class VmMonitor(AzureMetricsMonitor):
+    """Checks a VM's power state, CPU and memory, and with a Log Analytics `workspace_id` its free disk space.
+
+    Disk space is a guest counter, so it comes from the InsightsMetrics that
+    Azure Monitor Agent (VM insights) sends to the workspace, fetched for
+    all VMs of a workspace at once by `guest_metrics.GuestMetricsCollector`.
+    The guest's available memory stands in when the platform metric is missing.
+    """
+    METRIC_NAMESPACE = "Microsoft.Compute/virtualMachines"
+    METRIC_NAMES = ["Percentage CPU", "Available Memory Bytes"]
+    OPTIONS = AzureMetricsMonitor.OPTIONS + (
+        Option('vm_name', required=True),
+        Option('cpu_threshold', float),
+        Option('cpu_consecutive_samples', int),
+        Option('memory_threshold_mb', float),
+        Option('disk_threshold_mb', float),
+        Option('workspace_id', inherit=('Azure', 'workspace_id')),
+    )
+
+    def __init__(self, credential, subscription_id, resource_group, vm_name, config, location=None, history=None, workspace_id=None):
+        super().__init__(credential, subscription_id, resource_group, vm_name, location, config, history)
+        self._prefetched_power_state = None
+        self._prefetched_guest_metrics = None
+        self.compute_client = clients.get_compute_client(credential, subscription_id)
         self.vm_name = vm_name
-        self.resource_id = (
-            f"/subscriptions/{subscription_id}/"
-            f"resourceGroups/{resource_group}/"
-            f"providers/Microsoft.Compute/virtualMachines/{vm_name}"
+        self.workspace_id = workspace_id
+
+    @classmethod
+    def from_spec(cls, spec, context):
+        options = spec.options
+        return cls(
+            credential=context.credentials.for_subscription(options['subscription_id']),
+            subscription_id=options['subscription_id'],
+            resource_group=options['resource_group'],
+            vm_name=options['vm_name'],
+            config=options,
+            location=options.get('location'),
+            history=context.history,
+            workspace_id=options.get('workspace_id')
         )
-        self.config = config
 
-    def check(self):
+    @classmethod
+    def create_prefetchers(cls, context):
+        return super().create_prefetchers(context) + [guest_metrics.GuestMetricsCollector()]
+
+    def describe(self):
+        return f"VM {self.vm_name}"
+
+    def set_power_state(self, display_status):
+        """Stores a power state from resource discovery for the next check to use."""
+        self._prefetched_power_state = display_status
+
+    def set_guest_metrics(self, metrics):
+        """Stores guest counters fetched for a whole workspace (a `guest_metrics.GuestMetrics`) for the next check to use."""
+        self._prefetched_guest_metrics = metrics
+
+    def run(self):
         """Checks VM status and metrics, returns a list of alert messages."""
         logging.info(f"\nChecking Virtual Machine: {self.vm_name}")
         alerts = []
-        try:
-            # Check VM Status first
-            status_alert = self._check_vm_status()
-            if status_alert:
-                alerts.append(status_alert)
-                # If VM is not running, don't check metrics
-                return alerts
-
-            # Check Metrics
-            metrics_data = self._query_metrics()
-            if metrics_data:
-                cpu_alert = self._check_cpu_usage(metrics_data)
-                if cpu_alert:
-                    alerts.append(cpu_alert)
-                
-                mem_alert = self._check_memory_usage(metrics_data)
-                if mem_alert:
-                    alerts.append(mem_alert)
-
-        except Exception as e:
-            error_message = f"Error checking VM {self.vm_name}: {e}"
-            logging.error(error_message)
-            alerts.append(error_message)
+        # Check VM Status first
+        status_alert = self._check_vm_status()
+        self.down = status_alert is not None
+        if status_alert:
+            alerts.append(status_alert)
+            # If VM is not running, don't check metrics
+            self._prefetched_metrics = None
+            self._prefetched_guest_metrics = None
+            return alerts
+
+        # Check Metrics
+        metrics_data = self._query_metrics()
+        guest = self._query_guest_metrics()
+        if metrics_data and self.history:
+            self.history.record(self.resource_id, metrics_data)
+        if metrics_data:
+            cpu_alert = self._check_cpu_usage(metrics_data)
+            if cpu_alert:
+                alerts.append(cpu_alert)
+
+        if metrics_data or guest:
+            mem_alert = self._check_memory_usage(metrics_data or {}, guest)
+            if mem_alert:
+                alerts.append(mem_alert)
+        if guest:
+            alerts.extend(self._check_disk_space(guest))
         return alerts
 
+    def _query_guest_metrics(self):
+        """Returns the guest counters of the VM's workspace, querying it alone unless a prefetch already did."""
+        if not self.workspace_id:
+            return None
+        metrics, self._prefetched_guest_metrics = self._prefetched_guest_metrics, None
+        if metrics is None:
+            metrics = guest_metrics.query_workspace(self.workspace_id, self.credential, [self.resource_id])
+        if metrics is not None and not metrics.covers(self.resource_id):
+            logging.warning(f"  -> No guest metrics for {self.vm_name} in workspace {self.workspace_id}; is Azure Monitor Agent sending VM insights?")
+            return None
+        return metrics
+
     def _check_vm_status(self):
         """Checks the power state of the VM."""
+        if self._prefetched_power_state is not None:
+            vm_state, self._prefetched_power_state = self._prefetched_power_state, None
+            logging.debug(f"  -> VM State: {vm_state} (discovered)")
+            if vm_state != "VM running":
+                return f"VM '{self.vm_name}' is not in a running state. Current state: {vm_state}."
+            return None
         try:
-            instance_view = self.compute_client.virtual_machines.instance_view(
-                self.resource_group, self.vm_name
-            )
+            with telemetry.timed(telemetry.AZURE_REQUEST, operation='vm_status'):
+                instance_view = resilience.call(self.subscription_key, lambda: self.compute_client.virtual_machines.instance_view(
+                    self.resource_group, self.vm_name
+                ), clients.is_transient_azure_error)
             status = next((s for s in instance_view.statuses if s.code.startswith('PowerState/')), None)
             if status:
                 vm_state = status.display_status
@@ -64,47 +135,47 @@ class VmMonitor:
             # Return the error as an alert because this is a critical check
             return f"Could not retrieve status for VM '{self.vm_name}'. It may be deallocated or deleted."
 
-
-    def _query_metrics(self):
-        """Queries all required VM metrics in a single call."""
-        try:
-            response = self.metrics_client.query_resource(
-                resource_uri=self.resource_id,
-                metric_names=["Percentage CPU", "Available Memory Bytes"],
-                timespan=timedelta(minutes=15),
-                granularity=timedelta(minutes=5),
-                aggregations=["Average"]
-            )
-            return {metric.name: metric for metric in response.metrics}
-        except HttpResponseError as e:
-            logging.warning(f"  -> Failed to query metrics for {self.vm_name}: {e}")
-            return None
-
-    def _get_latest_metric_value(self, metrics_data, metric_name):
-        metric = metrics_data.get(metric_name)
-        if metric and metric.timeseries and metric.timeseries[0].data:
-            return metric.timeseries[0].data[-1].average
-        logging.warning(f"  -> Metric '{metric_name}' not available for {self.vm_name}.")
-        return None
-
     def _check_cpu_usage(self, metrics_data):
         """Checks CPU usage against a threshold."""
         threshold = self.config.getfloat('cpu_threshold', 90.0)
+        samples = self.config.getint('cpu_consecutive_samples', 1)
         cpu_percent = self._get_latest_metric_value(metrics_data, "Percentage CPU")
         if cpu_percent is not None:
             logging.debug(f"  -> CPU Usage: {cpu_percent:.2f}%")
-            if cpu_percent >= threshold:
+            if samples > 1 and self.history:
+                # Look back one extra grain so a grain Azure hasn't filled yet doesn't break the run
+                window = (samples + 1) * METRICS_GRANULARITY.total_seconds()
+                _, values = self.history.window(self.resource_id, "Percentage CPU", window)
+                if consecutive_at_or_above(values, threshold, samples):
+                    return f"VM '{self.vm_name}' CPU usage is high: {cpu_percent:.2f}% (Threshold: >{threshold}% for {samples} consecutive samples)"
+            elif cpu_percent >= threshold:
                 return f"VM '{self.vm_name}' CPU usage is high: {cpu_percent:.2f}% (Threshold: >{threshold}%)"
         return None
 
-    def _check_memory_usage(self, metrics_data):
-        """Checks available memory against a threshold."""
+    def _check_memory_usage(self, metrics_data, guest=None):
+        """Checks available memory against a threshold, using the guest counter if the platform metric is missing."""
         threshold_mb = self.config.getfloat('memory_threshold_mb', 2048.0)
         available_bytes = self._get_latest_metric_value(metrics_data, "Available Memory Bytes")
+        available_mb = None
         if available_bytes is not None:
             available_mb = available_bytes / (1024 * 1024)
+        elif guest:
+            available_mb = guest.values(self.resource_id, guest_metrics.MEMORY_NAMESPACE, guest_metrics.MEMORY_AVAILABLE_MB).get('')
+        if available_mb is not None:
             logging.debug(f"  -> Available Memory: {available_mb:.2f} MB")
             if available_mb <= threshold_mb:
                 return f"VM '{self.vm_name}' available memory is low: {available_mb:.2f} MB (Threshold: <{threshold_mb} MB)"
         return None
 
+    def _check_disk_space(self, guest):
+        """Checks the free space of every mount against `disk_threshold_mb`."""
+        threshold_mb = self.config.getfloat('disk_threshold_mb', None)
+        if threshold_mb is None:
+            return []
+        alerts = []
+        free_by_mount = guest.values(self.resource_id, guest_metrics.DISK_NAMESPACE, guest_metrics.DISK_FREE_MB)
+        for mount, free_mb in sorted(free_by_mount.items()):
+            logging.debug(f"  -> Free disk space on {mount}: {free_mb:.2f} MB")
+            if free_mb <= threshold_mb:
+                alerts.append(f"VM '{self.vm_name}' disk {mount} free space is low: {free_mb:.2f} MB (Threshold: <{threshold_mb} MB)")
+        return alerts
@@ -0,0 +1,85 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+import resilience
+import telemetry
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_THRESHOLD_BYTES = 256 * 1024
+
+OFFLOAD_DURATION = telemetry.histogram("argus_offload_seconds", "Duration of CPU-heavy check steps, by where they ran.")
+
+_lock = threading.Lock()
+_settings = {'max_workers': DEFAULT_MAX_WORKERS, 'threshold_bytes': DEFAULT_THRESHOLD_BYTES}
+_pool = None
+
+def configure(max_workers=DEFAULT_MAX_WORKERS, threshold_bytes=DEFAULT_THRESHOLD_BYTES):
+    """Sets the pool size (0 disables offloading) and the input size from which work is offloaded."""
+    global _pool
+    with _lock:
+        _settings.update(max_workers=max(0, int(max_workers)), threshold_bytes=max(0, int(threshold_bytes)))
+        pool, _pool = _pool, None
+    if pool:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None and _settings['max_workers']:
+            # Spawned rather than forked, since the parent has running threads holding locks
+            _pool = concurrent.futures.ProcessPoolExecutor(max_workers=_settings['max_workers'],
+                                                           mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def _discard_pool(pool):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def run(func, *args, size=0, task=None):
+    """Calls `func(*args)` and returns its result, in a worker process if `size` reaches the threshold.
+
+    `func` and its arguments must be picklable, so `func` has to be a
+    module-level function. Small inputs run inline, since shipping them to a
+    worker would cost more than evaluating them. Waiting for a worker stops
+    at the run deadline with DeadlineExceeded. If the pool broke (e.g. a
+    worker was killed) the work runs inline and the pool is recreated on
+    next use.
+    """
+    task = task or func.__name__
+    pool = _get_pool() if size >= _settings['threshold_bytes'] else None
+    start = time.perf_counter()
+    if pool is not None:
+        try:
+            future = pool.submit(func, *args)
+        except (BrokenProcessPool, RuntimeError) as e:
+            logging.warning(f"Offload pool is unavailable, running {task} inline: {e}")
+            _discard_pool(pool)
+        else:
+            try:
+                result = future.result(timeout=resilience.remaining())
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise resilience.DeadlineExceeded(f"{task} did not finish in a worker process before the run deadline")
+            except BrokenProcessPool as e:
+                logging.warning(f"Offload pool broke, running {task} inline: {e}")
+                _discard_pool(pool)
+            else:
+                OFFLOAD_DURATION.observe(time.perf_counter() - start, task=task, where='process')
+                return result
+    result = func(*args)
+    OFFLOAD_DURATION.observe(time.perf_counter() - start, task=task, where='inline')
+    return result
+
+def shutdown():
+    """Stops the worker processes, if any were started."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool:
+        pool.shutdown(wait=True, cancel_futures=True)
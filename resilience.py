@@ -0,0 +1,296 @@
+import asyncio
+import contextvars
+import email.utils
+import logging
+import random
+import threading
+import time
+import telemetry
+
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_SECONDS = 0.5
+DEFAULT_MAX_BACKOFF_SECONDS = 30.0
+DEFAULT_HOST_RATE = 10.0
+DEFAULT_HOST_BURST = 20
+# Azure Resource Manager refills each subscription's read bucket at 25/s up to 250
+DEFAULT_SUBSCRIPTION_RATE = 25.0
+DEFAULT_SUBSCRIPTION_BURST = 250
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_RESET_SECONDS = 60.0
+# Timeouts are never cut below this, so a nearly spent deadline still allows a real attempt
+MIN_TIMEOUT_SECONDS = 1.0
+
+# Responses worth retrying: timeouts, throttling and server-side failures
+TRANSIENT_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+CIRCUIT_OPEN = telemetry.gauge("argus_circuit_open", "1 while the circuit breaker of a host or subscription is open.")
+
+_lock = threading.Lock()
+_settings = {
+    'retries': DEFAULT_RETRIES,
+    'backoff_seconds': DEFAULT_BACKOFF_SECONDS,
+    'max_backoff_seconds': DEFAULT_MAX_BACKOFF_SECONDS,
+    'host_rate': DEFAULT_HOST_RATE,
+    'host_burst': DEFAULT_HOST_BURST,
+    'subscription_rate': DEFAULT_SUBSCRIPTION_RATE,
+    'subscription_burst': DEFAULT_SUBSCRIPTION_BURST,
+    'breaker_failures': DEFAULT_BREAKER_FAILURES,
+    'breaker_reset_seconds': DEFAULT_BREAKER_RESET_SECONDS,
+}
+_buckets = {}
+_breakers = {}
+_deadline = contextvars.ContextVar('argus_run_deadline', default=None)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host or subscription whose circuit breaker is open."""
+    def __init__(self, key, retry_in):
+        super().__init__(f"{key} is failing, calls are paused for another {retry_in:.0f}s")
+        self.key = key
+        self.retry_in = retry_in
+
+class DeadlineExceeded(Exception):
+    """Raised when waiting for a rate limit slot would run past the run deadline."""
+
+class TokenBucket:
+    """Allows `burst` calls at once and `rate` calls per second after that.
+
+    Callers reserve a token and then wait the returned number of seconds
+    outside the lock, so they are served in the order they asked.
+    """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        """Takes a token and returns the seconds to wait before using it.
+
+        Returns None without taking a token if the wait would exceed `max_wait`.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+class CircuitBreaker:
+    """Fails calls fast for `reset_seconds` after `failure_threshold` consecutive transient failures.
+
+    After that period one trial call is let through: success closes the
+    circuit again, another failure re-opens it for a full period.
+    """
+    def __init__(self, key, failure_threshold, reset_seconds):
+        self.key = key
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_call(self):
+        """Raises CircuitOpenError unless a call may go ahead."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            retry_in = self._opened_at + self.reset_seconds - time.monotonic()
+            if retry_in > 0 or self._probing:
+                raise CircuitOpenError(self.key, max(0.0, retry_in))
+            self._probing = True
+
+    def release(self):
+        """Lets another trial call through after one ended without an outcome, e.g. cancelled."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok):
+        """Records the outcome of a call; `ok` is False for transient failures only."""
+        with self._lock:
+            self._probing = False
+            if ok:
+                if self._opened_at is not None:
+                    logging.info(f"Circuit for {self.key} closed again.")
+                    CIRCUIT_OPEN.set(0, key=self.key)
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._opened_at is None and self._failures >= self.failure_threshold:
+                logging.warning(f"Circuit for {self.key} opened after {self._failures} consecutive failures.")
+                CIRCUIT_OPEN.set(1, key=self.key)
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+def configure(retries=DEFAULT_RETRIES, backoff_seconds=DEFAULT_BACKOFF_SECONDS, max_backoff_seconds=DEFAULT_MAX_BACKOFF_SECONDS,
+              host_rate=DEFAULT_HOST_RATE, host_burst=DEFAULT_HOST_BURST,
+              subscription_rate=DEFAULT_SUBSCRIPTION_RATE, subscription_burst=DEFAULT_SUBSCRIPTION_BURST,
+              breaker_failures=DEFAULT_BREAKER_FAILURES, breaker_reset_seconds=DEFAULT_BREAKER_RESET_SECONDS):
+    """Sets the retry, rate limit and circuit breaker settings; a rate of 0 disables that limit."""
+    with _lock:
+        _settings.update(
+            retries=max(0, int(retries)), backoff_seconds=backoff_seconds, max_backoff_seconds=max_backoff_seconds,
+            host_rate=host_rate, host_burst=host_burst,
+            subscription_rate=subscription_rate, subscription_burst=subscription_burst,
+            breaker_failures=breaker_failures, breaker_reset_seconds=breaker_reset_seconds,
+        )
+        _buckets.clear()
+        _breakers.clear()
+
+def host_key(host):
+    """Returns the rate limit and breaker key of a network host."""
+    return f"host:{host.lower()}"
+
+def subscription_key(subscription_id):
+    """Returns the rate limit and breaker key of an Azure subscription."""
+    return f"subscription:{subscription_id.lower()}"
+
+def _get_bucket(key):
+    kind = key.split(':', 1)[0]
+    with _lock:
+        if key not in _buckets:
+            rate = _settings[f'{kind}_rate']
+            _buckets[key] = TokenBucket(rate, _settings[f'{kind}_burst']) if rate > 0 else None
+        return _buckets[key]
+
+def _get_breaker(key):
+    with _lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker(key, _settings['breaker_failures'], _settings['breaker_reset_seconds'])
+        return breaker
+
+def set_deadline(seconds):
+    """Makes calls in the current context give up `seconds` from now (None or 0: never).
+
+    The deadline is a context variable, so it carries over into tasks and
+    `asyncio.to_thread` calls started from this context. Returns a token
+    for `reset_deadline`.
+    """
+    return _deadline.set(time.monotonic() + seconds if seconds else None)
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+def remaining():
+    """Returns the seconds left until the current run deadline, or None if there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+def bounded_timeout(timeout):
+    """Returns `timeout` shortened to what is left of the run deadline."""
+    left = remaining()
+    if left is None:
+        return timeout
+    return max(MIN_TIMEOUT_SECONDS, min(timeout, left))
+
+def parse_retry_after(value):
+    """Parses a Retry-After header (seconds or an HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _retry_after(error):
+    # Both requests' and azure-core's HTTP errors carry the response
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    return parse_retry_after(headers.get('Retry-After')) if headers else None
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff before retry number `attempt` (0-based), never shorter than `retry_after`."""
+    delay = random.uniform(0, min(_settings['max_backoff_seconds'], _settings['backoff_seconds'] * 2 ** attempt))
+    return delay if retry_after is None else max(delay, retry_after)
+
+def _reserve(key, breaker):
+    """Checks the breaker and takes a rate limit token; returns the seconds to wait for it."""
+    breaker.before_call()
+    bucket = _get_bucket(key)
+    if bucket is None:
+        return 0.0
+    wait = bucket.reserve(remaining())
+    if wait is None:
+        breaker.release()
+        raise DeadlineExceeded(f"Rate limit for {key} would run past the run deadline")
+    return wait
+
+def _after_failure(key, breaker, error, is_transient, attempt, retries):
+    """Records a failed attempt and returns the seconds to wait before retrying, or None to give up."""
+    transient = is_transient(error)
+    breaker.record(not transient)
+    if not transient or attempt >= retries or breaker.is_open:
+        return None
+    retry_after = _retry_after(error)
+    if retry_after is not None and retry_after > _settings['max_backoff_seconds']:
+        return None
+    delay = backoff_delay(attempt, retry_after)
+    left = remaining()
+    if left is not None and delay >= left:
+        return None
+    logging.debug(f"  -> Retrying {key} in {delay:.2f}s after: {error}")
+    return delay
+
+def call(key, func, is_transient, retries=None):
+    """Calls `func()` under the rate limit and circuit breaker of `key`, retrying transient failures.
+
+    `is_transient(exception)` decides whether a failure is worth retrying and
+    counts against the breaker; any other outcome means the target is up.
+    The last error is raised once retries, Retry-After or the run deadline
+    rule out another attempt.
+    """
+    retries = _settings['retries'] if retries is None else retries
+    breaker = _get_breaker(key)
+    attempt = 0
+    while True:
+        wait = _reserve(key, breaker)
+        if wait:
+            time.sleep(wait)
+        try:
+            result = func()
+        except Exception as e:
+            delay = _after_failure(key, breaker, e, is_transient, attempt, retries)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record(True)
+        return result
+
+async def call_async(key, func, is_transient, retries=None):
+    """Async `call`: awaits `func()` and sleeps on the event loop between attempts."""
+    retries = _settings['retries'] if retries is None else retries
+    breaker = _get_breaker(key)
+    attempt = 0
+    while True:
+        wait = _reserve(key, breaker)
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            result = await func()
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            delay = _after_failure(key, breaker, e, is_transient, attempt, retries)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record(True)
+        return result
@@ -0,0 +1,97 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+# Check interval in seconds for monitors that declare none, used when a section has no 'interval'
+DEFAULT_INTERVAL = 60
+
+# Checks that fall due within this many seconds of each other run as one batch
+BATCH_WINDOW_SECONDS = 1.0
+
+class Scheduler:
+    """Heap-based scheduler that runs each monitor on its own interval.
+
+    Monitor instances stay alive between runs, so credentials, SDK clients and
+    connections are reused. Each monitor's first run is jittered across its
+    interval so that checks sharing an interval don't all fire at once.
+    """
+    def __init__(self, engine, on_results, jitter=True):
+        self.engine = engine
+        self.on_results = on_results
+        self.jitter = jitter
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._wakeup = None
+
+    def add(self, section, monitor, interval=None):
+        """Schedules `monitor`, replacing any monitor already scheduled for `section`."""
+        interval = float(interval or getattr(monitor, 'DEFAULT_INTERVAL', DEFAULT_INTERVAL))
+        first_delay = self._first_delay(monitor, interval)
+        entry = [time.monotonic() + first_delay, next(self._counter), section, monitor, interval]
+        self._entries[section] = entry
+        heapq.heappush(self._heap, entry)
+        logging.debug(f"Scheduled {section} every {interval:.0f}s (first run in {first_delay:.0f}s).")
+        self._notify()
+
+    def _first_delay(self, monitor, interval):
+        if not self.jitter:
+            return 0
+        batch_key = getattr(monitor, 'batch_key', None)
+        if batch_key:
+            # Monitors that can share a batch query get the same offset so they stay together
+            return random.Random(repr((batch_key, interval))).uniform(0, interval)
+        return random.uniform(0, interval)
+
+    def remove(self, section):
+        """Stops scheduling `section`. The stale heap entry is dropped lazily."""
+        self._entries.pop(section, None)
+        self._notify()
+
+    def _notify(self):
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now + BATCH_WINDOW_SECONDS:
+            entry = heapq.heappop(self._heap)
+            if self._entries.get(entry[2]) is entry:
+                due.append(entry)
+        return due
+
+    async def _run_batch(self, entries):
+        results = await self.engine.run_async({entry[2]: entry[3] for entry in entries})
+        now = time.monotonic()
+        for entry in entries:
+            if self._entries.get(entry[2]) is entry:
+                # Keep a fixed rate, but never schedule into the past after a slow check
+                entry[0] = max(entry[0] + entry[4], now)
+                entry[1] = next(self._counter)
+                heapq.heappush(self._heap, entry)
+        try:
+            await self.on_results(results)
+        except Exception as e:
+            logging.error(f"Failed to process scheduler results: {e}")
+        self._notify()
+
+    async def run_forever(self):
+        """Runs due checks until cancelled."""
+        self._wakeup = asyncio.Event()
+        batches = set()
+        while True:
+            due = self._pop_due(time.monotonic())
+            if due:
+                batch = asyncio.create_task(self._run_batch(due))
+                batches.add(batch)
+                batch.add_done_callback(batches.discard)
+
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
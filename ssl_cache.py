@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_TTL_HOURS = 168
+DEFAULT_MIN_PROBE_MINUTES = 60
+ALERT_WINDOW_DAYS = 15
+
+class SSLCache:
+    """Persistent cache of certificate expiry dates keyed by (host, port, SNI).
+
+    Entries are re-probed adaptively: while expiry is far off a cached result
+    is trusted for up to the TTL, and as expiry approaches the alert window the
+    re-probe interval shrinks down to `min_probe_minutes`.
+    """
+    def __init__(self, path, ttl_hours=DEFAULT_TTL_HOURS, min_probe_minutes=DEFAULT_MIN_PROBE_MINUTES):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.min_probe_seconds = min_probe_minutes * 60
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable SSL cache {self.path}: {e}")
+            return {}
+
+    @staticmethod
+    def _key(host, port, sni):
+        return f"{host}:{port}:{sni or host}"
+
+    def _probe_interval(self, not_after, now):
+        """Seconds until the certificate should be probed again."""
+        seconds_to_window = not_after.timestamp() - now - ALERT_WINDOW_DAYS * 86400
+        return min(self.ttl_seconds, max(self.min_probe_seconds, seconds_to_window / 2))
+
+    def get(self, host, port, sni=None):
+        """Returns (not_after, fingerprint, certs) if a fresh entry exists, otherwise None.
+
+        `certs` lists (not_after, description) of every certificate seen by the
+        probe, so cached results alert exactly like the probe did.
+        """
+        with self._lock:
+            entry = self._entries.get(self._key(host, port, sni))
+        if not entry or entry['next_probe'] <= time.time():
+            return None
+        certs = [(datetime.fromisoformat(not_after), description) for not_after, description in entry.get('certs', [])]
+        return datetime.fromisoformat(entry['not_after']), entry['fingerprint'], certs
+
+    def put(self, host, port, sni, not_after, fingerprint, certs=()):
+        """Records a freshly probed certificate; `not_after` is the earliest expiry among `certs`."""
+        now = time.time()
+        entry = {
+            'not_after': not_after.isoformat(),
+            'fingerprint': fingerprint,
+            'certs': [[cert_not_after.isoformat(), description] for cert_not_after, description in certs],
+            'checked_at': now,
+            'next_probe': now + self._probe_interval(not_after, now),
+        }
+        with self._lock:
+            self._entries[self._key(host, port, sni)] = entry
+            self._dirty = True
+
+    def save(self):
+        """Writes the cache to disk if it changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._entries)
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save SSL cache to {self.path}: {e}")
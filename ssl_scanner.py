@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import socket
+import ssl
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+import resilience
+import telemetry
+
+DEFAULT_MAX_HANDSHAKES = 256
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_HANDSHAKE_TIMEOUT = 10.0
+DEFAULT_DNS_TTL_SECONDS = 300.0
+CERT_TIME_FORMAT = '%b %d %H:%M:%S %Y %Z'
+
+SSL_DNS = telemetry.histogram("argus_ssl_dns_seconds", "DNS resolution time for SSL checks.")
+
+_lock = threading.Lock()
+_scanner_settings = {}
+_scanner = None
+
+@dataclass(frozen=True, slots=True)
+class Certificate:
+    """One certificate of a verified chain."""
+    subject: str
+    not_after: datetime
+    self_issued: bool
+
+    @classmethod
+    def from_info(cls, info):
+        """Builds a Certificate from the dict format of `SSLSocket.getpeercert()`."""
+        subject = _common_name(info.get('subject', ()))
+        issuer = _common_name(info.get('issuer', ()))
+        return cls(subject, datetime.strptime(info['notAfter'], CERT_TIME_FORMAT), subject == issuer)
+
+@dataclass(frozen=True, slots=True)
+class Handshake:
+    """The outcome of one handshake: the verified chain (leaf first) and the leaf's SHA-256 fingerprint."""
+    address: str
+    chain: tuple
+    fingerprint: str
+
+def _common_name(name):
+    for rdn in name:
+        for key, value in rdn:
+            if key == 'commonName':
+                return value
+    return ', '.join(f"{key}={value}" for rdn in name for key, value in rdn)
+
+def _verified_chain(ssl_object):
+    """Returns the verified chain, leaf first, or just the leaf where Python doesn't expose the chain."""
+    # The chain has been available on the private _sslobj since 3.10; 3.13 made a DER-only version public
+    get_chain = getattr(getattr(ssl_object, '_sslobj', None), 'get_verified_chain', None)
+    if get_chain is not None:
+        try:
+            return tuple(Certificate.from_info(cert.get_info()) for cert in get_chain())
+        except (AttributeError, KeyError, ValueError):
+            pass
+    return (Certificate.from_info(ssl_object.getpeercert()),)
+
+class SSLScanner:
+    """Handshake engine shared by all SSL monitors.
+
+    Every A/AAAA record of a host is resolved once per `dns_ttl_seconds` for
+    all monitors, concurrent lookups of the same host share one query, and
+    one verifying TLS context is reused for every handshake instead of
+    loading the trust store for each check. Handshakes from all monitors run
+    under a single limit of `max_handshakes`, each with its own connect and
+    handshake timeouts.
+    """
+    def __init__(self, max_handshakes=DEFAULT_MAX_HANDSHAKES, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 handshake_timeout=DEFAULT_HANDSHAKE_TIMEOUT, dns_ttl_seconds=DEFAULT_DNS_TTL_SECONDS):
+        self.max_handshakes = max(1, int(max_handshakes))
+        self.connect_timeout = connect_timeout
+        self.handshake_timeout = handshake_timeout
+        self.dns_ttl_seconds = dns_ttl_seconds
+        self._dns = {}
+        self._lookups = {}
+        self._context = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._limit = None
+
+    def _bind_loop(self):
+        """Creates the handshake limit for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._limit = asyncio.Semaphore(self.max_handshakes)
+            self._lookups = {}
+
+    def context(self):
+        """Returns the shared client context that verifies certificates and hostnames."""
+        with self._lock:
+            if self._context is None:
+                self._context = ssl.create_default_context()
+            return self._context
+
+    async def resolve(self, host, port):
+        """Returns every IPv4 and IPv6 address of `host`, from the shared cache while it is fresh."""
+        key = (host.lower(), port)
+        cached = self._dns.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        self._bind_loop()
+        lookup = self._lookups.get(key)
+        if lookup is None:
+            lookup = self._lookups[key] = asyncio.ensure_future(self._lookup(key))
+            lookup.add_done_callback(lambda _: self._lookups.pop(key, None))
+        return await asyncio.shield(lookup)
+
+    async def _lookup(self, key):
+        host, port = key
+        start = time.perf_counter()
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        SSL_DNS.observe(time.perf_counter() - start, host=host)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._dns[key] = (time.monotonic() + self.dns_ttl_seconds, addresses)
+        return addresses
+
+    async def handshake(self, address, port, sni, connect_timeout=None, handshake_timeout=None):
+        """Connects to one address, completes a verified handshake for `sni` and returns a `Handshake`."""
+        self._bind_loop()
+        connect_timeout = resilience.bounded_timeout(connect_timeout or self.connect_timeout)
+        handshake_timeout = resilience.bounded_timeout(handshake_timeout or self.handshake_timeout)
+        async with self._limit:
+            start = time.perf_counter()
+            # wait_for's TimeoutError is an OSError, so timeouts count as transient failures
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), connect_timeout)
+            try:
+                await writer.start_tls(self.context(), server_hostname=sni, ssl_handshake_timeout=handshake_timeout)
+                telemetry.SSL_HANDSHAKE.observe(time.perf_counter() - start, host=sni)
+                ssl_object = writer.get_extra_info('ssl_object')
+                fingerprint = hashlib.sha256(ssl_object.getpeercert(binary_form=True)).hexdigest()
+                return Handshake(address, _verified_chain(ssl_object), fingerprint)
+            finally:
+                writer.close()
+                try:
+                    # Bounded, since a peer that never answers close_notify would hold a handshake slot
+                    await asyncio.wait_for(writer.wait_closed(), handshake_timeout)
+                except OSError:
+                    pass
+
+def configure(max_handshakes=DEFAULT_MAX_HANDSHAKES, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+              handshake_timeout=DEFAULT_HANDSHAKE_TIMEOUT, dns_ttl_seconds=DEFAULT_DNS_TTL_SECONDS):
+    """Sets the settings used when the shared scanner is created."""
+    global _scanner
+    with _lock:
+        _scanner_settings.update(max_handshakes=max_handshakes, connect_timeout=connect_timeout,
+                                 handshake_timeout=handshake_timeout, dns_ttl_seconds=dns_ttl_seconds)
+        _scanner = None
+
+def get_scanner():
+    """Returns the process-wide `SSLScanner` shared by all SSL monitors."""
+    global _scanner
+    with _lock:
+        if _scanner is None:
+            _scanner = SSLScanner(**_scanner_settings)
+        return _scanner
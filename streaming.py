@@ -0,0 +1,212 @@
+import codecs
+import json
+import re
+
+_WHITESPACE = ' \t\n\r'
+# Characters that matter while skipping over a nested value or a string
+_NESTED_SPECIAL = re.compile(r'["\\{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[,}\]\s]')
+
+class StreamingSearch:
+    """Searches for a byte string across chunk boundaries without keeping the body."""
+    def __init__(self, needle):
+        self.needle = needle
+        self.found = not needle
+        self._tail = b""
+
+    def feed(self, chunk):
+        if self.found:
+            return
+        data = self._tail + chunk
+        if self.needle in data:
+            self.found = True
+            self._tail = b""
+        else:
+            # Keep just enough of the end to catch a match split across chunks
+            self._tail = data[-(len(self.needle) - 1):] if len(self.needle) > 1 else b""
+
+class JsonKeyExtractor:
+    """Incrementally extracts selected top-level keys from a JSON object.
+
+    Only the values of wanted keys are decoded. Every other value is skipped
+    by scanning for its end, and the bytes already scanned are dropped, so
+    memory stays bounded by the largest wanted value. `done` becomes True
+    as soon as every wanted key has been seen, so the caller can stop reading.
+    Malformed JSON raises ValueError.
+    """
+    def __init__(self, keys):
+        self.wanted = set(keys)
+        self.values = {}
+        self.done = not self.wanted
+        self.complete = False
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ""
+        self._pos = 0
+        self._state = 'start'
+        self._key = None
+        self._value_start = None
+        self._scan_pos = 0
+        self._scan_kind = None
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, chunk):
+        if self.done:
+            return
+        self._buffer += self._decoder.decode(chunk)
+        self._parse()
+        self._compact()
+
+    def close(self):
+        """Signals the end of the body. Raises ValueError if the object was cut short."""
+        if self.done:
+            return
+        self._buffer += self._decoder.decode(b"", final=True)
+        self._parse()
+        if not self.done and not self.complete:
+            raise ValueError("Incomplete JSON document")
+
+    def _compact(self):
+        if self._value_start is not None:
+            keep_from = self._value_start
+        elif self._state == 'scan':
+            keep_from = self._scan_pos
+        else:
+            keep_from = self._pos
+        if keep_from:
+            self._buffer = self._buffer[keep_from:]
+            self._pos = max(0, self._pos - keep_from)
+            self._scan_pos -= keep_from
+            if self._value_start is not None:
+                self._value_start -= keep_from
+
+    def _finish(self):
+        self.complete = True
+        self.done = True
+
+    def _parse(self):
+        buffer = self._buffer
+        while not self.done:
+            if self._state != 'scan':
+                while self._pos < len(buffer) and buffer[self._pos] in _WHITESPACE:
+                    self._pos += 1
+                if self._pos >= len(buffer):
+                    return
+                char = buffer[self._pos]
+
+            if self._state == 'start':
+                if char != '{':
+                    raise ValueError("JSON response is not an object")
+                self._pos += 1
+                self._state = 'key_or_end'
+            elif self._state in ('key_or_end', 'key'):
+                if char == '}' and self._state == 'key_or_end':
+                    self._pos += 1
+                    self._finish()
+                    return
+                if char != '"':
+                    raise ValueError(f"Expected a key at position {self._pos}")
+                end = self._find_string_end(self._pos + 1)
+                if end is None:
+                    return
+                self._key = json.loads(buffer[self._pos:end])
+                self._pos = end
+                self._state = 'colon'
+            elif self._state == 'colon':
+                if char != ':':
+                    raise ValueError(f"Expected ':' at position {self._pos}")
+                self._pos += 1
+                self._state = 'value'
+            elif self._state == 'value':
+                if self._key in self.wanted:
+                    self._value_start = self._pos
+                self._scan_pos = self._pos
+                self._scan_kind = None
+                self._state = 'scan'
+            elif self._state == 'scan':
+                end = self._scan_value()
+                if end is None:
+                    return
+                if self._value_start is not None:
+                    self.values[self._key] = json.loads(buffer[self._value_start:end])
+                    self._value_start = None
+                    if self.wanted.issubset(self.values):
+                        self.done = True
+                self._pos = end
+                self._state = 'comma_or_end'
+            elif self._state == 'comma_or_end':
+                self._pos += 1
+                if char == '}':
+                    self._finish()
+                elif char == ',':
+                    self._state = 'key'
+                else:
+                    raise ValueError(f"Expected ',' or '}}' at position {self._pos - 1}")
+
+    def _find_string_end(self, start):
+        """Returns the index just past the closing quote of a string, or None if not buffered yet."""
+        i = start
+        while True:
+            match = _STRING_SPECIAL.search(self._buffer, i)
+            if not match:
+                return None
+            if match.group() == '"':
+                return match.end()
+            if match.end() >= len(self._buffer):
+                return None
+            i = match.end() + 1 # Skip the escaped character
+
+    def _scan_value(self):
+        """Advances over the current value. Returns its end index, or None if more data is needed."""
+        buffer = self._buffer
+        if self._scan_kind is None:
+            if self._scan_pos >= len(buffer):
+                return None
+            first = buffer[self._scan_pos]
+            if first in '{[':
+                self._scan_kind, self._depth, self._in_string = 'nested', 1, False
+                self._scan_pos += 1
+            elif first == '"':
+                self._scan_kind, self._depth, self._in_string = 'string', 0, True
+                self._scan_pos += 1
+            else:
+                self._scan_kind = 'scalar'
+
+        if self._scan_kind == 'scalar':
+            # Numbers can't be terminated by the end of the buffer; wait for a delimiter
+            match = _SCALAR_END.search(buffer, self._scan_pos)
+            return match.start() if match else None
+
+        i = self._scan_pos
+        while True:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(buffer, i)
+                if not match:
+                    self._scan_pos = len(buffer)
+                    return None
+                if match.group() == '\\':
+                    if match.end() >= len(buffer):
+                        self._scan_pos = match.start()
+                        return None
+                    i = match.end() + 1
+                    continue
+                self._in_string = False
+                i = match.end()
+                if self._depth == 0:
+                    return i
+                continue
+            match = _NESTED_SPECIAL.search(buffer, i)
+            if not match:
+                self._scan_pos = len(buffer)
+                return None
+            char = match.group()
+            i = match.end()
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    return i
@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_lock = threading.Lock()
+_registry = {}
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+class Histogram:
+    """A Prometheus-style histogram with one series per label combination."""
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = []
+        for labels, (counts, total, count) in self._series.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', repr(float(bound))))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+class Gauge:
+    """A Prometheus-style gauge holding the last value set per label combination."""
+    type_name = "gauge"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+
+    def set(self, value, **labels):
+        with _lock:
+            self._series[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        return [f"{self.name}{_format_labels(labels)} {value}" for labels, value in self._series.items()]
+
+def _register(metric_class, name, *args):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = metric_class(name, *args)
+        return metric
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    """Returns the histogram registered under `name`, creating it on first use."""
+    return _register(Histogram, name, help_text, buckets)
+
+def gauge(name, help_text):
+    """Returns the gauge registered under `name`, creating it on first use."""
+    return _register(Gauge, name, help_text)
+
+@contextmanager
+def timed(metric, **labels):
+    """Observes the time spent in the `with` block on `metric`, even if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.observe(time.perf_counter() - start, **labels)
+
+def render():
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in _registry.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def write_textfile(path):
+    """Writes all metrics to `path` atomically, for node_exporter's textfile collector."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(render())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not write metrics to {path}: {e}")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_http_server(port, address=""):
+    """Serves /metrics on `port` from a background thread and returns the server."""
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="argus-metrics", daemon=True).start()
+    logging.info(f"Serving metrics on http://{address or '0.0.0.0'}:{port}/metrics")
+    return server
+
+# Metrics shared across modules
+CHECK_DURATION = histogram("argus_check_duration_seconds", "Duration of a full monitor check.")
+CHECK_LAST_DURATION = gauge("argus_check_last_duration_seconds", "Duration of the most recent check of each section.")
+CHECK_SKIPPED = gauge("argus_check_skipped", "1 while a section is skipped because a section it depends on is down.")
+RUN_DURATION = histogram("argus_run_duration_seconds", "Duration of a full engine run over a set of checks.")
+URL_DNS = histogram("argus_url_dns_seconds", "DNS resolution time for URL checks.")
+URL_CONNECT = histogram("argus_url_connect_seconds", "TCP connect time for URL checks.")
+URL_TLS = histogram("argus_url_tls_seconds", "TLS handshake time for URL checks.")
+URL_TTFB = histogram("argus_url_ttfb_seconds", "Time from sending a URL check request to its response headers.")
+SSL_HANDSHAKE = histogram("argus_ssl_handshake_seconds", "Connect and TLS handshake time for SSL checks.")
+AZURE_REQUEST = histogram("argus_azure_request_seconds", "Latency of Azure Resource Manager and Monitor calls.")
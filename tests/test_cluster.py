@@ -0,0 +1,180 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import cluster
+from cluster import HashRing, RemoteEngine, WorkerLost, _dependency_root, _RemoteWorker
+
+SECTIONS = [f"Monitors.URL.site{i}" for i in range(2000)]
+
+def owners(ring):
+    return {section: ring.node_for(section) for section in SECTIONS}
+
+def test_empty_ring_owns_nothing():
+    assert HashRing().node_for("Monitors.URL.a") is None
+    assert len(HashRing()) == 0
+
+def test_placement_only_depends_on_the_members():
+    assert owners(HashRing(['a', 'b', 'c'])) == owners(HashRing(['c', 'a', 'b']))
+
+def test_every_worker_gets_a_fair_share():
+    counts = {}
+    for owner in owners(HashRing(['a', 'b', 'c', 'd'])).values():
+        counts[owner] = counts.get(owner, 0) + 1
+    assert set(counts) == {'a', 'b', 'c', 'd'}
+    assert all(250 < count < 750 for count in counts.values())
+
+def test_joining_worker_only_takes_sections():
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    before = owners(ring)
+    ring.add('e')
+    after = owners(ring)
+    moved = [section for section in SECTIONS if before[section] != after[section]]
+    assert all(after[section] == 'e' for section in moved)
+    assert 0.1 < len(moved) / len(SECTIONS) < 0.3
+
+def test_leaving_worker_only_gives_up_its_sections():
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    before = owners(ring)
+    ring.remove('c')
+    after = owners(ring)
+    assert len(ring) == 3
+    for section in SECTIONS:
+        if before[section] == 'c':
+            assert after[section] != 'c'
+        else:
+            assert after[section] == before[section]
+
+def test_rejoining_worker_gets_its_sections_back():
+    ring = HashRing(['a', 'b', 'c'])
+    before = owners(ring)
+    ring.remove('b')
+    ring.add('b')
+    assert owners(ring) == before
+
+@pytest.mark.parametrize('section, root', [
+    ('app', 'db'),
+    ('api', 'db'),
+    ('db', 'db'),
+    ('standalone', 'standalone'),
+    ('loop-a', 'loop-b'),
+    ('self', 'self'),
+])
+def test_dependency_root(section, root):
+    depends_on = {
+        'app': ('api', 'cache'),
+        'api': ('db',),
+        'cache': ('db',),
+        'loop-a': ('loop-b',),
+        'loop-b': ('loop-a',),
+        'self': ('self',),
+    }
+    assert _dependency_root(depends_on, section) == root
+
+def test_assign_places_a_chain_by_its_root():
+    depends_on = {f"child{i}": (f"parent{i % 10}",) for i in range(200)}
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    keys = list(depends_on) + [f"parent{i}" for i in range(10)]
+    shards = ring.assign(keys, lambda key: _dependency_root(depends_on, key))
+    worker_of = {key: node for node, assigned in shards.items() for key in assigned}
+    for child, (parent,) in depends_on.items():
+        assert worker_of[child] == worker_of[parent] == ring.node_for(parent)
+    assert len(shards) > 1
+
+class FakeConnection:
+    """Stands in for a worker's connection: `reply(worker, message)` decides how the worker answers."""
+    def __init__(self, engine, reply):
+        self.engine = engine
+        self.reply = reply
+        self.sent = []
+        self.closed = False
+
+    def send(self, message):
+        self.sent.append(message)
+        self.reply(self, message)
+
+    def close(self):
+        self.closed = True
+
+def answer(conn, message):
+    results = {section: [f"{section} checked"] for section in message['sections']}
+    conn.engine._call_soon(conn.engine._resolve, conn.worker, {'type': 'results', 'id': message['id'], 'results': results})
+
+def disconnect(conn, message):
+    conn.engine._call_soon(conn.engine._drop, conn.worker)
+
+def never_answer(conn, message):
+    pass
+
+def make_engine(replies, run_deadline=None):
+    engine = RemoteEngine(('127.0.0.1', 0), b'key', min_workers=len(replies), wait_seconds=0, run_deadline=run_deadline)
+    # No real listener; workers are registered directly
+    engine._listener = SimpleNamespace(close=lambda: None)
+    connections = {}
+    for worker_id, reply in replies.items():
+        conn = FakeConnection(engine, reply)
+        conn.worker = _RemoteWorker(worker_id, conn)
+        connections[worker_id] = conn
+    return engine, connections
+
+def run(engine, connections, monitors):
+    async def main():
+        engine._loop = asyncio.get_running_loop()
+        for conn in connections.values():
+            engine._register(conn.worker)
+        return await engine.run_async(monitors)
+    return asyncio.run(main())
+
+def monitors_with_chains():
+    monitors = {}
+    for i in range(5):
+        monitors[f"Monitors.TCP.gateway{i}"] = SimpleNamespace(depends_on=())
+        for j in range(4):
+            monitors[f"Monitors.URL.app{i}-{j}"] = SimpleNamespace(depends_on=(f"Monitors.TCP.gateway{i}",))
+    for i in range(30):
+        monitors[f"Monitors.URL.site{i}"] = SimpleNamespace(depends_on=())
+    return monitors
+
+def sent_sections(conn):
+    return [section for message in conn.sent for section in message['sections']]
+
+def test_run_sends_a_parent_and_its_children_to_one_worker():
+    engine, connections = make_engine({'a': answer, 'b': answer, 'c': answer})
+    monitors = monitors_with_chains()
+    results = run(engine, connections, monitors)
+    assert results == {section: [f"{section} checked"] for section in monitors}
+    worker_of = {section: worker_id for worker_id, conn in connections.items() for section in sent_sections(conn)}
+    for i in range(5):
+        for j in range(4):
+            assert worker_of[f"Monitors.URL.app{i}-{j}"] == worker_of[f"Monitors.TCP.gateway{i}"]
+    assert sum(bool(conn.sent) for conn in connections.values()) > 1
+
+def test_lost_worker_sections_are_rebalanced():
+    engine, connections = make_engine({'a': answer, 'b': answer, 'lost': disconnect})
+    monitors = monitors_with_chains()
+    results = run(engine, connections, monitors)
+    assert results == {section: [f"{section} checked"] for section in monitors}
+    lost = sent_sections(connections['lost'])
+    assert lost and connections['lost'].closed
+    rerun = sent_sections(connections['a']) + sent_sections(connections['b'])
+    assert set(lost) <= set(rerun)
+    assert 'lost' not in engine._workers and len(engine._ring) == 2
+
+def test_sections_fail_when_every_worker_is_lost():
+    engine, connections = make_engine({'lost': disconnect})
+    results = run(engine, connections, {'Monitors.URL.a': SimpleNamespace(depends_on=())})
+    assert results == {'Monitors.URL.a': ["No cluster workers available to run Monitors.URL.a."]}
+
+def test_shard_of_a_worker_that_left_before_it_started_is_lost():
+    engine, connections = make_engine({'a': answer})
+
+    async def main():
+        engine._loop = asyncio.get_running_loop()
+        with pytest.raises(WorkerLost):
+            await engine._run_shard('gone', ['Monitors.URL.a'])
+    asyncio.run(main())
+
+def test_unresponsive_worker_fails_its_shard_after_the_deadline(monkeypatch):
+    monkeypatch.setattr(cluster, 'SHARD_GRACE_SECONDS', 0)
+    engine, connections = make_engine({'silent': never_answer}, run_deadline=0.05)
+    results = run(engine, connections, {'Monitors.URL.a': SimpleNamespace(depends_on=())})
+    assert results == {'Monitors.URL.a': ["Error running Monitors.URL.a on worker silent: no results within 0s"]}
@@ -0,0 +1,131 @@
+import json
+import re
+import pytest
+from content_checks import evaluate, find, parse_json_path
+
+DOCUMENT = {
+    "status": "ok",
+    "checks": [
+        {"name": "db", "status": "ok", "latency": 3},
+        {"name": "cache", "status": "degraded", "detail": {"status": "slow"}},
+    ],
+    "odd key": {"it's": 1},
+    "version": {"major": 2},
+}
+BODY = json.dumps(DOCUMENT).encode()
+
+@pytest.mark.parametrize('path, steps', [
+    ('$', ()),
+    ('  $.status ', (('key', 'status'),)),
+    ('$.checks[0].name', (('key', 'checks'), ('index', 0), ('key', 'name'))),
+    ('$.checks[-1]', (('key', 'checks'), ('index', -1))),
+    ('$.checks[*].status', (('key', 'checks'), ('wildcard', None), ('key', 'status'))),
+    ('$.*', (('wildcard', None),)),
+    ('$..status', (('descend', 'status'),)),
+    ('$..*', (('descend', None),)),
+    ("$['odd key']['it\\'s']", (('key', 'odd key'), ('key', "it's"))),
+    ('$["a.b"]', (('key', 'a.b'),)),
+    ('$.with-dash_1', (('key', 'with-dash_1'),)),
+])
+def test_parse_json_path(path, steps):
+    assert parse_json_path(path) == steps
+
+@pytest.mark.parametrize('path', [
+    '', 'status', '.status', '$.', '$..', '$[', '$[]', '$[1.5]', "$['open]", '$.1abc', '$.a b', '$[?(@.x)]', '$.a[0:2]',
+])
+def test_parse_json_path_rejects_unsupported_syntax(path):
+    with pytest.raises(ValueError):
+        parse_json_path(path)
+
+@pytest.mark.parametrize('path, expected', [
+    ('$', [DOCUMENT]),
+    ('$.status', ['ok']),
+    ('$.missing', []),
+    ('$.status.deeper', []),
+    ('$.checks[1].name', ['cache']),
+    ('$.checks[-2].name', ['db']),
+    ('$.checks[2]', []),
+    ('$.checks[-3]', []),
+    ('$.status[0]', []),
+    ('$.checks[*].name', ['db', 'cache']),
+    ('$.version.*', [2]),
+    ('$.status.*', []),
+    ("$['odd key']['it\\'s']", [1]),
+    ('$..status', ['ok', 'ok', 'degraded', 'slow']),
+    ('$..detail..status', ['slow']),
+    ('$..major', [2]),
+    ('$.version..*', [2]),
+])
+def test_find(path, expected):
+    assert find(DOCUMENT, parse_json_path(path)) == expected
+
+def test_find_descends_into_lists_in_document_order():
+    document = [[{"a": 1}], {"a": [{"a": 2}]}]
+    assert find(document, parse_json_path('$..a')) == [1, [{"a": 2}], 2]
+    assert find(document, parse_json_path('$[*][0]')) == [{"a": 1}]
+
+def test_evaluate_passes_when_every_check_holds():
+    assert evaluate('api', BODY, needle=b'"degraded"', regex=r'"latency":\s*\d+', json_check={"status": "ok"},
+                    json_path={"$.checks[0].status": "ok", "$.version.major": 2}) == []
+
+def test_evaluate_reports_missing_string_and_pattern():
+    alerts = evaluate('api', BODY, needle=b'healthy', regex=r'uptime=\d+')
+    assert alerts == [
+        "URL 'api' is up, but the expected string was not found.",
+        "URL 'api' is up, but no match for the pattern /uptime=\\d+/ was found.",
+    ]
+
+def test_evaluate_mentions_truncation():
+    alerts = evaluate('api', BODY[:20], needle=b'cache', regex='cache', truncated=True, max_body_bytes=20)
+    assert alerts == [
+        "URL 'api' is up, but the expected string was not found in the first 20 bytes.",
+        "URL 'api' is up, but no match for the pattern /cache/ was found in the first 20 bytes.",
+    ]
+
+def test_evaluate_regex_uses_the_response_encoding():
+    body = "température: 21°".encode('latin-1')
+    assert evaluate('api', body, encoding='latin-1', regex='température: \\d+°') == []
+    # Undecodable bytes are replaced, not raised
+    assert evaluate('api', body, regex='temp') == []
+
+def test_evaluate_invalid_pattern_raises():
+    # URL monitors reject these when the config is loaded (see test_url_monitor_rejects_invalid_options)
+    with pytest.raises(re.error):
+        evaluate('api', BODY, regex='status(')
+
+def test_evaluate_reports_invalid_and_truncated_json():
+    assert evaluate('api', b'<html>', json_check={"status": "ok"}) == ["URL 'api' is up, but response is not valid JSON."]
+    assert evaluate('api', BODY[:30], json_path={"$.status": "ok"}, truncated=True, max_body_bytes=30) == [
+        "URL 'api' response exceeded 30 bytes before it could be parsed as JSON."
+    ]
+
+def test_evaluate_json_check_compares_top_level_keys():
+    alerts = evaluate('api', BODY, json_check={"status": "down", "missing": 1})
+    assert alerts == [
+        "'status' does not match expected value. Expected: down, Got: ok",
+        "'missing' does not match expected value. Expected: 1, Got: None",
+    ]
+    # A document that isn't an object has no top-level keys
+    assert evaluate('api', b'[1]', json_check={"status": "ok"}) == [
+        "'status' does not match expected value. Expected: ok, Got: None"
+    ]
+
+def test_evaluate_json_path_requires_every_match_to_equal_the_expected_value():
+    alerts = evaluate('api', BODY, json_path={"$.checks[*].status": "ok", "$.nope": 1, "$.status": "ok"})
+    assert alerts == [
+        "'$.checks[*].status' does not match expected value. Expected: ok, Got: ['ok', 'degraded']",
+        "URL 'api' is up, but '$.nope' matched nothing in the response.",
+    ]
+    assert evaluate('api', BODY, json_path={"$.checks[1].status": "ok"}) == [
+        "'$.checks[1].status' does not match expected value. Expected: ok, Got: degraded"
+    ]
+
+def test_url_monitor_rejects_invalid_options():
+    from monitors import url_monitor
+    assert url_monitor._regex(r'ok\d') == r'ok\d'
+    with pytest.raises(ValueError):
+        url_monitor._regex('status(')
+    assert url_monitor._json_paths('{"$.a[0]": 1}') == {"$.a[0]": 1}
+    for value in ('{"a": 1}', '["$.a"]', '{"$.a[": 1}', 'not json'):
+        with pytest.raises(ValueError):
+            url_monitor._json_paths(value)
@@ -0,0 +1,156 @@
+import json
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+import pytest
+import history
+from history import MetricHistory, Series, consecutive_at_or_above, seconds_until
+
+VM = "/subscriptions/S/resourceGroups/RG/providers/Microsoft.Compute/virtualMachines/VM1"
+
+def series(points):
+    s = Series()
+    s.append(points)
+    return s
+
+def test_append_keeps_time_order_and_replaces_the_open_grain():
+    s = Series()
+    assert s.append([(60, 1.0), (120, 2.0), (120, None), (180, None)])
+    assert not s.append([(60, 5.0), (120, 2.0)])
+    assert s.append([(120, 2.5), (180, 3.0)])
+    assert list(s.timestamps) == [60, 120, 180]
+    assert list(s.values) == [1.0, 2.5, 3.0]
+
+def test_since():
+    s = series([(t, t / 60) for t in range(0, 600, 60)])
+    timestamps, values = s.since(300)
+    assert list(timestamps) == [300, 360, 420, 480, 540]
+    assert list(values) == [5, 6, 7, 8, 9]
+    assert list(s.since(1000)[0]) == []
+
+def test_compact_drops_old_points_and_averages_per_bucket():
+    # One point a minute for 5 hours
+    s = series([(t, float(t // 60)) for t in range(0, 5 * 3600, 60)])
+    s.compact(retain_from=3600, downsample_before=3 * 3600, bucket_seconds=3600)
+    # Hours 1 and 2 become one point each at the start of the hour, hours 3 and 4 stay raw
+    assert list(s.timestamps[:2]) == [3600, 7200]
+    assert list(s.values[:2]) == [sum(range(60, 120)) / 60, sum(range(120, 180)) / 60]
+    assert list(s.timestamps[2:]) == list(range(3 * 3600, 5 * 3600, 60))
+    assert list(s.values[2:]) == [float(t // 60) for t in range(3 * 3600, 5 * 3600, 60)]
+
+def test_compact_is_idempotent():
+    s = series([(t, float(t % 7)) for t in range(0, 4 * 3600, 60)])
+    s.compact(0, 2 * 3600, 3600)
+    once = (list(s.timestamps), list(s.values))
+    s.compact(0, 2 * 3600, 3600)
+    assert (list(s.timestamps), list(s.values)) == once
+
+def test_compact_with_retention_past_the_downsample_point_only_drops():
+    s = series([(t, 1.0) for t in range(0, 3600, 60)])
+    s.compact(retain_from=1800, downsample_before=600, bucket_seconds=3600)
+    assert list(s.timestamps) == list(range(1800, 3600, 60))
+
+@pytest.mark.parametrize('values, threshold, count, expected', [
+    ([50, 95, 96, 97], 95, 3, True),
+    ([50, 95, 94.9, 97], 95, 3, False),
+    ([96, 97], 95, 3, False),
+    ([96, 97], 95, 0, False),
+    ([], 95, 1, False),
+    (array('d', [99, 10, 99]), 95, 1, True),
+])
+def test_consecutive_at_or_above(values, threshold, count, expected):
+    assert consecutive_at_or_above(values, threshold, count) is expected
+
+def test_seconds_until_extrapolates_a_linear_trend():
+    # 1% a day from 80%, sampled hourly for two days
+    start = 1.7e9
+    timestamps = [start + h * 3600 for h in range(49)]
+    values = [80 + h / 24 for h in range(49)]
+    assert seconds_until(timestamps, values, 90) == pytest.approx(8 * 86400)
+
+def test_seconds_until_is_zero_once_the_fit_has_reached_the_target():
+    assert seconds_until([0, 60, 120], [88, 92, 96], 90) == 0
+
+@pytest.mark.parametrize('timestamps, values', [
+    ([0, 60], [1, 2]),  # too few samples
+    ([60, 60, 60], [1, 2, 3]),  # no time span
+    ([0, 60, 120], [5, 5, 5]),  # flat
+    ([0, 60, 120], [9, 8, 7]),  # moving away
+])
+def test_seconds_until_without_a_usable_trend(timestamps, values):
+    assert seconds_until(timestamps, values, 10) is None
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    now = time.time()
+    store = MetricHistory(path)
+    points = [(now - 600 + i * 60, 10.0 + i) for i in range(10)]
+    store.append(VM, 'Percentage CPU', [(datetime.fromtimestamp(t, timezone.utc), v) for t, v in points])
+    store.append(VM.upper(), 'Available Memory Bytes', [(now - 60, 2.5e9)])
+    store.save()
+
+    loaded = MetricHistory(path)
+    timestamps, values = loaded.window(VM, 'Percentage CPU', 3600, now=now)
+    assert list(zip(timestamps, values)) == points
+    assert loaded.latest(VM, 'Available Memory Bytes', 300, now=now) == 2.5e9
+    assert loaded.latest(VM, 'Available Memory Bytes', 30, now=now) is None
+    assert loaded.last_timestamp(VM, ['Percentage CPU', 'Available Memory Bytes']) == points[-1][0]
+    assert loaded.last_timestamp(VM, ['Percentage CPU', 'Disk Read Bytes']) is None
+
+def test_save_skips_unchanged_history(tmp_path):
+    path = tmp_path / 'history.bin'
+    store = MetricHistory(str(path))
+    store.append(VM, 'Percentage CPU', [(time.time(), 1.0)])
+    store.save()
+    path.write_bytes(b'sentinel')
+    store.save()
+    assert path.read_bytes() == b'sentinel'
+
+def test_load_swaps_foreign_byte_order(tmp_path):
+    path = tmp_path / 'history.bin'
+    timestamps, values = array('d', [1.7e9, 1.7e9 + 60]), array('d', [1.5, 2.5])
+    index = {'version': history.FORMAT_VERSION, 'byteorder': 'big' if sys.byteorder == 'little' else 'little',
+             'compacted_at': 0.0, 'series': [[f"{VM.lower()}|Percentage CPU", 2]]}
+    timestamps.byteswap()
+    values.byteswap()
+    path.write_bytes(json.dumps(index).encode() + b"\n" + timestamps.tobytes() + values.tobytes())
+    loaded = MetricHistory(str(path))
+    assert list(zip(*loaded.window(VM, 'Percentage CPU', 120, now=1.7e9 + 60))) == [(1.7e9, 1.5), (1.7e9 + 60, 2.5)]
+
+@pytest.mark.parametrize('content', [
+    b'{"version": 999, "series": []}\n',
+    b'not json\n',
+    b'{"version": 1, "series": [["a|b", 10]]}\n' + b'\0' * 24,  # truncated arrays
+])
+def test_unusable_files_start_an_empty_history(tmp_path, content):
+    path = tmp_path / 'history.bin'
+    path.write_bytes(content)
+    assert MetricHistory(str(path))._series == {}
+
+def test_compact_on_save_downsamples_old_points_and_drops_expired_series(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    now = time.time()
+    store = MetricHistory(path, retention_days=1, raw_hours=1, downsample_minutes=60)
+    store.append(VM, 'expired', [(now - 2 * 86400, 1.0)])
+    store.append(VM, 'cpu', [(t, 1.0) for t in range(int(now - 6 * 3600), int(now), 60)])
+    store.save()
+
+    loaded = MetricHistory(path, retention_days=1, raw_hours=1, downsample_minutes=60)
+    assert loaded.window(VM, 'expired', 3 * 86400, now=now) == (array('d'), array('d'))
+    timestamps, _ = loaded.window(VM, 'cpu', 86400, now=now)
+    raw_from = (now - 3600) // 3600 * 3600
+    old = [t for t in timestamps if t < raw_from]
+    assert old and all(t % 3600 == 0 for t in old)
+    assert len(old) == len(set(old))
+    assert all(t >= raw_from for t in timestamps[len(old):])
+
+def test_query_start_resumes_from_the_last_stored_grain(tmp_path):
+    now = 1.7e9
+    store = MetricHistory(str(tmp_path / 'history.bin'))
+    window, minimum = timedelta(hours=2), timedelta(minutes=5)
+    assert store.query_start(VM, ['cpu'], window, minimum, now=now).timestamp() == now - 7200
+    store.append(VM, 'cpu', [(now - 1800, 1.0)])
+    assert store.query_start(VM, ['cpu'], window, minimum, now=now).timestamp() == now - 1800
+    store.append(VM, 'cpu', [(now - 60, 1.0)])
+    assert store.query_start(VM, ['cpu'], window, minimum, now=now).timestamp() == now - 300
@@ -0,0 +1,99 @@
+import json
+import pytest
+from streaming import JsonKeyExtractor, StreamingSearch
+
+def splits(data):
+    """Yields `data` cut into two chunks at every position, then one byte at a time."""
+    for i in range(len(data) + 1):
+        yield [data[:i], data[i:]]
+    yield [data[i:i + 1] for i in range(len(data))]
+
+def extract(keys, chunks):
+    extractor = JsonKeyExtractor(keys)
+    for chunk in chunks:
+        extractor.feed(chunk)
+    extractor.close()
+    return extractor
+
+DOCUMENT = {
+    "skip": {"nested": [1, {"deep": "}]\"{["}], "s": "\\"},
+    "quote": "say \"hi\" \\ / \b\f\n\r\t",
+    "unicode": "café ☃ \U0001F600",
+    "escaped \"key\"": -12.5e3,
+    "list": [1, "two", [3], {"four": None}],
+    "flag": True,
+    "nothing": None,
+    "last": 0,
+}
+
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+@pytest.mark.parametrize('key', list(DOCUMENT))
+def test_extracts_every_kind_of_value_at_every_boundary(key, ensure_ascii):
+    data = json.dumps(DOCUMENT, ensure_ascii=ensure_ascii, indent=1).encode()
+    for chunks in splits(data):
+        extractor = extract([key], chunks)
+        assert extractor.values == {key: DOCUMENT[key]}
+        assert extractor.done
+
+def test_extracts_several_keys_and_stops_early():
+    data = json.dumps(DOCUMENT).encode()
+    for chunks in splits(data):
+        extractor = JsonKeyExtractor(['quote', 'unicode'])
+        for chunk in chunks:
+            extractor.feed(chunk)
+        assert extractor.values == {'quote': DOCUMENT['quote'], 'unicode': DOCUMENT['unicode']}
+        assert extractor.done and not extractor.complete
+
+def test_missing_key_completes_without_value():
+    data = json.dumps(DOCUMENT).encode()
+    for chunks in splits(data):
+        extractor = extract(['absent', 'flag'], chunks)
+        assert extractor.values == {'flag': True}
+        assert extractor.complete
+
+def test_escapes_json_dumps_never_writes():
+    data = b'{"path": "a\\/b", "face": "\\ud83d\\ude00\\u00e9"}'
+    for chunks in splits(data):
+        assert extract(['path', 'face'], chunks).values == {'path': 'a/b', 'face': '\U0001F600\u00e9'}
+
+def test_only_top_level_keys_are_matched():
+    data = b'{"outer": {"last": 1}, "other": "last"}'
+    for chunks in splits(data):
+        assert extract(['last'], chunks).values == {}
+
+def test_empty_object():
+    for chunks in splits(b' { } '):
+        extractor = extract(['a'], chunks)
+        assert extractor.complete and extractor.values == {}
+
+@pytest.mark.parametrize('cut', [1, 10, 25, 40, -2, -1])
+def test_truncated_document_raises(cut):
+    data = json.dumps(DOCUMENT).encode()[:cut]
+    for chunks in splits(data):
+        with pytest.raises(ValueError):
+            extract(['absent'], chunks)
+
+@pytest.mark.parametrize('data', [b'[1, 2]', b'"text"', b'{"a" 1}', b'{"a": 1 "b": 2}', b'{a: 1}'])
+def test_malformed_document_raises(data):
+    for chunks in splits(data):
+        with pytest.raises(ValueError):
+            extract(['b'], chunks)
+
+def test_search_finds_needle_split_at_every_boundary():
+    data = b"<html>... status: \xe2\x9c\x93 healthy ...</html>"
+    needle = "✓ healthy".encode()
+    for chunks in splits(data):
+        search = StreamingSearch(needle)
+        for chunk in chunks:
+            search.feed(chunk)
+        assert search.found
+
+def test_search_reports_missing_needle():
+    for chunks in splits(b"status: unhealthy, healthz"):
+        search = StreamingSearch(b"healthy!")
+        for chunk in chunks:
+            search.feed(chunk)
+        assert not search.found
+
+def test_search_for_empty_needle_is_found():
+    assert StreamingSearch(b"").found
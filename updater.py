@@ -1,17 +1,57 @@
-import requests
+import json
+import os
+import threading
+import time
 from version import __version__
-from packaging.version import parse as parse_version
 
 # The GitHub repository for the tool
 GITHUB_REPO = "AshutoshPatole18/Argus"
+# How long a looked-up release stays valid before GitHub is asked again
+CHECK_INTERVAL_SECONDS = 24 * 3600
+# How long a one-shot run waits for an unfinished update check before exiting
+FINISH_TIMEOUT_SECONDS = 2
 
-def check_for_updates():
-    """Checks for a new version of the tool on GitHub."""
+def _read_cache(cache_path):
+    """Returns the latest release tag from a cache entry less than a day old, or None."""
+    if not cache_path:
+        return None
     try:
-        api_url = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
-        response = requests.get(api_url, timeout=5)
-        response.raise_for_status()
-        latest_version = parse_version(response.json()["tag_name"].lstrip('v'))
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if time.time() - cached['checked_at'] < CHECK_INTERVAL_SECONDS:
+            return cached['latest']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+def _write_cache(cache_path, latest):
+    if not cache_path:
+        return
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({'checked_at': time.time(), 'latest': latest}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+def _fetch_latest():
+    # Imported here so the update check doesn't add to startup time
+    import requests
+    api_url = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
+    response = requests.get(api_url, timeout=5)
+    response.raise_for_status()
+    return response.json()["tag_name"]
+
+def check_for_updates(cache_path=None):
+    """Checks for a new version of the tool on GitHub, at most once a day when `cache_path` is given."""
+    try:
+        from packaging.version import parse as parse_version
+        latest = _read_cache(cache_path)
+        if latest is None:
+            latest = _fetch_latest()
+            _write_cache(cache_path, latest)
+        latest_version = parse_version(latest.lstrip('v'))
         current_version = parse_version(__version__)
 
         if latest_version > current_version:
@@ -22,11 +62,18 @@ def check_for_updates():
             print(f"  https://github.com/{GITHUB_REPO}/releases/latest")
             print("="*50 + "\n")
 
-    except requests.exceptions.RequestException as e:
+    except Exception as e:
         # It's okay if this fails, we don't want to block the user
         # print(f"\n[INFO] Could not check for updates: {e}")
         pass
-    except Exception as e:
-        # print(f"\n[INFO] An unexpected error occurred while checking for updates: {e}")
-        pass
 
+def start_update_check(cache_path=None):
+    """Runs `check_for_updates` in a background thread so it never delays the checks."""
+    thread = threading.Thread(target=check_for_updates, args=(cache_path,), name="argus-update-check", daemon=True)
+    thread.start()
+    return thread
+
+def finish_update_check(thread, timeout=FINISH_TIMEOUT_SECONDS):
+    """Gives a running update check up to `timeout` seconds to print its notice and save its result."""
+    if thread is not None:
+        thread.join(timeout)
@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import threading
+import time
+
+class UrlCache:
+    """Persistent cache of URL validators and check verdicts, keyed by monitor and URL.
+
+    Each entry holds the response's ETag and Last-Modified, a digest of the
+    body that was checked and the alerts the body check produced. URL
+    monitors with `conditional` enabled send the validators back, and on a
+    304 Not Modified reuse the stored verdict instead of downloading and
+    parsing the body again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable URL cache {self.path}: {e}")
+            return {}
+
+    @staticmethod
+    def _key(name, url):
+        return f"{name}|{url}"
+
+    def get(self, name, url, signature):
+        """Returns the entry for a monitor, or None if there is none or it was made with other check settings."""
+        with self._lock:
+            entry = self._entries.get(self._key(name, url))
+        if not entry or entry.get('signature') != signature:
+            return None
+        return entry
+
+    def put(self, name, url, signature, etag, last_modified, digest, alerts):
+        """Records the validators and verdict of a freshly checked response."""
+        entry = {
+            'signature': signature,
+            'etag': etag,
+            'last_modified': last_modified,
+            'digest': digest,
+            'alerts': list(alerts),
+            'checked_at': time.time(),
+        }
+        with self._lock:
+            self._entries[self._key(name, url)] = entry
+            self._dirty = True
+
+    def discard(self, name, url):
+        """Forgets a monitor's entry, e.g. when the server stopped sending validators."""
+        with self._lock:
+            if self._entries.pop(self._key(name, url), None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """Writes the cache to disk if it changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._entries)
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save URL cache to {self.path}: {e}")